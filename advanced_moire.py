@@ -1,10 +1,27 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, simpledialog
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
 from matplotlib.animation import FuncAnimation
 
+import moire_cache
+import moire_engine
+import moire_io
+import moire_presets
+
+# このアプリで選択できるパターンタイプ
+ADVANCED_PATTERN_TYPES = ["linear", "circular", "radial", "spiral"]
+
+# 計算グリッドの解像度
+PATTERN_SIZE = 300
+
+# 中心ドラッグ用に広げて計算する余白（上下左右、グリッドの半分 = 範囲2倍）
+CENTER_MARGIN = PATTERN_SIZE // 2
+
+# プリセットのボタンを折り返す列数
+PRESET_COLUMNS = 3
+
 class AdvancedMoireApp:
     def __init__(self, root):
         self.root = root
@@ -28,8 +45,31 @@ class AdvancedMoireApp:
         self.center_y = 0.0
         self.radius = 3.0
         
+        # 中心ドラッグ用の拡張済みパターン（中心以外のパラメータが同じ間は切り出すだけ）
+        self.center_field = None
+        self.last_pattern_key = None
+        self.last_center = None
+        
+        # 表示中の画像（中身だけを差し替えて再描画を軽くする）
+        self.image = None
+        self.image_type = None
+        
+        # プリセット（サムネイルはバックグラウンドで描画し、操作が止まったら
+        # 各プリセットの最初のフレームをフレームキャッシュへ先に計算しておく）
+        self.presets = moire_presets.presets_for(moire_presets.load_library(),
+                                                 ADVANCED_PATTERN_TYPES)
+        self.thumbnails = moire_presets.ThumbnailRenderer(self.presets)
+        self.preset_buttons = {}
+        self.preset_images = {}
+        self.frame_cache = moire_cache.FrameCache()
+        self.prewarm = moire_presets.BackgroundRenderer()
+        self.prewarm_job = None
+        self.prewarm_poll_job = None
+        
         self.setup_ui()
         self.create_moire_pattern()
+        self.root.after(100, self.poll_thumbnails)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def setup_ui(self):
         # メインフレーム
@@ -44,7 +84,7 @@ class AdvancedMoireApp:
         ttk.Label(control_frame, text="パターンタイプ:").pack(anchor=tk.W)
         self.pattern_var = tk.StringVar(value=self.pattern_type)
         pattern_combo = ttk.Combobox(control_frame, textvariable=self.pattern_var, 
-                                    values=["linear", "circular", "radial", "spiral"])
+                                    values=ADVANCED_PATTERN_TYPES)
         pattern_combo.pack(fill=tk.X, pady=(0, 10))
         pattern_combo.bind('<<ComboboxSelected>>', self.update_pattern)
         
@@ -122,8 +162,13 @@ class AdvancedMoireApp:
         self.play_button.pack(side=tk.LEFT, padx=(0, 5))
         
         ttk.Button(button_frame, text="リセット", command=self.reset_parameters).pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(button_frame, text="プリセット1", command=self.preset1).pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(button_frame, text="プリセット2", command=self.preset2).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="プリセット保存", command=self.save_preset).pack(side=tk.LEFT)
+        
+        # プリセット（サムネイルが届いたらボタンに表示する）
+        self.preset_frame = ttk.LabelFrame(control_frame, text="プリセット", padding=5)
+        self.preset_frame.pack(fill=tk.X, pady=(0, 10))
+        for preset in self.presets:
+            self.add_preset_button(preset)
         
         # 右側の表示エリア
         display_frame = ttk.LabelFrame(main_frame, text="モアレパターン", padding=10)
@@ -138,96 +183,87 @@ class AdvancedMoireApp:
         self.info_label = ttk.Label(control_frame, text="", font=("Arial", 8))
         self.info_label.pack(pady=10)
     
-    def create_linear_pattern(self, X, Y):
-        # 線形パターン
-        angle1_rad = np.radians(self.angle1_var.get())
-        angle2_rad = np.radians(self.angle2_var.get())
-        
-        rotated_x1 = X * np.cos(angle1_rad) + Y * np.sin(angle1_rad)
-        rotated_x2 = X * np.cos(angle2_rad) + Y * np.sin(angle2_rad)
-        
-        pattern1 = np.sin(2 * np.pi * self.freq1_var.get() * rotated_x1 + self.phase1_var.get())
-        pattern2 = np.sin(2 * np.pi * self.freq2_var.get() * rotated_x2 + self.phase2_var.get())
-        
-        return pattern1, pattern2
+    def get_params(self):
+        """エンジン用のパラメータ辞書を作成"""
+        return moire_engine.make_params(
+            freq1=self.freq1_var.get(), freq2=self.freq2_var.get(),
+            angle1=self.angle1_var.get(), angle2=self.angle2_var.get(),
+            phase1=self.phase1_var.get(), phase2=self.phase2_var.get(),
+            center_x=self.center_x_var.get(), center_y=self.center_y_var.get(),
+            radius=self.radius_var.get())
     
-    def create_circular_pattern(self, X, Y):
-        # 円形パターン
-        center_x = self.center_x_var.get()
-        center_y = self.center_y_var.get()
-        
-        # 中心からの距離
-        r1 = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
-        r2 = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
-        
-        pattern1 = np.sin(2 * np.pi * self.freq1_var.get() * r1 + self.phase1_var.get())
-        pattern2 = np.sin(2 * np.pi * self.freq2_var.get() * r2 + self.phase2_var.get())
-        
-        return pattern1, pattern2
-    
-    def create_radial_pattern(self, X, Y):
-        # ラジアルパターン
-        center_x = self.center_x_var.get()
-        center_y = self.center_y_var.get()
-        
-        # 角度
-        theta1 = np.arctan2(Y - center_y, X - center_x) + np.radians(self.angle1_var.get())
-        theta2 = np.arctan2(Y - center_y, X - center_x) + np.radians(self.angle2_var.get())
-        
-        pattern1 = np.sin(2 * np.pi * self.freq1_var.get() * theta1 + self.phase1_var.get())
-        pattern2 = np.sin(2 * np.pi * self.freq2_var.get() * theta2 + self.phase2_var.get())
-        
-        return pattern1, pattern2
-    
-    def create_spiral_pattern(self, X, Y):
-        # スパイラルパターン
-        center_x = self.center_x_var.get()
-        center_y = self.center_y_var.get()
-        radius = self.radius_var.get()
-        
-        # 中心からの距離と角度
-        r = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
-        theta = np.arctan2(Y - center_y, X - center_x)
-        
-        # スパイラルパラメータ
-        spiral1 = r + self.freq1_var.get() * theta + self.phase1_var.get()
-        spiral2 = r + self.freq2_var.get() * theta + self.phase2_var.get()
-        
-        pattern1 = np.sin(2 * np.pi * spiral1)
-        pattern2 = np.sin(2 * np.pi * spiral2)
-        
-        return pattern1, pattern2
+    def calculate_pattern(self, engine_type, params):
+        """パターンを計算（中心だけを動かしている間は拡張済みの場から切り出す）
+
+        params の中心は snap_center でピクセル格子に丸めておくこと（切り出しと通常の計算で
+        中心の位置が一致し、ドラッグの終わりに中心が跳ばない）。
+        """
+        if engine_type not in moire_engine.CENTERED_PATTERNS:
+            self.last_pattern_key = None
+            return moire_engine.calculate_pattern(engine_type, PATTERN_SIZE, PATTERN_SIZE, params)
+        
+        key = (engine_type, tuple((name, value) for name, value in params.items()
+                                  if name not in ("center_x", "center_y")))
+        center = moire_engine.center_pixels(engine_type, PATTERN_SIZE, PATTERN_SIZE,
+                                            params["center_x"], params["center_y"])
+        
+        # 前回と中心以外が同じで中心だけが動いたらドラッグ中とみなし、広げた場を用意する
+        field = self.center_field
+        dragging = key == self.last_pattern_key and center != self.last_center
+        if dragging and (field is None or field["key"] != key):
+            field = self.center_field = {
+                "key": key,
+                "base": center,
+                "data": moire_engine.calculate_center_field(engine_type, PATTERN_SIZE, PATTERN_SIZE,
+                                                            params, CENTER_MARGIN),
+            }
+        self.last_pattern_key = key
+        self.last_center = center
+        
+        if field is not None and field["key"] == key:
+            view = moire_engine.slice_center_field(field["data"], CENTER_MARGIN, field["base"],
+                                                   center, PATTERN_SIZE, PATTERN_SIZE)
+            if view is not None:
+                return view
+            # 余白の外に出たら現在の中心で計算し直す
+            field["base"] = center
+            field["data"] = moire_engine.calculate_center_field(engine_type, PATTERN_SIZE, PATTERN_SIZE,
+                                                                params, CENTER_MARGIN)
+            return moire_engine.slice_center_field(field["data"], CENTER_MARGIN, center, center,
+                                                   PATTERN_SIZE, PATTERN_SIZE)
+        return moire_engine.calculate_pattern(engine_type, PATTERN_SIZE, PATTERN_SIZE, params)
     
     def create_moire_pattern(self):
-        # グリッド作成
-        x = np.linspace(-5, 5, 300)
-        y = np.linspace(-5, 5, 300)
-        X, Y = np.meshgrid(x, y)
-        
-        # パターンタイプに応じてパターン生成
+        # パターンタイプに応じてパターン生成（中心が原点なら対称性を利用）
         pattern_type = self.pattern_var.get()
+        engine_type = pattern_type if pattern_type in ADVANCED_PATTERN_TYPES else "linear"
+        params = moire_engine.snap_center(engine_type, PATTERN_SIZE, PATTERN_SIZE, self.get_params())
         
-        if pattern_type == "linear":
-            pattern1, pattern2 = self.create_linear_pattern(X, Y)
-        elif pattern_type == "circular":
-            pattern1, pattern2 = self.create_circular_pattern(X, Y)
-        elif pattern_type == "radial":
-            pattern1, pattern2 = self.create_radial_pattern(X, Y)
-        elif pattern_type == "spiral":
-            pattern1, pattern2 = self.create_spiral_pattern(X, Y)
+        # モアレパターン（積）。先に計算済みのプリセットならキャッシュの8bitから戻す
+        gray = self.frame_cache.get(self.frame_key(engine_type, params))
+        if gray is not None:
+            moire_pattern = (gray + 0.5) / 127.5 - 1
         else:
-            pattern1, pattern2 = self.create_linear_pattern(X, Y)
+            moire_pattern = self.calculate_pattern(engine_type, params)
         
-        # モアレパターン（積）
-        moire_pattern = pattern1 * pattern2
+        # 操作が止まったらプリセットの最初のフレームを計算しておく
+        self.schedule_prewarm()
+        
+        # プロット（同じタイプの間は画像の中身だけを差し替える）
+        if self.image is not None and self.image_type == pattern_type:
+            self.image.set_data(moire_pattern)
+            self.canvas.draw_idle()
+            self.update_info()
+            return
         
-        # プロット
         self.ax.clear()
         im = self.ax.imshow(moire_pattern, cmap='viridis', extent=[-5, 5, -5, 5], 
                            aspect='equal', vmin=-1, vmax=1)
         self.ax.set_title(f'Dynamic Moire Pattern - {pattern_type}')
         self.ax.set_xlabel('X')
         self.ax.set_ylabel('Y')
+        self.image = im
+        self.image_type = pattern_type
         
         # カラーバー（安全な方法）
         try:
@@ -290,48 +326,125 @@ class AdvancedMoireApp:
             self.start_animation()
     
     def reset_parameters(self):
-        self.pattern_var.set("linear")
-        self.freq1_var.set(8.0)
-        self.freq2_var.set(9.0)
-        self.angle1_var.set(0.0)
-        self.angle2_var.set(45.0)
-        self.phase1_var.set(0.0)
-        self.phase2_var.set(0.0)
-        self.center_x_var.set(0.0)
-        self.center_y_var.set(0.0)
-        self.radius_var.set(3.0)
-        self.speed_var.set(0.05)
-        self.create_moire_pattern()
+        self.apply_preset(self.find_preset("Linear"))
     
     def preset1(self):
         # 円形モアレのプリセット
-        self.pattern_var.set("circular")
-        self.freq1_var.set(5.0)
-        self.freq2_var.set(6.0)
-        self.angle1_var.set(0.0)
-        self.angle2_var.set(0.0)
-        self.phase1_var.set(0.0)
-        self.phase2_var.set(0.0)
-        self.center_x_var.set(0.0)
-        self.center_y_var.set(0.0)
-        self.radius_var.set(3.0)
-        self.speed_var.set(0.03)
-        self.create_moire_pattern()
+        self.apply_preset(self.find_preset("Circular"))
     
     def preset2(self):
         # スパイラルモアレのプリセット
-        self.pattern_var.set("spiral")
-        self.freq1_var.set(2.0)
-        self.freq2_var.set(2.5)
-        self.angle1_var.set(0.0)
-        self.angle2_var.set(0.0)
-        self.phase1_var.set(0.0)
-        self.phase2_var.set(0.0)
-        self.center_x_var.set(0.0)
-        self.center_y_var.set(0.0)
-        self.radius_var.set(2.0)
-        self.speed_var.set(0.02)
+        self.apply_preset(self.find_preset("Spiral"))
+    
+    def find_preset(self, name):
+        """名前のプリセット（ライブラリから消されていれば既定値の linear）"""
+        for preset in self.presets:
+            if preset["name"] == name:
+                return preset
+        return moire_presets.make_preset(name, "linear", {}, speed=0.05)
+    
+    def apply_preset(self, preset):
+        """プリセットのパラメータを設定して表示（計算済みならキャッシュから表示される）"""
+        params = moire_presets.preset_params(preset)
+        self.pattern_var.set(preset["pattern_type"])
+        for name in ("freq1", "freq2", "angle1", "angle2", "phase1", "phase2",
+                     "center_x", "center_y", "radius"):
+            getattr(self, f"{name}_var").set(params[name])
+        if "speed" in preset:
+            self.speed_var.set(preset["speed"])
+            self.update_speed()
         self.create_moire_pattern()
+    
+    def add_preset_button(self, preset):
+        """プリセットのボタンを追加（サムネイルは届いてから付ける）"""
+        index = len(self.preset_buttons)
+        button = ttk.Button(self.preset_frame, text=preset["name"], compound=tk.TOP,
+                            command=lambda: self.apply_preset(preset))
+        button.grid(row=index // PRESET_COLUMNS, column=index % PRESET_COLUMNS, padx=2, pady=2)
+        self.preset_buttons[preset["name"]] = button
+    
+    def set_preset_image(self, name, gray):
+        """プリセットのボタンにサムネイルを付ける（PGM のバイト列から PhotoImage を作る）"""
+        button = self.preset_buttons.get(name)
+        if button is None:
+            return
+        height, width = gray.shape
+        image = tk.PhotoImage(data=moire_io.pgm_header(width, height) + gray.tobytes())
+        # PhotoImage は参照がなくなると消えるので保持しておく
+        self.preset_images[name] = image
+        button.config(image=image)
+    
+    def poll_thumbnails(self):
+        """バックグラウンドで描画が終わったサムネイルをボタンに付ける"""
+        for name, gray in self.thumbnails.poll():
+            self.set_preset_image(name, gray)
+        if not self.thumbnails.idle():
+            self.root.after(100, self.poll_thumbnails)
+    
+    def save_preset(self):
+        """表示中のパラメータをユーザーのプリセットとして保存"""
+        name = simpledialog.askstring("プリセット保存", "プリセット名:", parent=self.root)
+        if not name:
+            return
+        preset = moire_presets.make_preset(name, self.pattern_var.get(), self.get_params(),
+                                           speed=self.animation_speed)
+        try:
+            moire_presets.save_user_preset(preset)
+        except (OSError, ValueError) as e:
+            print(f"Could not save preset: {e}")
+            return
+        names = [old["name"] for old in self.presets]
+        if name in names:
+            self.presets[names.index(name)] = preset
+        else:
+            self.presets.append(preset)
+            self.add_preset_button(preset)
+        # 1枚だけなのでサムネイルはその場で描画する
+        size = moire_presets.THUMBNAIL_SIZE
+        self.set_preset_image(name, moire_engine.render(preset["pattern_type"], size, size,
+                                                        moire_presets.preset_params(preset)))
+    
+    def frame_key(self, engine_type, params):
+        return moire_cache.frame_key(engine_type, PATTERN_SIZE, PATTERN_SIZE, params)
+    
+    def schedule_prewarm(self):
+        """操作のたびに呼び、止まってから PREWARM_IDLE_MS 後にプリセットの計算を始める"""
+        if self.prewarm_job is not None:
+            self.root.after_cancel(self.prewarm_job)
+        self.prewarm.clear()
+        self.prewarm_job = self.root.after(moire_presets.PREWARM_IDLE_MS, self.start_prewarm)
+    
+    def start_prewarm(self):
+        """まだキャッシュにないプリセットの最初のフレームをバックグラウンドで計算する"""
+        self.prewarm_job = None
+        if self.animation_running:
+            return
+        for preset in self.presets:
+            params = moire_engine.snap_center(preset["pattern_type"], PATTERN_SIZE, PATTERN_SIZE,
+                                              moire_presets.preset_params(preset))
+            key = self.frame_key(preset["pattern_type"], params)
+            if key not in self.frame_cache.memory:
+                self.prewarm.submit(key, moire_engine.render, preset["pattern_type"],
+                                    PATTERN_SIZE, PATTERN_SIZE, params)
+        if self.prewarm_poll_job is None:
+            self.poll_prewarm()
+    
+    def poll_prewarm(self):
+        """計算が終わったプリセットのフレームをキャッシュに入れる"""
+        self.prewarm_poll_job = None
+        for key, gray in self.prewarm.poll():
+            self.frame_cache.put(key, gray)
+        if not self.prewarm.idle():
+            self.prewarm_poll_job = self.root.after(moire_presets.PREWARM_POLL_MS,
+                                                    self.poll_prewarm)
+    
+    def on_close(self):
+        """ウィンドウを閉じるときにアニメーションとバックグラウンドのスレッドを止める"""
+        self.stop_animation()
+        self.prewarm.close()
+        self.thumbnails.close()
+        self.frame_cache.close()
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
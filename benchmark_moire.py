@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Moire Pattern Benchmark
+バックエンドごとのパターン計算時間を比較
+"""
+
+import argparse
+import time
+
+import moire_backends
+import moire_engine
+
+
+def time_call(func, repeat):
+    """初回（コンパイル等）を除いた最小実行時間を計測"""
+    func()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(width, height, repeat, precision):
+    """利用可能な全バックエンドで計測して結果を表示"""
+    params = moire_engine.make_params()
+    backends = moire_backends.available_backends()
+    print(f"=== Moire Benchmark {width}x{height} ({precision}, best of {repeat}) ===")
+    print(f"Backends: {', '.join(backends)}")
+
+    for pattern_type in ("Standard", "Wave", "Tree Rings"):
+        baseline = time_call(lambda: moire_engine.calculate_pattern(
+            pattern_type, width, height, params, precision=precision), repeat)
+        print(f"{pattern_type:<11} {'NumPy':<8} {baseline * 1000:8.1f} ms")
+
+        for backend in backends:
+            if backend == "CPU":
+                continue
+            if backend == "NumExpr":
+                func = lambda: moire_backends.calculate_numexpr(
+                    pattern_type, width, height, params, precision)
+            elif pattern_type == "Standard":
+                func = lambda: moire_backends.calculate_standard(
+                    backend, width, height, params, precision)
+            else:
+                # GPU系は標準パターンのみ対応
+                continue
+            try:
+                elapsed = time_call(func, repeat)
+            except Exception as e:
+                print(f"{pattern_type:<11} {backend:<8} failed: {e}")
+                continue
+            print(f"{pattern_type:<11} {backend:<8} {elapsed * 1000:8.1f} ms "
+                  f"(x{baseline / elapsed:.2f} vs NumPy)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark moire pattern backends")
+    parser.add_argument("--width", type=int, default=1200)
+    parser.add_argument("--height", type=int, default=1200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--precision", choices=list(moire_engine.PRECISIONS),
+                        default=moire_engine.DEFAULT_PRECISION)
+    args = parser.parse_args()
+    run_benchmark(args.width, args.height, args.repeat, args.precision)
+
+
+if __name__ == "__main__":
+    main()
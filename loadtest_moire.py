@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Moire Render Service Load Test
+moire.py serve に同時接続で描画要求を送り、レイテンシと処理量を計測
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+def percentile(values, fraction):
+    """昇順に並べた値の分位点（最近傍）"""
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+async def fetch(host, port, path):
+    """1回の GET を送り (status, 本文) を返す"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n"
+                     .encode("latin-1"))
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        length = 0
+        for line in lines[1:]:
+            if line.lower().startswith("content-length:"):
+                length = int(line.split(":", 1)[1])
+        body = await reader.readexactly(length)
+        return status, body
+    finally:
+        writer.close()
+
+
+def request_path(args, rng):
+    """ランダムなパラメータ（distinct 通りのどれか）の描画要求パス"""
+    variant = rng.randrange(args.distinct)
+    return (f"/render?pattern={args.pattern.replace(' ', '%20')}&width={args.width}"
+            f"&height={args.height}&format={args.format}"
+            f"&freq1={8.0 + 0.1 * variant:.1f}&phase1={0.05 * variant:.2f}")
+
+
+async def run_load_test(args):
+    """concurrency 本の接続から合計 requests 回の要求を送って結果を表示"""
+    rng = random.Random(args.seed)
+    paths = [request_path(args, rng) for _ in range(args.requests)]
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        while paths:
+            path = paths.pop()
+            start = time.perf_counter()
+            try:
+                status, _ = await fetch(args.host, args.port, path)
+            except OSError:
+                status = None
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"=== Moire Service Load Test {args.width}x{args.height} {args.pattern} "
+          f"({args.requests} requests, {args.concurrency} concurrent, {args.distinct} distinct) ===")
+    print(f"Throughput: {len(latencies) / elapsed:.1f} req/s ({elapsed:.2f}s total, {errors} errors)")
+    print(f"Latency p50: {percentile(latencies, 0.50) * 1000:.1f} ms  "
+          f"p99: {percentile(latencies, 0.99) * 1000:.1f} ms  "
+          f"max: {latencies[-1] * 1000:.1f} ms")
+    status, body = await fetch(args.host, args.port, "/health")
+    if status == 200:
+        print(f"Server: {json.loads(body)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the moire render service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=20,
+                        help="number of distinct parameter sets (controls cache hits)")
+    parser.add_argument("--pattern", default="Standard")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--format", default="png", choices=["png", "npy"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Moire Command Line Tool
+GUIを起動せずにモアレパターンを描画
+
+使用例:
+    python moire.py render --pattern Wave --freq1 8 --freq2 9 --size 1920x1080 -o wave.png
+    python moire.py export --pattern Standard --frames 600 --fps 60 --size 3840x2160 -o anim.mp4
+    python moire.py export --pattern Wave --frames 600 --size 1280x720 -o anim.mfa
+    python moire.py poster --pattern Wave --size 40000x40000 -o poster.tif
+    python moire.py pyramid --pattern Standard --size 100000x100000 -o zoom.dzi
+    python moire.py serve --port 8765
+    python moire.py stream --pattern Wave --size 1280x720 --fps 30
+    python moire.py timeline sweep.json --pattern Wave --frames 600 --key freq1:0:8 --key freq1:599:14
+    python moire.py timeline sweep.json --size 1920x1080 -o sweep.mfa
+    python moire.py batch nightly.toml --processes 8
+    python moire.py sweep --pattern Wave --vary freq1=4:16:20 --vary angle2=0:90:20 -o sheet.png
+    python moire.py search --pattern Standard --objective period --period 120 --orientation 45 -o best.png
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import moire_animation
+import moire_archive
+import moire_backends
+import moire_batch
+import moire_engine
+import moire_export
+import moire_io
+import moire_parallel
+import moire_poster
+import moire_pyramid
+import moire_search
+import moire_server
+import moire_shm
+import moire_stream
+import moire_sweep
+import moire_timeline
+
+
+def render_image(pattern_type="Standard", width=800, height=800, backend="CPU",
+                 precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                 output=None, **params):
+    """パラメータからモアレ画像（uint8）を描画し、output を指定すれば保存
+
+    params には freq1/freq2, angle1/angle2, phase1/phase2, wave_complexity,
+    wave_distortion, rings_complexity, rings_distortion, center_x/center_y, radius を指定できる。
+    """
+    image = moire_backends.render_gray(backend, pattern_type, width, height,
+                                       moire_engine.make_params(**params), precision, trig)
+    if output is not None:
+        moire_io.save_image(output, image)
+    return image
+
+
+def parse_size(text):
+    """"WIDTHxHEIGHT" または "SIZE" を (width, height) に変換"""
+    try:
+        if "x" in text.lower():
+            width, height = text.lower().split("x")
+            return int(width), int(height)
+        return int(text), int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}") from None
+
+
+def add_pattern_arguments(parser):
+    """パターンタイプとパラメータの引数を追加"""
+    parser.add_argument("--pattern", default="Standard", choices=list(moire_engine.PATTERNS),
+                        help="pattern type")
+    for name, default in moire_engine.DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, default=default,
+                            help=f"default: {default}")
+
+
+def add_render_arguments(parser):
+    """サイズ・バックエンド・精度の引数を追加"""
+    parser.add_argument("--size", type=parse_size, default=(800, 800),
+                        help="output size as WIDTHxHEIGHT (default: 800x800)")
+    parser.add_argument("--backend", default="CPU", choices=list(moire_backends.BACKEND_MODULES))
+    parser.add_argument("--precision", default=moire_engine.DEFAULT_PRECISION,
+                        choices=list(moire_engine.PRECISIONS))
+    parser.add_argument("--trig", default=moire_engine.DEFAULT_TRIG, choices=moire_engine.TRIG_MODES)
+
+
+def pattern_params(args):
+    """引数からパラメータ辞書を作成"""
+    return {name: getattr(args, name) for name in moire_engine.DEFAULT_PARAMS}
+
+
+def command_render(args):
+    """render サブコマンド"""
+    start = time.perf_counter()
+    width, height = args.size
+    render_image(args.pattern, width, height, backend=args.backend, precision=args.precision,
+                 trig=args.trig, output=args.output, **pattern_params(args))
+    print(f"Saved {args.output} ({width}x{height}, {args.pattern}, {args.backend}) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+def print_progress(done, total, fps):
+    """書き出しの進捗を1行で表示"""
+    print(f"\r{done}/{total} frames ({fps:.1f} fps)", end="", file=sys.stderr, flush=True)
+
+
+def command_export(args):
+    """export サブコマンド"""
+    width, height = args.size
+    options = {} if args.speed is None else {"speed": args.speed}
+    stats = moire_export.export_animation(
+        args.pattern, width, height, moire_engine.make_params(**pattern_params(args)),
+        args.frames, args.output, fps=args.fps, schedule=args.schedule, encoder=args.encoder,
+        workers=args.workers, queue_size=args.queue, precision=args.precision, trig=args.trig,
+        processes=args.processes, chunk=args.chunk, progress=print_progress,
+        archive_format=args.archive_format, archive_chunk=args.archive_chunk, **options)
+    print(file=sys.stderr)
+    print(f"Saved {stats['output']} ({stats['frames']} frames, {width}x{height}) "
+          f"in {stats['elapsed']:.2f}s, {stats['fps']:.1f} fps")
+    print(f"Waiting: compute {stats['compute_wait']:.2f}s, encode {stats['encode_wait']:.2f}s "
+          f"(bottleneck: {stats['bottleneck']})")
+
+
+def command_poster(args):
+    """poster サブコマンド"""
+    width, height = args.size
+
+    def report(done, total, elapsed):
+        print(f"\r{done}/{total} tiles ({elapsed:.1f}s)", end="", file=sys.stderr, flush=True)
+
+    stats = moire_poster.render_poster(
+        args.pattern, width, height, moire_engine.make_params(**pattern_params(args)),
+        args.output, tile=args.tile, rgb=args.rgb, workers=args.processes,
+        precision=args.precision, trig=args.trig, restart=args.restart, progress=report)
+    print(file=sys.stderr)
+    print(f"Saved {stats['output']} ({width}x{height}, {stats['rendered']} tiles rendered, "
+          f"{stats['skipped']} resumed) in {stats['elapsed']:.2f}s")
+
+
+def command_pyramid(args):
+    """pyramid サブコマンド"""
+    width, height = args.size
+    stats = moire_pyramid.build_pyramid(
+        args.pattern, width, height, moire_engine.make_params(**pattern_params(args)),
+        args.output, tile=args.tile, overlap=args.overlap, fmt=args.format,
+        cache_dir=args.cache, workers=args.processes, precision=args.precision, trig=args.trig,
+        progress=lambda done, total: print(f"\r{done}/{total} tiles rendered", end="",
+                                           file=sys.stderr, flush=True))
+    if stats["rendered"]:
+        print(file=sys.stderr)
+    print(f"Saved {stats['output']} ({stats['tiles']} tiles, {stats['rendered']} rendered, "
+          f"{stats['cached']} from cache) in {stats['elapsed']:.2f}s")
+
+
+def command_serve(args):
+    """serve サブコマンド"""
+    def ready(server):
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Serving moire renders on http://{host}:{port} (Ctrl+C to stop)")
+
+    try:
+        asyncio.run(moire_server.serve(args.host, args.port, args.processes,
+                                       args.cache_mb * 1024 * 1024, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def command_stream(args):
+    """stream サブコマンド"""
+    width, height = args.size
+    options = {} if args.speed is None else {"speed": args.speed}
+    if args.no_socket and args.shm is None:
+        raise ValueError("--no-socket needs --shm")
+    sinks = []
+    try:
+        if not args.no_socket:
+            streamer = moire_stream.FrameStreamer(args.host, args.port, args.workers)
+            sinks.append(streamer)
+            host, port = streamer.address
+            print(f"Streaming on http://{host}:{port}/stream.mjpg and /stream.raw")
+        if args.shm is not None:
+            ring = moire_shm.FrameRing(args.shm, slot_bytes=width * height)
+            sinks.append(ring)
+            print(f"Publishing frames to shared memory {ring.name} ({ring.slots} slots)")
+        print("Press Ctrl+C to stop")
+        moire_stream.stream_animation(
+            sinks, args.pattern, width, height,
+            moire_engine.make_params(**pattern_params(args)), fps=args.fps, frames=args.frames,
+            schedule=args.schedule, precision=args.precision, trig=args.trig, **options)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sink in sinks:
+            sink.close()
+    if not args.no_socket:
+        stats = streamer.stats
+        print(f"Published {stats['published']} frames, encoded {stats['encoded']}, "
+              f"dropped {stats['dropped']} while the encoders were busy")
+
+
+def parse_keyframe(text):
+    """"NAME:FRAME:VALUE[:EASING]" を (name, frame, value, easing) に変換"""
+    parts = text.split(":")
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f"invalid keyframe: {text}")
+    easing = parts[3] if len(parts) == 4 else moire_timeline.DEFAULT_EASING
+    try:
+        return parts[0], int(parts[1]), float(parts[2]), easing
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid keyframe: {text}") from None
+
+
+def command_timeline(args):
+    """timeline サブコマンド"""
+    if args.key:
+        try:
+            timeline = moire_timeline.load_timeline(args.timeline)
+        except FileNotFoundError:
+            timeline = moire_timeline.new_timeline(args.pattern, pattern_params(args),
+                                                   args.frames, args.fps)
+        for name, frame, value, easing in args.key:
+            moire_timeline.add_keyframe(timeline, name, frame, value, easing)
+        moire_timeline.save_timeline(timeline, args.timeline)
+        print(f"Saved {args.timeline} ({len(timeline['tracks'])} tracks)")
+    else:
+        timeline = moire_timeline.load_timeline(args.timeline)
+    if args.output is None:
+        return
+    width, height = args.size
+    stats = moire_timeline.render_timeline(timeline, args.output, width, height,
+                                           workers=args.processes, precision=args.precision,
+                                           trig=args.trig, progress=print_progress)
+    print(file=sys.stderr)
+    print(f"Saved {stats['output']} ({stats['frames']} frames, {width}x{height}) "
+          f"in {stats['elapsed']:.2f}s, {stats['fps']:.1f} fps")
+
+
+def command_batch(args):
+    """batch サブコマンド"""
+    def report(entry):
+        if entry["status"] == "failed":
+            print(f"FAILED {entry['name']}: {entry['error']}")
+        else:
+            print(f"{entry['name']}: {entry['elapsed']:.2f}s -> {entry['output']}")
+
+    report_data = moire_batch.run_manifest(args.manifest, workers=args.processes,
+                                           force=args.force, progress=report)
+    counts = report_data["counts"]
+    stages = ", ".join(f"{stage} {seconds:.2f}s"
+                       for stage, seconds in report_data["job_stages"].items())
+    print(f"{counts['rendered']} rendered, {counts['skipped']} up to date, "
+          f"{counts['failed']} failed in {report_data['elapsed']:.2f}s ({stages or 'no work'})")
+    print(f"Report: {args.manifest}{moire_batch.REPORT_SUFFIX}")
+    if counts["failed"]:
+        raise ValueError(f"{counts['failed']} jobs failed")
+
+
+def parse_sweep_axis(text):
+    """"NAME=START:STOP:COUNT" または "NAME=A,B,C" を (name, 値の配列) に変換"""
+    name, _, values = text.partition("=")
+    try:
+        return name, moire_sweep.parse_values(values)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid sweep: {text}") from None
+
+
+def command_sweep(args):
+    """sweep サブコマンド"""
+    start = time.perf_counter()
+    sheet = moire_sweep.sweep_sheet(args.pattern, pattern_params(args), dict(args.vary),
+                                    thumbnail=args.thumb, precision=args.precision,
+                                    trig=args.trig, max_bytes=args.max_mb * 1024 * 1024,
+                                    scale=args.label_scale)
+    moire_io.save_image(args.output, sheet)
+    count = 1
+    for _, values in args.vary:
+        count *= len(values)
+    print(f"Saved {args.output} ({count} thumbnails, {sheet.shape[1]}x{sheet.shape[0]}) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+def parse_search_axis(text):
+    """"NAME" または "NAME=LOW:HIGH" を (name, 範囲または None) に変換"""
+    name, _, bounds = text.partition("=")
+    if not bounds:
+        return name, None
+    try:
+        low, high = (float(value) for value in bounds.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid search range: {text}") from None
+    return name, (low, high)
+
+
+def command_search(args):
+    """search サブコマンド"""
+    width, height = args.size
+    names = [name for name, _ in args.vary] if args.vary else None
+    bounds = {name: bounds for name, bounds in args.vary or [] if bounds is not None}
+
+    def report(evaluated, budget, best):
+        print(f"\r{evaluated}/{budget} candidates (best {best:.4f})", end="", file=sys.stderr,
+              flush=True)
+
+    results, stats = moire_search.search(
+        args.pattern, pattern_params(args), (width, height), objective=args.objective,
+        target_period=args.period, target_orientation=args.orientation, strategy=args.strategy,
+        names=names, bounds=bounds, budget=args.budget, batch=args.batch, refine=args.refine,
+        workers=args.processes, seed=args.seed, precision=args.precision, trig=args.trig,
+        progress=report)
+    print(file=sys.stderr)
+    print(f"Evaluated {stats['evaluated']} candidates in {stats['low_res_time']:.2f}s, "
+          f"refined {stats['refined']} at {width}x{height} ({stats['elapsed']:.2f}s in total)")
+    for result in results[:args.show]:
+        metrics = result["metrics"]
+        values = " ".join(f"--{name.replace('_', '-')} {result['params'][name]:.4g}"
+                          for name in stats["names"])
+        print(f"score {result['score']:.4f}  contrast {metrics['contrast']:.3f}  "
+              f"period {metrics['period']:.1f}px  orientation {metrics['orientation']:.1f}  "
+              f"{values}")
+    if args.output:
+        best = results[0]["params"]
+        render_image(args.pattern, width, height, backend=args.backend, precision=args.precision,
+                     trig=args.trig, output=args.output, **best)
+        print(f"Saved {args.output}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"stats": stats, "results": results}, f, indent=2)
+        print(f"Saved {args.json}")
+
+
+def build_parser():
+    """コマンドライン引数のパーサーを作成"""
+    parser = argparse.ArgumentParser(prog="moire", description="Headless moire pattern renderer")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = subparsers.add_parser("render", help="render a single still image")
+    add_pattern_arguments(render_parser)
+    add_render_arguments(render_parser)
+    render_parser.add_argument("-o", "--output", required=True,
+                               help="output file (.png, .pgm or .npy)")
+    render_parser.set_defaults(func=command_render)
+
+    export_parser = subparsers.add_parser("export", help="export a phase animation")
+    add_pattern_arguments(export_parser)
+    add_render_arguments(export_parser)
+    export_parser.add_argument("--frames", type=int, default=300)
+    export_parser.add_argument("--fps", type=float, default=moire_export.DEFAULT_FPS)
+    export_parser.add_argument("--schedule", choices=list(moire_animation.PHASE_SCHEDULES),
+                               help="phase steps of the PyQt (qt) or Tk (tk) animation "
+                                    "(default: the GUI that shows the pattern type)")
+    export_parser.add_argument("--speed", type=float,
+                               help=f"phase step of the tk schedule (default: "
+                                    f"{moire_animation.TK_DEFAULT_SPEED})")
+    export_parser.add_argument("--encoder", choices=["ffmpeg", *moire_export.SEQUENCE_FORMATS],
+                               help="default: ffmpeg for video files if available, else png")
+    export_parser.add_argument("--workers", type=int, help="image sequence writer threads")
+    export_parser.add_argument("--processes", type=int,
+                               help="render frames in this many worker processes")
+    export_parser.add_argument("--chunk", type=int, default=moire_parallel.DEFAULT_CHUNK,
+                               help="frames per worker task with --processes")
+    export_parser.add_argument("--queue", type=int, default=moire_export.DEFAULT_QUEUE_SIZE,
+                               help="frames buffered between compute and encode")
+    export_parser.add_argument("--archive-format", default=moire_archive.DEFAULT_FORMAT,
+                               choices=list(moire_archive.ARCHIVE_FORMATS),
+                               help="pixel format of .mfa frame archives")
+    export_parser.add_argument("--archive-chunk", type=int, default=0,
+                               help="zlib-compress .mfa archives in chunks of this many frames "
+                                    "(default: uncompressed)")
+    export_parser.add_argument("-o", "--output", required=True,
+                               help="video file (needs ffmpeg), .mfa frame archive or image "
+                                    "sequence (directory or pattern such as out/frame_%%05d.png)")
+    export_parser.set_defaults(func=command_export)
+
+    poster_parser = subparsers.add_parser(
+        "poster", help="render a very large image tile by tile (resumable)")
+    add_pattern_arguments(poster_parser)
+    add_render_arguments(poster_parser)
+    poster_parser.add_argument("--tile", type=int, default=moire_poster.DEFAULT_TILE,
+                               help="tile size in pixels")
+    poster_parser.add_argument("--rgb", action="store_true", help="write 3-channel RGB")
+    poster_parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    poster_parser.add_argument("--restart", action="store_true",
+                               help="ignore the checkpoint manifest and start over")
+    poster_parser.add_argument("-o", "--output", required=True,
+                               help="output file (.raw, .pgm, .ppm or .tif)")
+    poster_parser.set_defaults(func=command_poster)
+
+    pyramid_parser = subparsers.add_parser(
+        "pyramid", help="build a Deep Zoom (DZI) tile pyramid rendered at every level")
+    add_pattern_arguments(pyramid_parser)
+    add_render_arguments(pyramid_parser)
+    pyramid_parser.add_argument("--tile", type=int, default=moire_pyramid.DEFAULT_TILE)
+    pyramid_parser.add_argument("--overlap", type=int, default=moire_pyramid.DEFAULT_OVERLAP)
+    pyramid_parser.add_argument("--format", default="png", choices=moire_pyramid.TILE_FORMATS)
+    pyramid_parser.add_argument("--cache", default=moire_pyramid.DEFAULT_CACHE_DIR,
+                                help="content-addressed tile cache directory")
+    pyramid_parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    pyramid_parser.add_argument("-o", "--output", required=True, help="output .dzi file")
+    pyramid_parser.set_defaults(func=command_pyramid)
+
+    serve_parser = subparsers.add_parser("serve", help="run the local HTTP render service")
+    serve_parser.add_argument("--host", default=moire_server.DEFAULT_HOST,
+                              help="bind address (default: localhost only)")
+    serve_parser.add_argument("--port", type=int, default=moire_server.DEFAULT_PORT)
+    serve_parser.add_argument("--processes", type=int, help="render worker processes")
+    serve_parser.add_argument("--cache-mb", type=int,
+                              default=moire_server.DEFAULT_CACHE_BYTES // (1024 * 1024),
+                              help="response cache size in MiB")
+    serve_parser.set_defaults(func=command_serve)
+
+    stream_parser = subparsers.add_parser(
+        "stream", help="stream a live animation as MJPEG or raw ARGB over a local socket")
+    add_pattern_arguments(stream_parser)
+    add_render_arguments(stream_parser)
+    stream_parser.add_argument("--host", default=moire_stream.DEFAULT_HOST,
+                               help="bind address (default: localhost only)")
+    stream_parser.add_argument("--port", type=int, default=moire_stream.DEFAULT_PORT)
+    stream_parser.add_argument("--fps", type=float, default=moire_export.DEFAULT_FPS)
+    stream_parser.add_argument("--frames", type=int, help="stop after this many frames")
+    stream_parser.add_argument("--schedule", choices=list(moire_animation.PHASE_SCHEDULES),
+                               help="phase steps of the PyQt (qt) or Tk (tk) animation")
+    stream_parser.add_argument("--speed", type=float, help="phase step of the tk schedule")
+    stream_parser.add_argument("--workers", type=int, default=moire_stream.DEFAULT_ENCODE_WORKERS,
+                               help="encoder threads")
+    stream_parser.add_argument("--shm", metavar="NAME",
+                               help="also publish gray frames to this shared-memory ring "
+                                    "(see shm_reader_moire.py)")
+    stream_parser.add_argument("--no-socket", action="store_true",
+                               help="only publish to shared memory")
+    stream_parser.set_defaults(func=command_stream)
+
+    timeline_parser = subparsers.add_parser(
+        "timeline", help="edit a keyframe timeline (JSON) and render it on all cores")
+    timeline_parser.add_argument("timeline", help="timeline JSON file")
+    add_pattern_arguments(timeline_parser)
+    add_render_arguments(timeline_parser)
+    timeline_parser.add_argument("--frames", type=int, default=moire_timeline.DEFAULT_FRAMES,
+                                 help="length of a new timeline")
+    timeline_parser.add_argument("--fps", type=float, default=moire_timeline.DEFAULT_FPS,
+                                 help="frame rate of a new timeline")
+    timeline_parser.add_argument("--key", action="append", type=parse_keyframe,
+                                 metavar="NAME:FRAME:VALUE[:EASING]",
+                                 help="add a keyframe and save the timeline (creates it from the "
+                                      f"pattern arguments if missing); easings: "
+                                      f"{', '.join(moire_timeline.EASINGS)}")
+    timeline_parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    timeline_parser.add_argument("-o", "--output",
+                                 help="render to an uncompressed .mfa frame archive or an image "
+                                      "sequence (directory or pattern such as out/frame_%%05d.png)")
+    timeline_parser.set_defaults(func=command_timeline)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="run the render jobs of a JSON or TOML manifest (resumable)")
+    batch_parser.add_argument("manifest", help="manifest file (.json or .toml)")
+    batch_parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    batch_parser.add_argument("--force", action="store_true",
+                              help="render jobs again even if their outputs are up to date")
+    batch_parser.set_defaults(func=command_batch)
+
+    sweep_parser = subparsers.add_parser(
+        "sweep", help="render a labelled contact sheet of a parameter grid")
+    add_pattern_arguments(sweep_parser)
+    sweep_parser.add_argument("--vary", action="append", required=True, type=parse_sweep_axis,
+                              metavar="NAME=START:STOP:COUNT",
+                              help="parameter values to sweep (or NAME=A,B,C); the last one "
+                                   "becomes the columns")
+    sweep_parser.add_argument("--thumb", type=parse_size, default=moire_sweep.DEFAULT_THUMBNAIL,
+                              help="thumbnail size as WIDTHxHEIGHT or SIZE")
+    sweep_parser.add_argument("--precision", default=moire_engine.DEFAULT_PRECISION,
+                              choices=list(moire_engine.PRECISIONS))
+    sweep_parser.add_argument("--trig", default=moire_engine.DEFAULT_TRIG,
+                              choices=moire_engine.TRIG_MODES)
+    sweep_parser.add_argument("--max-mb", type=int,
+                              default=moire_sweep.DEFAULT_SWEEP_BYTES // (1024 * 1024),
+                              help="memory cap of one batched computation in MiB")
+    sweep_parser.add_argument("--label-scale", type=int, default=moire_sweep.LABEL_SCALE,
+                              help="size multiplier of the label font")
+    sweep_parser.add_argument("-o", "--output", required=True,
+                              help="contact sheet (.png, .pgm or .npy)")
+    sweep_parser.set_defaults(func=command_sweep)
+
+    search_parser = subparsers.add_parser(
+        "search", help="search the parameter space for contrast or a target fringe period")
+    add_pattern_arguments(search_parser)
+    add_render_arguments(search_parser)
+    search_parser.add_argument("--objective", default="contrast", choices=moire_search.OBJECTIVES)
+    search_parser.add_argument("--period", type=float,
+                               help="target fringe period in output pixels (period objective)")
+    search_parser.add_argument("--orientation", type=float,
+                               help="target fringe normal in degrees (period objective)")
+    search_parser.add_argument("--strategy", default="cmaes", choices=moire_search.STRATEGIES)
+    search_parser.add_argument("--vary", action="append", type=parse_search_axis,
+                               metavar="NAME[=LOW:HIGH]",
+                               help="parameter to search (default: all that change the "
+                                    "fringes, except phases and centres)")
+    search_parser.add_argument("--budget", type=int, default=moire_search.DEFAULT_BUDGET,
+                               help="low-resolution candidates to evaluate")
+    search_parser.add_argument("--batch", type=int, default=moire_search.DEFAULT_BATCH,
+                               help="candidates per batch (CMA-ES population)")
+    search_parser.add_argument("--refine", type=int, default=moire_search.DEFAULT_REFINE,
+                               help="best candidates to refine at full resolution")
+    search_parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    search_parser.add_argument("--seed", type=int, help="random seed")
+    search_parser.add_argument("--show", type=int, default=5, help="results to print")
+    search_parser.add_argument("--json", help="save all refined results as JSON")
+    search_parser.add_argument("-o", "--output", help="render the best result to this image")
+    search_parser.set_defaults(func=command_search)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
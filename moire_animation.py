@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Moire Animation
+位相アニメーションのフレームをまとめて計算するストリーミング生成器
+"""
+
+import queue
+import threading
+
+import numpy as np
+
+import moire_engine
+
+# pyqt_moire.py の MoirePatternWidget.animate と同じ位相の進め方
+# （スライダー単位は 1/100 rad、628 で折り返す）
+QT_PHASE_STEPS = (150, 120)
+QT_PHASE_WRAP = 628
+
+# advanced_moire.py の AdvancedMoireApp.animate と同じ位相の進め方
+# （phase1 に speed、phase2 に speed * 0.8 を足して 2π で折り返す）
+TK_DEFAULT_SPEED = 0.05
+TK_PHASE2_RATIO = 0.8
+
+# Tk版（advanced_moire.py）のパターンタイプ
+TK_PATTERN_TYPES = ("linear", "circular", "radial", "spiral")
+
+# 先読みしておくバッチ数
+DEFAULT_PREFETCH = 2
+
+
+def qt_phase_schedule(frames, phase1=0.0, phase2=0.0, steps=QT_PHASE_STEPS):
+    """PyQt版の animate と同じ位相列 (phase1, phase2) を作成（0枚目は現在の位相）"""
+    start1 = int(round(phase1 * 100))
+    start2 = int(round(phase2 * 100))
+    k = np.arange(frames)
+    phase1 = (start1 + k * steps[0]) % QT_PHASE_WRAP / 100.0
+    phase2 = (start2 + k * steps[1]) % QT_PHASE_WRAP / 100.0
+    return phase1, phase2
+
+
+def tk_phase_schedule(frames, phase1=0.0, phase2=0.0, speed=TK_DEFAULT_SPEED):
+    """Tk版の animate と同じ位相列 (phase1, phase2) を作成（0枚目は現在の位相）"""
+    k = np.arange(frames)
+    phase1 = np.mod(phase1 + k * speed, 2 * np.pi)
+    phase2 = np.mod(phase2 + k * (speed * TK_PHASE2_RATIO), 2 * np.pi)
+    return phase1, phase2
+
+
+# スケジュール名 -> 位相列の作成関数
+PHASE_SCHEDULES = {
+    "qt": qt_phase_schedule,
+    "tk": tk_phase_schedule,
+}
+
+
+def default_schedule(pattern_type):
+    """パターンタイプを表示しているGUIのスケジュール名"""
+    return "tk" if pattern_type in TK_PATTERN_TYPES else "qt"
+
+
+def phase_schedule(pattern_type, frames, params, schedule=None, **options):
+    """params の位相から始まる位相列を作成（schedule を省略するとGUIと同じ動き）"""
+    schedule = schedule or default_schedule(pattern_type)
+    try:
+        func = PHASE_SCHEDULES[schedule]
+    except KeyError:
+        raise ValueError(f"Unknown phase schedule: {schedule}") from None
+    return func(frames, params["phase1"], params["phase2"], **options)
+
+
+def batch_size(pattern_type, width, height, precision=moire_engine.DEFAULT_PRECISION,
+               scratch_bytes=moire_engine.DEFAULT_SCRATCH_BYTES):
+    """作業領域に収まる1バッチあたりのフレーム数"""
+    bytes_per_frame = (width * height * moire_engine.PATTERN_TEMPORARIES[pattern_type]
+                       * moire_engine.get_dtype(precision).itemsize)
+    return max(1, scratch_bytes // bytes_per_frame)
+
+
+def animation_carriers(pattern_type, width, height, params,
+                       precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG):
+    """アニメーション全体で使い回す位相に依存しない搬送波（分解できなければ None）"""
+    x, y = moire_engine.make_axes(width, height, moire_engine.PATTERN_EXTENTS[pattern_type],
+                                  moire_engine.get_dtype(precision))
+    X, Y = np.meshgrid(x, y)
+    return moire_engine.phase_carriers(pattern_type, X, Y, params, trig)
+
+
+def render_phase_batches(pattern_type, width, height, params, phase1, phase2, batch=None,
+                         precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                         scratch_bytes=moire_engine.DEFAULT_SCRATCH_BYTES):
+    """位相列のフレームを batch 枚ずつ (K, H, W) の uint8 配列として順に返す
+
+    2格子の積で表せるパターンは位相に依存しない搬送波を最初に1回だけ計算し、
+    以降のバッチは合成だけで済ませる。
+    """
+    if batch is None:
+        batch = batch_size(pattern_type, width, height, precision, scratch_bytes)
+    carriers = animation_carriers(pattern_type, width, height, params, precision, trig)
+    for start in range(0, len(phase1), batch):
+        stop = min(len(phase1), start + batch)
+        frames = moire_engine.calculate_phase_batch(
+            pattern_type, width, height, params, phase1[start:stop], phase2[start:stop],
+            precision=precision, trig=trig, carriers=carriers)
+        yield moire_engine.to_gray(frames)
+
+
+def _put(output, item, stop):
+    """停止されるまでキューへの投入を試みる（投入できたら True）"""
+    while not stop.is_set():
+        try:
+            output.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(batches, output, stop):
+    """バックグラウンドスレッドでバッチを計算してキューに入れる（終端は None）"""
+    try:
+        for frames in batches:
+            if not _put(output, frames, stop):
+                return
+    except Exception as e:
+        _put(output, e, stop)
+        return
+    _put(output, None, stop)
+
+
+def iter_frames(pattern_type, width, height, params, frames, schedule=None, fmt="gray",
+                batch=None, prefetch=DEFAULT_PREFETCH, precision=moire_engine.DEFAULT_PRECISION,
+                trig=moire_engine.DEFAULT_TRIG, **schedule_options):
+    """アニメーションのフレームを1枚ずつ返すジェネレータ（gray: uint8, argb: uint32）
+
+    計算はバックグラウンドスレッドでバッチ単位に行い、最大 prefetch バッチだけ先読みする。
+    schedule を省略すると params の位相からGUIの animate と同じ動きになる。
+    """
+    if fmt not in ("gray", "argb"):
+        raise ValueError(f"Unknown output format: {fmt}")
+    phase1, phase2 = phase_schedule(pattern_type, frames, params, schedule, **schedule_options)
+    batches = render_phase_batches(pattern_type, width, height, params, phase1, phase2,
+                                   batch=batch, precision=precision, trig=trig)
+
+    output = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    worker = threading.Thread(target=_produce, args=(batches, output, stop), daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = output.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            for frame in item:
+                yield frame if fmt == "gray" else moire_engine.gray_to_argb(frame)
+    finally:
+        # 途中で閉じられたら計算スレッドを止める
+        stop.set()
+        worker.join()
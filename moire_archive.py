@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Moire Frame Archive
+描画済みのアニメーションを1つのファイルに保存し、計算なしで再生・シークする
+
+レイアウト（リトルエンディアン）:
+    ARCHIVE_HEADER
+    メタデータ（JSON、パターンやパラメータの記録）
+    ARCHIVE_ALIGNMENT に揃えたフレーム領域
+    （圧縮時のみ）チャンクの索引: (オフセット, バイト数) の uint64 x 2 x チャンク数
+
+無圧縮ではフレームが固定長で並ぶので np.memmap で任意のフレームを直接参照できる。
+chunk_frames を指定すると chunk_frames 枚ずつ zlib で圧縮し、シークは1チャンクの
+展開だけで済む。
+"""
+
+import collections
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+import moire_engine
+
+ARCHIVE_EXTENSION = ".mfa"
+
+ARCHIVE_MAGIC = b"MOIRFA01"
+ARCHIVE_VERSION = 1
+
+# マジック, 版, 幅, 高さ, 形式, フレーム数, チャンクのフレーム数（0 = 無圧縮）, fps,
+# フレーム領域の位置, 索引の位置, メタデータのバイト数
+ARCHIVE_HEADER = struct.Struct("<8sIIIIIIdQQI")
+
+# フレーム領域の先頭をページ境界に揃える
+ARCHIVE_ALIGNMENT = 4096
+
+# 形式名 -> (番号, 画素の型)。argb は QImage.Format_RGB32 と同じ 0xAARRGGBB
+ARCHIVE_FORMATS = {
+    "gray": (1, np.dtype(np.uint8)),
+    "argb": (2, np.dtype("<u4")),
+}
+FORMAT_NAMES = {code: name for name, (code, _) in ARCHIVE_FORMATS.items()}
+
+DEFAULT_FORMAT = "gray"
+
+# 圧縮するときの zlib レベル
+COMPRESS_LEVEL = 6
+
+# 展開済みのチャンクを保持する数
+DEFAULT_CHUNK_CACHE = 8
+
+# 先読みするフレーム数
+DEFAULT_READ_AHEAD = 32
+
+
+def archive_header(width, height, fmt, frames, chunk_frames, fps, data_offset, index_offset,
+                   metadata):
+    """ヘッダーのバイト列（metadata はエンコード済みの JSON）"""
+    return ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, width, height,
+                               ARCHIVE_FORMATS[fmt][0], frames, chunk_frames, fps, data_offset,
+                               index_offset, len(metadata))
+
+
+def data_offset(metadata):
+    """フレーム領域の開始位置（ヘッダーとメタデータの後のページ境界）"""
+    header_end = ARCHIVE_HEADER.size + len(metadata)
+    return -(-header_end // ARCHIVE_ALIGNMENT) * ARCHIVE_ALIGNMENT
+
+
+def create_archive(path, width, height, frames, fps=60.0, fmt=DEFAULT_FORMAT, metadata=None):
+    """無圧縮のアーカイブを全フレーム分の領域ごと作成し、フレーム領域の位置を返す
+
+    各プロセスが np.memmap で担当のフレームへ直接書き込むときに使う。
+    """
+    metadata = json.dumps(metadata or {}).encode("utf-8")
+    offset = data_offset(metadata)
+    frame_bytes = width * height * ARCHIVE_FORMATS[fmt][1].itemsize
+    with open(path, "wb") as f:
+        f.write(archive_header(width, height, fmt, frames, 0, fps, offset, 0, metadata))
+        f.write(metadata)
+        # 未描画の部分は疎なファイルのまま
+        f.truncate(offset + frames * frame_bytes)
+    return offset
+
+
+class ArchiveWriter:
+    """アーカイブを書き出す（moire_export のエンコーダと同じ write / close / abort を持つ）
+
+    書きかけは 出力名.tmp に書き、close で置き換えるので、中断しても壊れた
+    アーカイブは残らない。中断したときは close ではなく abort を呼ぶ。
+    """
+
+    def __init__(self, path, width, height, fps=60.0, fmt=DEFAULT_FORMAT, chunk_frames=0,
+                 metadata=None):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format: {fmt}")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fmt = fmt
+        self.dtype = ARCHIVE_FORMATS[fmt][1]
+        self.chunk_frames = chunk_frames
+        self.metadata = json.dumps(metadata or {}).encode("utf-8")
+        self.data_offset = data_offset(self.metadata)
+        self.frames = 0
+        self.chunk = []
+        self.index = []
+        self.file = open(path + ".tmp", "wb")
+        self.file.write(self._header(0))
+        self.file.write(self.metadata)
+        self.file.write(b"\0" * (self.data_offset - ARCHIVE_HEADER.size - len(self.metadata)))
+
+    def _header(self, index_offset):
+        return archive_header(self.width, self.height, self.fmt, self.frames, self.chunk_frames,
+                              self.fps, self.data_offset, index_offset, self.metadata)
+
+    def write(self, index, frame):
+        """フレームを追加（uint8 のグレースケールは argb 形式なら変換する）"""
+        if frame.shape != (self.height, self.width):
+            raise ValueError(f"Frame shape {frame.shape} does not match "
+                             f"{self.width}x{self.height}")
+        if self.fmt == "argb" and frame.dtype == np.uint8:
+            frame = moire_engine.gray_to_argb(frame)
+        data = np.ascontiguousarray(frame, dtype=self.dtype).tobytes()
+        self.frames += 1
+        if not self.chunk_frames:
+            self.file.write(data)
+            return
+        self.chunk.append(data)
+        if len(self.chunk) == self.chunk_frames:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        compressed = zlib.compress(b"".join(self.chunk), COMPRESS_LEVEL)
+        self.index.append((self.file.tell(), len(compressed)))
+        self.file.write(compressed)
+        self.chunk = []
+
+    def close(self):
+        """索引とヘッダーを書いて完成させる"""
+        index_offset = 0
+        if self.chunk_frames:
+            if self.chunk:
+                self._flush_chunk()
+            index_offset = self.file.tell()
+            self.file.write(np.array(self.index, dtype="<u8").reshape(-1, 2).tobytes())
+        self.file.seek(0)
+        self.file.write(self._header(index_offset))
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def abort(self):
+        """書きかけを捨てる（出力先の既存のファイルはそのまま）"""
+        self.file.close()
+        try:
+            os.remove(self.path + ".tmp")
+        except FileNotFoundError:
+            pass
+
+
+class FrameArchive:
+    """アーカイブを読み出す（無圧縮は np.memmap のビュー、圧縮はチャンク単位で展開）"""
+
+    def __init__(self, path, chunk_cache=DEFAULT_CHUNK_CACHE):
+        with open(path, "rb") as f:
+            header = f.read(ARCHIVE_HEADER.size)
+            if len(header) < ARCHIVE_HEADER.size:
+                raise ValueError(f"{path} is not a moire frame archive")
+            (magic, version, self.width, self.height, code, self.frame_count, self.chunk_frames,
+             self.fps, data_offset, index_offset, metadata_length) = ARCHIVE_HEADER.unpack(header)
+            if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION or code not in FORMAT_NAMES:
+                raise ValueError(f"{path} is not a moire frame archive")
+            self.metadata = json.loads(f.read(metadata_length) or b"{}")
+        self.path = path
+        self.fmt = FORMAT_NAMES[code]
+        self.dtype = ARCHIVE_FORMATS[self.fmt][1]
+        self.frame_bytes = self.width * self.height * self.dtype.itemsize
+        self.lock = threading.Lock()
+        self.chunks = collections.OrderedDict()
+        self.chunk_cache = chunk_cache
+
+        if self.frame_count == 0:
+            self.frames = np.empty((0, self.height, self.width), dtype=self.dtype)
+        elif self.chunk_frames:
+            self.raw = np.memmap(path, dtype=np.uint8, mode="r")
+            chunk_count = -(-self.frame_count // self.chunk_frames)
+            self.index = np.frombuffer(self.raw[index_offset:index_offset + chunk_count * 16],
+                                       dtype="<u8").reshape(chunk_count, 2)
+        else:
+            self.frames = np.memmap(path, dtype=self.dtype, mode="r", offset=data_offset,
+                                    shape=(self.frame_count, self.height, self.width))
+
+    def __len__(self):
+        return self.frame_count
+
+    def _chunk(self, number):
+        """展開済みのチャンク (枚数, H, W)（LRU で保持）"""
+        with self.lock:
+            frames = self.chunks.get(number)
+            if frames is not None:
+                self.chunks.move_to_end(number)
+                return frames
+        offset, length = (int(value) for value in self.index[number])
+        # zlib は GIL を解放するので、先読みスレッドと並行に展開できる
+        data = zlib.decompress(self.raw[offset:offset + length])
+        frames = np.frombuffer(data, dtype=self.dtype).reshape(-1, self.height, self.width)
+        with self.lock:
+            self.chunks[number] = frames
+            while len(self.chunks) > self.chunk_cache:
+                self.chunks.popitem(last=False)
+        return frames
+
+    def frame(self, index):
+        """index 番目のフレーム（読み取り専用、無圧縮ならファイルのビュー）"""
+        if not 0 <= index < self.frame_count:
+            raise IndexError(f"Frame {index} out of range (0-{self.frame_count - 1})")
+        if self.chunk_frames:
+            return self._chunk(index // self.chunk_frames)[index % self.chunk_frames]
+        return self.frames[index]
+
+    def prefetch(self, index):
+        """index 番目のフレームを読み込んでおく（ページキャッシュまたはチャンクの展開）"""
+        if not 0 <= index < self.frame_count:
+            return
+        if self.chunk_frames:
+            self._chunk(index // self.chunk_frames)
+        else:
+            # 各ページを1バイトずつ触ってディスクから読み込ませる
+            page = ARCHIVE_ALIGNMENT // self.dtype.itemsize
+            self.frames[index].reshape(-1)[::page].max()
+
+    def close(self):
+        self.chunks.clear()
+        self.frames = self.raw = self.index = None
+
+
+class ReadAhead:
+    """再生位置の先のフレームをバックグラウンドで読み込むスレッド"""
+
+    def __init__(self, archive, frames=DEFAULT_READ_AHEAD):
+        self.archive = archive
+        self.frames = frames
+        self.condition = threading.Condition()
+        self.position = None
+        self.direction = 1
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def seek(self, index, direction=None):
+        """再生位置を知らせる（direction は進む向き、省略時は前回からの移動で判断）"""
+        with self.condition:
+            if direction is None and self.position is not None and index != self.position:
+                direction = 1 if index > self.position else -1
+            if direction is not None:
+                self.direction = direction
+            self.position = index
+            self.condition.notify()
+
+    def _run(self):
+        done = None
+        while True:
+            with self.condition:
+                while not self.stopped and self.position == done:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                position, direction = self.position, self.direction
+            step = self.archive.chunk_frames or 1
+            for offset in range(step, self.frames + 1, step):
+                # 位置が変わったら読み込み中の予定は捨ててやり直す
+                if self.position != position or self.stopped:
+                    break
+                self.archive.prefetch(position + direction * offset)
+            else:
+                done = position
+
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Moire Pattern Backends
+CPU / OpenCL / CuPy / Numba / NumExpr によるモアレパターン計算
+GPUライブラリ等は使用時に初めて読み込む
+"""
+
+import importlib.util
+import math
+
+import numpy as np
+
+import moire_engine
+
+# バックエンド名 -> 必要なモジュール
+BACKEND_MODULES = {
+    "CPU": "numpy",
+    "OpenCL": "pyopencl",
+    "CuPy": "cupy",
+    "Numba": "numba",
+    "NumExpr": "numexpr",
+}
+
+# GPU系バックエンド（標準パターンのみ対応、優先順位順）
+GPU_BACKENDS = ("OpenCL", "CuPy", "Numba")
+
+# 高速三角関数に対応するバックエンド
+FAST_TRIG_BACKENDS = ("CPU", "OpenCL", "CuPy", "Numba")
+
+# OpenCLのコンテキストとプログラム（初回使用時に作成）
+_opencl_state = {}
+
+# Numbaのコンパイル済み関数（初回使用時に作成）
+_numba_kernels = {}
+
+
+def is_available(backend):
+    """バックエンドのライブラリがインストールされているか（読み込みはしない）"""
+    return importlib.util.find_spec(BACKEND_MODULES[backend]) is not None
+
+
+def available_backends():
+    """利用可能なバックエンド名の一覧"""
+    return [name for name in BACKEND_MODULES if is_available(name)]
+
+
+def calculate_standard(backend, width, height, params, precision=moire_engine.DEFAULT_PRECISION,
+                       trig=moire_engine.DEFAULT_TRIG, pattern_type="Standard"):
+    """指定バックエンドで標準モアレパターンを計算（NumPy配列を返す）
+
+    pattern_type は線形格子の積のパターン（Standard / linear）で、座標範囲だけが異なる。
+    """
+    if trig not in moire_engine.TRIG_MODES:
+        raise ValueError(f"Unknown trig mode: {trig}")
+    if backend == "CPU":
+        return moire_engine.calculate_pattern(pattern_type, width, height, params,
+                                              precision=precision, trig=trig)
+    if backend == "OpenCL":
+        return calculate_standard_opencl(width, height, params, precision, trig, pattern_type)
+    if backend == "CuPy":
+        return calculate_standard_cupy(width, height, params, precision, trig, pattern_type)
+    if backend == "Numba":
+        return calculate_standard_numba(width, height, params, precision, trig, pattern_type)
+    if backend == "NumExpr":
+        return calculate_numexpr(pattern_type, width, height, params, precision)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def calculate_standard_cupy(width, height, params, precision=moire_engine.DEFAULT_PRECISION,
+                            trig=moire_engine.DEFAULT_TRIG, pattern_type="Standard"):
+    """CuPyを使用したGPU計算"""
+    import cupy as cp
+
+    dtype = moire_engine.get_dtype(precision)
+    table_size = moire_engine.SINE_TABLE_SIZE
+    if trig == "fast":
+        table = cp.asarray(moire_engine.sine_table(dtype.type))
+    extent = moire_engine.PATTERN_EXTENTS[pattern_type]
+    x = cp.linspace(-extent, extent, width, dtype=dtype)
+    y = cp.linspace(-extent, extent, height, dtype=dtype)
+    X, Y = cp.meshgrid(x, y)
+
+    def grating(freq, angle, phase):
+        angle_rad = math.radians(angle)
+        t = freq * (X * math.cos(angle_rad) + Y * math.sin(angle_rad))
+        if dtype == np.float32:
+            # 周期単位で範囲縮小
+            t -= cp.rint(t)
+        if trig == "fast":
+            # 正弦テーブルの最近傍参照
+            index = cp.rint(t * table_size + phase * (table_size / (2 * math.pi))).astype(cp.int32)
+            return table.take(index & (table_size - 1))
+        return cp.sin(2 * math.pi * t + phase)
+
+    pattern1 = grating(params["freq1"], params["angle1"], params["phase1"])
+    pattern2 = grating(params["freq2"], params["angle2"], params["phase2"])
+
+    # CPUに戻す
+    return cp.asnumpy(pattern1 * pattern2)
+
+
+def _get_numba_kernel():
+    """Numbaの並列カーネルを作成（初回のみコンパイル）"""
+    if "standard" not in _numba_kernels:
+        from numba import njit, prange
+
+        @njit(parallel=True)
+        def calculate_moire(x, y, out, freq1, freq2, cos1, sin1, cos2, sin2,
+                            phase1, phase2, two_pi, reduce_range, table):
+            for i in prange(y.shape[0]):
+                for j in range(x.shape[0]):
+                    t1 = freq1 * (x[j] * cos1 + y[i] * sin1)
+                    t2 = freq2 * (x[j] * cos2 + y[i] * sin2)
+                    if reduce_range:
+                        t1 -= math.floor(t1 + 0.5)
+                        t2 -= math.floor(t2 + 0.5)
+                    if table.shape[0] > 0:
+                        # 正弦テーブルの最近傍参照（位相は phase / 2π 周期）
+                        size = table.shape[0]
+                        k1 = int(math.floor((t1 + phase1 / two_pi) * size + 0.5)) & (size - 1)
+                        k2 = int(math.floor((t2 + phase2 / two_pi) * size + 0.5)) & (size - 1)
+                        out[i, j] = table[k1] * table[k2]
+                    else:
+                        out[i, j] = math.sin(two_pi * t1 + phase1) * math.sin(two_pi * t2 + phase2)
+            return out
+
+        _numba_kernels["standard"] = calculate_moire
+    return _numba_kernels["standard"]
+
+
+def calculate_standard_numba(width, height, params, precision=moire_engine.DEFAULT_PRECISION,
+                             trig=moire_engine.DEFAULT_TRIG, pattern_type="Standard"):
+    """Numbaを使用した並列CPU計算"""
+    dtype = moire_engine.get_dtype(precision)
+    # exact では空のテーブルを渡す
+    table = moire_engine.sine_table(dtype.type) if trig == "fast" else np.empty(0, dtype=dtype)
+    x, y = moire_engine.make_axes(width, height, moire_engine.PATTERN_EXTENTS[pattern_type], dtype)
+    out = np.empty((height, width), dtype=dtype)
+    cos1, sin1 = math.cos(math.radians(params["angle1"])), math.sin(math.radians(params["angle1"]))
+    cos2, sin2 = math.cos(math.radians(params["angle2"])), math.sin(math.radians(params["angle2"]))
+    kernel = _get_numba_kernel()
+    return kernel(x, y, out,
+                  dtype.type(params["freq1"]), dtype.type(params["freq2"]),
+                  dtype.type(cos1), dtype.type(sin1), dtype.type(cos2), dtype.type(sin2),
+                  dtype.type(params["phase1"]), dtype.type(params["phase2"]),
+                  dtype.type(2 * math.pi), dtype == np.float32, table)
+
+
+# OpenCLカーネルコード（real は float / double に置き換える）
+# FAST_TRIG では範囲縮小済みの引数に half_sin を使う（最大誤差 8192 ulp ≒ 4.9e-4）
+OPENCL_KERNEL = """
+#ifdef USE_DOUBLE
+#pragma OPENCL EXTENSION cl_khr_fp64 : enable
+typedef double real;
+#else
+typedef float real;
+#endif
+
+#ifdef FAST_TRIG
+#define SIN(v) ((real)half_sin((float)(v)))
+#else
+#define SIN(v) sin(v)
+#endif
+
+__kernel void calculate_moire(
+    __global const real* x_coords,
+    __global const real* y_coords,
+    __global real* result,
+    const real freq1, const real freq2,
+    const real cos1, const real sin1,
+    const real cos2, const real sin2,
+    const real phase1, const real phase2,
+    const int width, const int height
+) {
+    int gid = get_global_id(0);
+    int x = gid % width;
+    int y = gid / width;
+
+    if (y >= height) return;
+
+    real x_val = x_coords[x];
+    real y_val = y_coords[y];
+    const real two_pi = (real)6.283185307179586;
+
+    // 周期単位に変換して範囲縮小（float でも高周波で精度が落ちない）
+    real t1 = freq1 * (x_val * cos1 + y_val * sin1);
+    real t2 = freq2 * (x_val * cos2 + y_val * sin2);
+    t1 -= rint(t1);
+    t2 -= rint(t2);
+
+    // モアレパターン
+    result[gid] = SIN(two_pi * t1 + phase1) * SIN(two_pi * t2 + phase2);
+}
+"""
+
+
+def _get_opencl_program(precision, trig=moire_engine.DEFAULT_TRIG):
+    """OpenCLコンテキストとプログラムを取得（初回のみ初期化）"""
+    import pyopencl as cl
+
+    if "ctx" not in _opencl_state:
+        print("=== OpenCL Initialization ===")
+        # プラットフォームとデバイスを自動選択
+        platforms = cl.get_platforms()
+        print(f"Found {len(platforms)} OpenCL platforms:")
+        for i, p in enumerate(platforms):
+            print(f"  [{i}] {p.name}")
+
+        if not platforms:
+            raise Exception("No OpenCL platforms found")
+
+        # Appleプラットフォームを優先
+        platform = None
+        for p in platforms:
+            if 'Apple' in p.name:
+                platform = p
+                break
+        if not platform:
+            platform = platforms[0]  # 最初のプラットフォームを使用
+
+        print(f"Selected platform: {platform.name}")
+
+        # GPUデバイスを優先
+        devices = platform.get_devices(cl.device_type.GPU)
+        if not devices:
+            devices = platform.get_devices(cl.device_type.ALL)
+
+        print(f"Found {len(devices)} OpenCL devices:")
+        for i, d in enumerate(devices):
+            print(f"  [{i}] {d.name} ({d.type})")
+
+        if not devices:
+            raise Exception("No OpenCL devices found")
+
+        _opencl_state["ctx"] = cl.Context(devices)
+        _opencl_state["queue"] = cl.CommandQueue(_opencl_state["ctx"])
+        print(f"OpenCL context created with {len(devices)} device(s)")
+        print("=== OpenCL Ready ===")
+
+    # 精度・三角関数の方式ごとにカーネルをコンパイル
+    key = ("program", precision, trig)
+    if key not in _opencl_state:
+        options = ["-DUSE_DOUBLE"] if precision == "float64" else []
+        if trig == "fast":
+            options.append("-DFAST_TRIG")
+        _opencl_state[key] = cl.Program(_opencl_state["ctx"], OPENCL_KERNEL).build(options=options)
+    return _opencl_state["ctx"], _opencl_state["queue"], _opencl_state[key]
+
+
+def calculate_standard_opencl(width, height, params, precision=moire_engine.DEFAULT_PRECISION,
+                              trig=moire_engine.DEFAULT_TRIG, pattern_type="Standard"):
+    """OpenCLを使用したGPU計算"""
+    import pyopencl as cl
+
+    dtype = moire_engine.get_dtype(precision)
+    ctx, queue, program = _get_opencl_program(precision, trig)
+
+    # グリッド作成
+    x, y = moire_engine.make_axes(width, height, moire_engine.PATTERN_EXTENTS[pattern_type], dtype)
+
+    # GPUバッファを作成
+    x_buf = cl.Buffer(ctx, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=x)
+    y_buf = cl.Buffer(ctx, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=y)
+    result_buf = cl.Buffer(ctx, cl.mem_flags.WRITE_ONLY, size=width * height * dtype.itemsize)
+
+    angle1_rad = math.radians(params["angle1"])
+    angle2_rad = math.radians(params["angle2"])
+    real = dtype.type
+
+    # カーネルを実行
+    global_size = (width * height,)
+    program.calculate_moire(
+        queue, global_size, None,
+        x_buf, y_buf, result_buf,
+        real(params["freq1"]), real(params["freq2"]),
+        real(math.cos(angle1_rad)), real(math.sin(angle1_rad)),
+        real(math.cos(angle2_rad)), real(math.sin(angle2_rad)),
+        real(params["phase1"]), real(params["phase2"]),
+        np.int32(width), np.int32(height)
+    )
+
+    # 結果を取得
+    result = np.empty((height, width), dtype=dtype)
+    cl.enqueue_copy(queue, result, result_buf)
+    return result
+
+
+def _numexpr_sin(freq, u, phase, reduce_range):
+    """sin(2π * freq * u + phase) の numexpr 式（float32 では周期単位で範囲縮小）"""
+    if reduce_range:
+        return f"sin(two_pi * ({freq} * ({u}) - floor({freq} * ({u}) + half)) + {phase})"
+    return f"sin(two_pi * {freq} * ({u}) + {phase})"
+
+
+def _numexpr_formulas(pattern_type, reduce_range):
+    """パターンの numexpr 式（1段目: 共通項を out へ、2段目: out を読んで out へ）"""
+    def sin2pi(freq, u, phase):
+        return _numexpr_sin(freq, u, phase, reduce_range)
+
+    if pattern_type in ("Standard", "linear"):
+        return None, (f"{sin2pi('f1', 'x * c1 + y * s1', 'p1')} * "
+                      f"{sin2pi('f2', 'x * c2 + y * s2', 'p2')}")
+    if pattern_type == "Wave":
+        # out = 歪み係数
+        X1, Y1 = "(x * c1 + y * s1) * out", "(-x * s1 + y * c1) * out"
+        X2, Y2 = "(x * c2 + y * s2) * out", "(-x * s2 + y * c2) * out"
+        pattern1 = (f"({sin2pi('f1', X1, 'p1')} + {sin2pi('f1b', Y1, 'p1b')} + "
+                    f"complexity * {sin2pi('f1c', f'{X1} + {Y1}', 'p1c')})")
+        pattern2 = (f"({sin2pi('f2', X2, 'p2')} + {sin2pi('f2b', Y2, 'p2b')} + "
+                    f"complexity * {sin2pi('f2c', f'{X2} - {Y2}', 'p2c')})")
+        return "one + distortion * sin(x * y * half)", f"{pattern1} * {pattern2}"
+    if pattern_type == "Tree Rings":
+        # out = 歪んだ半径
+        pattern1 = (f"({sin2pi('f1', 'out', 'p1')} * {sin2pi('f1b', 'x * c1 + y * s1', 'p1b')} + "
+                    f"complexity * {sin2pi('f1c', 'out', 'p1c')})")
+        pattern2 = (f"({sin2pi('f2', 'out', 'p2')} * {sin2pi('f2b', '-x * s2 + y * c2', 'p2b')} + "
+                    f"complexity * {sin2pi('f2c', 'out', 'p2c')})")
+        return ("sqrt(x * x + y * y) * (one + distortion * sin(x * two) * cos(y * two))",
+                f"{pattern1} * {pattern2}")
+    if pattern_type == "circular":
+        # out = 中心からの距離
+        return ("sqrt((x - cx) ** 2 + (y - cy) ** 2)",
+                f"{sin2pi('f1', 'out', 'p1')} * {sin2pi('f2', 'out', 'p2')}")
+    if pattern_type == "radial":
+        # out = 中心からの角度
+        return ("arctan2(y - cy, x - cx)",
+                f"{sin2pi('f1', 'out + a1', 'p1')} * {sin2pi('f2', 'out + a2', 'p2')}")
+    if pattern_type == "spiral":
+        # out = 中心からの角度
+        r = "sqrt((x - cx) ** 2 + (y - cy) ** 2)"
+        return ("arctan2(y - cy, x - cx)",
+                f"{sin2pi('one', f'{r} + f1 * out + p1', 'zero')} * "
+                f"{sin2pi('one', f'{r} + f2 * out + p2', 'zero')}")
+    raise ValueError(f"Unknown pattern type: {pattern_type}")
+
+
+def _numexpr_constants(pattern_type, params):
+    """numexpr 式で使う定数（パターン固有の係数を事前に計算）"""
+    p = params
+    cos1, sin1 = math.cos(math.radians(p["angle1"])), math.sin(math.radians(p["angle1"]))
+    cos2, sin2 = math.cos(math.radians(p["angle2"])), math.sin(math.radians(p["angle2"]))
+    constants = {
+        "two_pi": 2 * math.pi, "half": 0.5, "one": 1.0, "two": 2.0, "zero": 0.0,
+        "f1": p["freq1"], "f2": p["freq2"], "p1": p["phase1"], "p2": p["phase2"],
+        "c1": cos1, "s1": sin1, "c2": cos2, "s2": sin2,
+        "cx": p["center_x"], "cy": p["center_y"],
+        "a1": math.radians(p["angle1"]), "a2": math.radians(p["angle2"]),
+    }
+    if pattern_type == "Wave":
+        complexity = p["wave_complexity"]
+        complexity_factor = 1.0 + complexity * 2.0
+        constants.update(
+            complexity=complexity, distortion=p["wave_distortion"],
+            f1b=p["freq1"] * 0.5, p1b=p["phase1"] * 0.7,
+            f1c=p["freq1"] * complexity_factor, p1c=p["phase1"] * 1.5,
+            f2b=p["freq2"] * 0.7, p2b=p["phase2"] * 1.3,
+            f2c=p["freq2"] * complexity_factor, p2c=p["phase2"] * 0.8)
+    elif pattern_type == "Tree Rings":
+        complexity = p["rings_complexity"]
+        complexity_factor = 1.0 + complexity * 3.0
+        constants.update(
+            complexity=complexity, distortion=p["rings_distortion"],
+            f1b=p["freq1"] * 0.3, p1b=p["phase1"] * 0.5,
+            f1c=p["freq1"] * complexity_factor, p1c=p["phase1"] * 1.2,
+            f2b=p["freq2"] * 0.4, p2b=p["phase2"] * 0.8,
+            f2c=p["freq2"] * complexity_factor, p2c=p["phase2"] * 0.6)
+    return constants
+
+
+def calculate_numexpr(pattern_type, width, height, params,
+                      precision=moire_engine.DEFAULT_PRECISION, out=None):
+    """numexpr によるマルチスレッド・融合演算でパターンを計算
+
+    式は (パターン, 精度) ごとに固定の文字列なので numexpr 内部で1回だけコンパイルされる。
+    x は1行、y は1列のままブロードキャストするので meshgrid も中間配列も作らず、
+    結果は out に直接書き込まれる。
+    """
+    import numexpr as ne
+
+    dtype = moire_engine.get_dtype(precision)
+    x, y = moire_engine.make_axes(width, height, moire_engine.PATTERN_EXTENTS[pattern_type], dtype)
+    if out is None:
+        out = np.empty((height, width), dtype=dtype)
+
+    # 定数も配列と同じ dtype にしないと float32 が float64 に昇格する
+    local_dict = {name: dtype.type(value)
+                  for name, value in _numexpr_constants(pattern_type, params).items()}
+    local_dict["x"] = x[np.newaxis, :]
+    local_dict["y"] = y[:, np.newaxis]
+
+    prepare, formula = _numexpr_formulas(pattern_type, dtype == np.float32)
+    if prepare is not None:
+        ne.evaluate(prepare, local_dict=local_dict, out=out)
+    local_dict["out"] = out
+    ne.evaluate(formula, local_dict=local_dict, out=out)
+    return out
+
+
+def render_gray(backend, pattern_type, width, height, params,
+                precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG):
+    """指定バックエンドで1フレームを8bitグレースケールとして描画"""
+    if backend == "CPU":
+        return moire_engine.render_strips(pattern_type, width, height, params,
+                                          precision=precision, trig=trig)
+    if backend == "NumExpr":
+        return moire_engine.to_gray(calculate_numexpr(pattern_type, width, height, params, precision))
+    if backend not in GPU_BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if moire_engine.get_pattern_function(pattern_type) is not moire_engine.standard_pattern:
+        raise ValueError(f"{backend} backend supports only linear patterns, not {pattern_type}")
+    return moire_engine.to_gray(calculate_standard(backend, width, height, params, precision, trig,
+                                                   pattern_type))
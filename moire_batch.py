@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Moire Batch Runner
+マニフェスト（JSON / TOML）に並べた描画ジョブをプロセスプールでまとめて実行する
+
+マニフェストの例（TOML）:
+    [defaults]
+    size = "1920x1080"
+
+    [[jobs]]
+    pattern = "Wave"
+    params = { freq1 = 8.0, freq2 = 9.5 }
+    output = "stills/wave.png"
+
+    [[jobs]]
+    pattern = "Standard"
+    frames = 600
+    fps = 60
+    output = "clips/standard.mfa"
+
+frames が 1 なら静止画（moire_io.save_image）、2 以上なら位相アニメーション
+（moire_export.export_animation）。相対パスの出力はマニフェストのディレクトリが基準。
+完了したジョブは マニフェスト名.state.json に設定ごと記録し、出力があって設定が
+変わっていなければ次回は飛ばすので、中断しても続きから再開できる。
+ジョブとステージごとの所要時間は マニフェスト名.report.json に書き出す。
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import moire_engine
+import moire_export
+import moire_io
+
+# 完了したジョブの記録と、所要時間のレポートのファイル名（マニフェスト名に付け足す）
+STATE_SUFFIX = ".state.json"
+REPORT_SUFFIX = ".report.json"
+
+# ワーカーの起動方式（呼び出し元で Numba の並列スレッドなどが動いていても安全なように
+# fork しない）。forkserver がない環境では spawn
+WORKER_START_METHOD = ("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                       else "spawn")
+
+# マニフェストで省略したときの値
+JOB_DEFAULTS = {
+    "pattern": "Standard",
+    "params": {},
+    "size": [800, 800],
+    "frames": 1,
+    "fps": moire_export.DEFAULT_FPS,
+    "schedule": None,
+    "precision": moire_engine.DEFAULT_PRECISION,
+    "trig": moire_engine.DEFAULT_TRIG,
+}
+
+
+def read_manifest_file(path):
+    """マニフェストを辞書として読み込む（.toml は tomllib、それ以外は JSON）"""
+    if os.path.splitext(path)[1].lower() == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML manifests need Python 3.11 or later (tomllib)") from None
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_job_size(size):
+    """"WIDTHxHEIGHT"・[幅, 高さ]・1辺の長さのいずれかを (width, height) に変換"""
+    if isinstance(size, str):
+        width, _, height = size.lower().partition("x")
+        return int(width), int(height or width)
+    if isinstance(size, int):
+        return size, size
+    width, height = size
+    return int(width), int(height)
+
+
+def normalize_job(job, defaults, base):
+    """省略値を補い、内容を確認したジョブの辞書（不正なら ValueError）"""
+    unknown = set(job) - set(JOB_DEFAULTS) - {"name", "output"}
+    if unknown:
+        raise ValueError(f"Unknown job keys: {', '.join(sorted(unknown))}")
+    merged = dict(JOB_DEFAULTS, **defaults)
+    merged.update(job)
+    if "output" not in merged:
+        raise ValueError(f"Job {job.get('name', '?')} has no output")
+    moire_engine.get_pattern_function(merged["pattern"])
+    width, height = parse_job_size(merged["size"])
+    frames = int(merged["frames"])
+    if width <= 0 or height <= 0 or frames <= 0:
+        raise ValueError(f"Job {merged['output']} needs a positive size and frame count")
+    output = os.path.join(base, merged["output"])
+    return {
+        "name": merged.get("name") or os.path.basename(merged["output"].rstrip("/")),
+        "pattern": merged["pattern"],
+        "params": moire_engine.make_params(**merged["params"]),
+        "size": [width, height],
+        "frames": frames,
+        "fps": float(merged["fps"]),
+        "schedule": merged["schedule"],
+        "precision": merged["precision"],
+        "trig": merged["trig"],
+        "output": output,
+    }
+
+
+def load_manifest(path):
+    """マニフェストのジョブの一覧（出力先が重複していれば ValueError）"""
+    manifest = read_manifest_file(path)
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get("defaults", {})
+    jobs = [normalize_job(job, defaults, base) for job in manifest.get("jobs", [])]
+    outputs = [job["output"] for job in jobs]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Several jobs write to the same output")
+    return jobs
+
+
+def job_config(job):
+    """出力内容を決める設定（状態ファイルの記録と一致すれば描画し直さない）"""
+    return {key: value for key, value in job.items() if key != "name"}
+
+
+def estimate_cost(job):
+    """描画の重さの見積もり（画素数 x フレーム数 x パターンの一時配列の数）"""
+    width, height = job["size"]
+    return width * height * job["frames"] * moire_engine.PATTERN_TEMPORARIES[job["pattern"]]
+
+
+def load_state(path):
+    """完了したジョブの記録（出力先 -> 設定）"""
+    try:
+        with open(path + STATE_SUFFIX) as f:
+            return json.load(f).get("done", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, done):
+    """記録を書き出す（書きかけで壊れないよう置き換えで保存）"""
+    state_path = path + STATE_SUFFIX
+    with open(state_path + ".tmp", "w") as f:
+        json.dump({"done": done}, f, indent=1)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def is_up_to_date(job, done):
+    """出力が存在し、前回完了したときと設定が同じか"""
+    return os.path.exists(job["output"]) and done.get(job["output"]) == job_config(job)
+
+
+def run_job(job):
+    """ワーカープロセスで1つのジョブを実行し、ステージごとの所要時間の辞書を返す"""
+    width, height = job["size"]
+    output = job["output"]
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    if job["frames"] == 1:
+        image = moire_engine.render(job["pattern"], width, height, job["params"],
+                                    precision=job["precision"], trig=job["trig"])
+        rendered = time.perf_counter()
+        # 書きかけのファイルが最新に見えないよう一時ファイルから置き換える
+        root, ext = os.path.splitext(output)
+        moire_io.save_image(root + ".tmp" + ext, image)
+        os.replace(root + ".tmp" + ext, output)
+        return {"render": rendered - start, "write": time.perf_counter() - rendered}
+    # 並列化はジョブ単位で行うので、アニメーションはこのプロセスの中で描画する
+    stats = moire_export.export_animation(
+        job["pattern"], width, height, job["params"], job["frames"], output, fps=job["fps"],
+        schedule=job["schedule"], precision=job["precision"], trig=job["trig"])
+    return {"render": stats["compute_wait"], "write": stats["encode_wait"],
+            "other": stats["elapsed"] - stats["compute_wait"] - stats["encode_wait"]}
+
+
+def run_manifest(path, workers=None, force=False, progress=None):
+    """マニフェストの全ジョブを実行してレポートの辞書を返す
+
+    重いジョブから順にプールへ渡すので、最後に長いジョブだけが残ることが少ない。
+    force なら最新の出力も描画し直す。progress(report) は各ジョブの終了時に呼ばれる。
+    """
+    start = time.perf_counter()
+    jobs = load_manifest(path)
+    done = load_state(path)
+    pending = []
+    results = []
+    for job in jobs:
+        entry = {"name": job["name"], "output": job["output"], "cost": estimate_cost(job)}
+        if not force and is_up_to_date(job, done):
+            entry.update(status="skipped", elapsed=0.0, stages={})
+        else:
+            pending.append((job, entry))
+        results.append(entry)
+    pending.sort(key=lambda item: item[1]["cost"], reverse=True)
+    planned = time.perf_counter()
+
+    context = multiprocessing.get_context(WORKER_START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {}
+        for job, entry in pending:
+            futures[executor.submit(run_job, job)] = (job, entry, time.perf_counter())
+        try:
+            for future in as_completed(futures):
+                job, entry, submitted = futures[future]
+                try:
+                    stages = future.result()
+                except Exception as e:
+                    entry.update(status="failed", error=f"{type(e).__name__}: {e}", stages={})
+                else:
+                    entry.update(status="rendered", stages=stages)
+                    # 1つ終わるごとに記録するので、中断しても完了分は飛ばせる
+                    done[job["output"]] = job_config(job)
+                    save_state(path, done)
+                # ジョブの実時間（プールで待った時間を除く）
+                entry["elapsed"] = sum(entry["stages"].values())
+                entry["finished_after"] = time.perf_counter() - submitted
+                if progress is not None:
+                    progress(entry)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    finished = time.perf_counter()
+    totals = {}
+    for entry in results:
+        for stage, seconds in entry["stages"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    report = {
+        "manifest": os.path.abspath(path),
+        "workers": workers or os.cpu_count(),
+        "elapsed": finished - start,
+        "run_stages": {"plan": planned - start, "execute": finished - planned},
+        "job_stages": totals,
+        "counts": {status: sum(entry["status"] == status for entry in results)
+                   for status in ("rendered", "skipped", "failed")},
+        "jobs": results,
+    }
+    with open(path + REPORT_SUFFIX, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Moire Frame Cache
+パラメータをキーにした2段のフレームキャッシュ（メモリの LRU + ディスクの圧縮ストア）
+
+スライダーの往復やパターンタイプの切り替え、リセット・プリセットでは同じ
+パラメータの組み合わせが何度も描画される。描画済みの uint8 フレームを
+量子化したパラメータ・パターンタイプ・解像度・精度・カラーマップのハッシュで保存し、
+メモリになければディスク（セッションをまたいで残る）から読み込む。
+"""
+
+import collections
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import moire_engine
+
+# メモリに保持するフレームの合計バイト数
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+
+# ディスクのストア（cache_dir を指定したときだけ使う）
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "moire", "frames")
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+
+# パラメータの量子化の刻み（浮動小数点の誤差で別のキーにならないように）
+PARAM_QUANTUM = 1e-4
+
+# ディスクに書くときの zlib 圧縮レベル（速度優先）
+DISK_LEVEL = 1
+
+# ディスク上のフレームの先頭: マジック, 高さ, 幅, チャンネル数（0 なら2次元）
+FRAME_MAGIC = b"MFRM"
+FRAME_HEADER = struct.Struct("<4sIII")
+
+
+def quantize_params(pattern_type, params, quantum=PARAM_QUANTUM):
+    """パターンに影響するパラメータだけを量子化した辞書"""
+    return {name: int(round(params[name] / quantum))
+            for name in moire_engine.PATTERN_PARAMS[pattern_type]}
+
+
+def frame_key(pattern_type, width, height, params, precision=moire_engine.DEFAULT_PRECISION,
+              trig=moire_engine.DEFAULT_TRIG, backend="CPU", colormap="gray", **extra):
+    """フレームの内容を決める値のハッシュ（extra には描画解像度など表示側の設定を渡す）"""
+    content = {
+        "pattern_type": pattern_type,
+        "params": quantize_params(pattern_type, params),
+        "size": [width, height],
+        "precision": precision,
+        "trig": trig,
+        "backend": backend,
+        "colormap": colormap,
+        "extra": extra,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def encode_frame(frame):
+    """uint8 フレームをディスク用のバイト列（ヘッダー + zlib）に変換"""
+    channels = frame.shape[2] if frame.ndim == 3 else 0
+    header = FRAME_HEADER.pack(FRAME_MAGIC, frame.shape[0], frame.shape[1], channels)
+    return header + zlib.compress(np.ascontiguousarray(frame).tobytes(), DISK_LEVEL)
+
+
+def decode_frame(data):
+    """encode_frame の逆（壊れていれば ValueError）"""
+    magic, height, width, channels = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Not a cached moire frame")
+    shape = (height, width, channels) if channels else (height, width)
+    try:
+        pixels = zlib.decompress(data[FRAME_HEADER.size:])
+    except zlib.error as e:
+        raise ValueError(f"Corrupt cached frame: {e}") from None
+    return np.frombuffer(pixels, dtype=np.uint8).reshape(shape)
+
+
+class FrameCache:
+    """メモリの LRU（バイト数で上限）と、任意のディスクストアの2段キャッシュ
+
+    get で返すフレームは読み取り専用（キャッシュ内のものを共有するため）。
+    ディスクへの書き込みはバックグラウンドのスレッドで行う。
+    """
+
+    def __init__(self, memory_bytes=DEFAULT_MEMORY_BYTES, cache_dir=None,
+                 disk_bytes=DEFAULT_DISK_BYTES):
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = memory_bytes
+        self.cached_bytes = 0
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+        self.disk_used = None
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, key):
+        """キャッシュのフレーム（なければ None）"""
+        frame = self.memory.get(key)
+        if frame is not None:
+            self.memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return frame
+        frame = self._load(key)
+        if frame is not None:
+            self.stats["disk_hits"] += 1
+            self._store_memory(key, frame)
+            return frame
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, frame):
+        """uint8 フレーム (H, W) / (H, W, C) を保存（呼び出し元の配列はコピーする）"""
+        if frame.dtype != np.uint8 or frame.ndim not in (2, 3):
+            raise ValueError(f"Only uint8 frames can be cached, not {frame.dtype} {frame.shape}")
+        frame = np.array(frame)
+        frame.setflags(write=False)
+        self._store_memory(key, frame)
+        if self.cache_dir is not None:
+            self.writer.submit(self._save, key, frame)
+
+    def get_or_render(self, key, render):
+        """キャッシュになければ render() で描画して保存"""
+        frame = self.get(key)
+        if frame is None:
+            frame = render()
+            self.put(key, frame)
+        return frame
+
+    def _store_memory(self, key, frame):
+        """LRU に追加し、上限を超えた分を古い順に捨てる"""
+        if frame.nbytes > self.memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.cached_bytes -= old.nbytes
+        self.memory[key] = frame
+        self.cached_bytes += frame.nbytes
+        while self.cached_bytes > self.memory_bytes:
+            _, old = self.memory.popitem(last=False)
+            self.cached_bytes -= old.nbytes
+
+    def _disk_path(self, key):
+        """ストア内のパス（先頭2文字でディレクトリを分ける）"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.frame")
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                frame = decode_frame(f.read())
+            # 最近使ったものとして残す（削除は更新時刻の古い順）
+            os.utime(path)
+        except (OSError, ValueError, struct.error):
+            return None
+        return frame
+
+    def _save(self, key, frame):
+        """書き込みスレッド: 置き換えで保存し、上限を超えたら古いものから消す"""
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        data = encode_frame(frame)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Frame cache write failed: {e}")
+            return
+        with self.lock:
+            if self.disk_used is None:
+                self.disk_used = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self.disk_used += len(data)
+            if self.disk_used > self.disk_bytes:
+                self.prune_disk()
+
+    def _disk_entries(self):
+        """ストアの (更新時刻, サイズ, パス) の一覧"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".frame"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def prune_disk(self):
+        """ディスクの使用量を上限の 3/4 まで、使われていない順に減らす"""
+        entries = sorted(self._disk_entries())
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used <= self.disk_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            used -= size
+        self.disk_used = used
+
+    def hits(self):
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    def summary(self):
+        """情報パネル用の1行"""
+        total = self.hits() + self.stats["misses"]
+        rate = 100.0 * self.hits() / total if total else 0.0
+        return (f"Cache: {self.hits()} hits ({self.stats['disk_hits']} disk), "
+                f"{self.stats['misses']} misses ({rate:.0f}%), "
+                f"{self.cached_bytes / (1024 * 1024):.0f} MB")
+
+    def close(self):
+        """書きかけのディスク書き込みを待つ"""
+        self.writer.shutdown(wait=True)
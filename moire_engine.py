@@ -0,0 +1,782 @@
+#!/usr/bin/env python3
+"""
+Moire Pattern Engine
+GUIに依存しないモアレパターン計算エンジン
+"""
+
+import functools
+import math
+
+import numpy as np
+
+# パターンタイプごとの座標範囲（[-extent, extent]）
+PATTERN_EXTENTS = {
+    "Standard": 2.0,
+    "Wave": 3.0,
+    "Tree Rings": 2.0,
+    "linear": 5.0,
+    "circular": 5.0,
+    "radial": 5.0,
+    "spiral": 5.0,
+}
+
+# 1ピクセルあたりに同時に生存する一時配列の数（メモリ見積もり用）
+PATTERN_TEMPORARIES = {
+    "Standard": 8,
+    "Wave": 20,
+    "Tree Rings": 20,
+    "linear": 8,
+    "circular": 8,
+    "radial": 10,
+    "spiral": 10,
+}
+
+# デフォルトパラメータ（pyqt_moire.py / advanced_moire.py の初期値）
+DEFAULT_PARAMS = {
+    "freq1": 8.0,
+    "freq2": 9.0,
+    "angle1": 0.0,
+    "angle2": 45.0,
+    "phase1": 0.0,
+    "phase2": 0.0,
+    "wave_complexity": 0.5,
+    "wave_distortion": 0.3,
+    "rings_distortion": 0.2,
+    "rings_complexity": 0.4,
+    "center_x": 0.0,
+    "center_y": 0.0,
+    "radius": 3.0,
+}
+
+# パターンタイプごとに出力へ影響するパラメータ（キャッシュのキーなどに使う）
+_LINEAR_PARAMS = ("freq1", "freq2", "angle1", "angle2", "phase1", "phase2")
+_POLAR_PARAMS = ("freq1", "freq2", "phase1", "phase2", "center_x", "center_y")
+PATTERN_PARAMS = {
+    "Standard": _LINEAR_PARAMS,
+    "Wave": _LINEAR_PARAMS + ("wave_complexity", "wave_distortion"),
+    "Tree Rings": _LINEAR_PARAMS + ("rings_distortion", "rings_complexity"),
+    "linear": _LINEAR_PARAMS,
+    "circular": _POLAR_PARAMS,
+    "radial": _POLAR_PARAMS + ("angle1", "angle2"),
+    "spiral": _POLAR_PARAMS,
+}
+
+# 中心 (center_x, center_y) を持ち、中心の移動が平行移動になるパターン
+CENTERED_PATTERNS = ("circular", "radial", "spiral")
+
+# 計算精度（出力は8bitなので float32 で十分）
+PRECISIONS = {
+    "float64": np.float64,
+    "float32": np.float32,
+}
+DEFAULT_PRECISION = "float64"
+
+# 三角関数の計算方式
+# exact: np.sin
+# fast:  4096要素の正弦テーブルを最近傍で参照（線形格子は32bit位相アキュムレータ）
+#        sin 1回あたりの絶対誤差は π / SINE_TABLE_SIZE（約7.7e-4）に float32 の
+#        丸め誤差を加えても FAST_TRIG_MAX_ERROR 以下で、8bit出力では1階調以内
+#        歪み係数は座標に掛かり周波数倍に増幅されるため常に exact で計算する
+TRIG_MODES = ("exact", "fast")
+DEFAULT_TRIG = "exact"
+SINE_TABLE_BITS = 12
+SINE_TABLE_SIZE = 1 << SINE_TABLE_BITS
+FAST_TRIG_MAX_ERROR = 1e-3
+
+# 対称性判定で位相・中心を0とみなす許容誤差
+SYMMETRY_TOLERANCE = 1e-9
+
+# 周期タイル検出で許容する出力全体での位相ずれ（周期単位）
+PERIODIC_TOLERANCE = 1e-6
+
+# タイルの繰り返しを探索する最大回数（テクスチャ書き出し用）
+MAX_TILE_REPEATS = 256
+
+# ストリップ描画のデフォルト作業領域（バイト）
+DEFAULT_SCRATCH_BYTES = 64 * 1024 * 1024
+
+
+def make_params(**overrides):
+    """デフォルト値を補ったパラメータ辞書を作成"""
+    unknown = set(overrides) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    params = dict(DEFAULT_PARAMS)
+    # NumPyスカラーが混ざると float32 配列が float64 に昇格するので Python の float に揃える
+    params.update((key, float(value)) for key, value in overrides.items())
+    return params
+
+
+def get_dtype(precision):
+    """精度名に対応する NumPy の dtype を取得"""
+    try:
+        return np.dtype(PRECISIONS[precision])
+    except KeyError:
+        raise ValueError(f"Unknown precision: {precision}") from None
+
+
+def make_axes(width, height, extent, dtype=np.float64):
+    """x, y の1次元座標軸を作成"""
+    x = np.linspace(-extent, extent, width, dtype=dtype)
+    y = np.linspace(-extent, extent, height, dtype=dtype)
+    return x, y
+
+
+def _scalar_or_array(value):
+    """スカラーは Python の float に（配列の dtype を保つため）、配列はそのまま返す
+
+    パラメータのスイープでは角度などが (N, 1, 1) の配列で渡される。
+    """
+    return value if np.ndim(value) else float(value)
+
+
+def _rotation(angle):
+    """角度（度）から cos, sin を取得（スカラーなら Python の float）"""
+    angle_rad = np.radians(angle)
+    return _scalar_or_array(np.cos(angle_rad)), _scalar_or_array(np.sin(angle_rad))
+
+
+@functools.lru_cache(maxsize=None)
+def sine_table(dtype=np.float64):
+    """高速三角関数用の正弦テーブル（SINE_TABLE_SIZE 要素、1周期分）"""
+    k = np.arange(SINE_TABLE_SIZE)
+    table = np.sin(2 * np.pi * k / SINE_TABLE_SIZE).astype(dtype)
+    table.flags.writeable = False
+    return table
+
+
+def _fixed_phase(cycles):
+    """周期単位の位相を32bit固定小数点（1周期 = 2**32）に変換"""
+    cycles = np.asarray(cycles, dtype=np.float64)
+    return np.mod(np.rint(cycles * 2.0**32), 2.0**32).astype(np.uint32)
+
+
+def _iadd(array, value):
+    """array に value を加算して同じ配列を返す"""
+    array += value
+    return array
+
+
+def sin2pi(freq, u, phase, trig="exact"):
+    """sin(2π * freq * u + phase) を計算
+
+    phase は (K, 1, 1) などの配列でもよく、その場合はフレーム軸付きで放送される。
+    float32 では freq * u を周期単位で [-0.5, 0.5] に範囲縮小してから sin を取る。
+    高周波・広範囲でも位相誤差が周期数に比例して増えない。
+    trig="fast" では正弦テーブルの最近傍参照を使う（誤差は FAST_TRIG_MAX_ERROR 以下）。
+    """
+    if trig == "fast":
+        table = sine_table(u.dtype.type)
+        if u.dtype == np.float32:
+            # テーブル番号の丸め誤差が周期数に比例しないよう先に範囲縮小
+            index = freq * u
+            index -= np.rint(index)
+            index *= SINE_TABLE_SIZE
+        else:
+            index = (freq * SINE_TABLE_SIZE) * u
+        offset = phase * (SINE_TABLE_SIZE / (2 * np.pi))
+        # 位相が配列（フレーム軸付き）なら放送で新しい配列を作る
+        index = index + offset if np.ndim(phase) else _iadd(index, offset)
+        np.rint(index, out=index)
+        # 整数化すれば周期の折り返しはビットマスクだけで済む
+        # （float64 は範囲縮小しないので、大きな引数でも溢れないよう64bitにする）
+        index = index.astype(np.int32 if u.dtype == np.float32 else np.int64)
+        index &= SINE_TABLE_SIZE - 1
+        return table.take(index)
+    if trig != "exact":
+        raise ValueError(f"Unknown trig mode: {trig}")
+    if u.dtype == np.float32:
+        t = freq * u
+        t -= np.rint(t)
+        t *= 2 * np.pi
+        t = t + phase if np.ndim(phase) else _iadd(t, phase)
+        return np.sin(t, out=t)
+    return np.sin(2 * np.pi * freq * u + phase)
+
+
+def standard_pattern(X, Y, p, trig="exact"):
+    """標準モアレパターン（2つの線形格子の積）"""
+    # 第1パターン
+    cos1, sin1 = _rotation(p["angle1"])
+    rotated_x1 = X * cos1 + Y * sin1
+    pattern1 = sin2pi(p["freq1"], rotated_x1, p["phase1"], trig)
+
+    # 第2パターン
+    cos2, sin2 = _rotation(p["angle2"])
+    rotated_x2 = X * cos2 + Y * sin2
+    pattern2 = sin2pi(p["freq2"], rotated_x2, p["phase2"], trig)
+
+    # モアレパターン
+    return pattern1 * pattern2
+
+
+def standard_pattern_accumulator(x, y, p):
+    """標準モアレパターンの高速版（位相アキュムレータ + 正弦テーブル）
+
+    線形格子の位相は x と y の和に分解できるので、1次元の32bit固定小数点位相を
+    行・列ごとに1回だけ計算し、2次元では uint32 の加算（折り返しは自動）と
+    シフトだけでテーブルを引く。
+    """
+    table = sine_table(x.dtype.type)
+    shift = np.uint32(32 - SINE_TABLE_BITS)
+    # 最近傍参照になるよう半ステップ分ずらす
+    half_step = 0.5 / SINE_TABLE_SIZE
+
+    patterns = []
+    for freq, angle, phase in ((p["freq1"], p["angle1"], p["phase1"]),
+                               (p["freq2"], p["angle2"], p["phase2"])):
+        cos_a, sin_a = _rotation(angle)
+        phase_x = _fixed_phase(freq * cos_a * x.astype(np.float64)
+                               + phase / (2 * np.pi) + half_step)
+        phase_y = _fixed_phase(freq * sin_a * y.astype(np.float64))
+        accumulator = np.add.outer(phase_y, phase_x)
+        accumulator >>= shift
+        patterns.append(table.take(accumulator))
+
+    return patterns[0] * patterns[1]
+
+
+def wave_pattern(X, Y, p, trig="exact"):
+    """波模様パターン"""
+    freq1, freq2 = p["freq1"], p["freq2"]
+    phase1, phase2 = p["phase1"], p["phase2"]
+    complexity = p["wave_complexity"]
+    distortion = p["wave_distortion"]
+
+    # 回転した座標
+    cos1, sin1 = _rotation(p["angle1"])
+    cos2, sin2 = _rotation(p["angle2"])
+    X1 = X * cos1 + Y * sin1
+    Y1 = -X * sin1 + Y * cos1
+    X2 = X * cos2 + Y * sin2
+    Y2 = -X * sin2 + Y * cos2
+
+    # 歪み効果を追加（座標に掛かり周波数倍に増幅されるので常に正確な sin を使う）
+    distortion_factor = 1.0 + distortion * np.sin(X * Y * 0.5)
+    X1 *= distortion_factor
+    Y1 *= distortion_factor
+    X2 *= distortion_factor
+    Y2 *= distortion_factor
+
+    # 複雑さに基づいて波の数を調整
+    complexity_factor = 1.0 + complexity * 2.0
+
+    pattern1 = (sin2pi(freq1, X1, phase1, trig) +
+               sin2pi(freq1 * 0.5, Y1, phase1 * 0.7, trig) +
+               complexity * sin2pi(freq1 * complexity_factor, X1 + Y1, phase1 * 1.5, trig))
+
+    pattern2 = (sin2pi(freq2, X2, phase2, trig) +
+               sin2pi(freq2 * 0.7, Y2, phase2 * 1.3, trig) +
+               complexity * sin2pi(freq2 * complexity_factor, X2 - Y2, phase2 * 0.8, trig))
+
+    return pattern1 * pattern2
+
+
+def tree_rings_pattern(X, Y, p, trig="exact"):
+    """木の年輪パターン"""
+    freq1, freq2 = p["freq1"], p["freq2"]
+    phase1, phase2 = p["phase1"], p["phase2"]
+    distortion = p["rings_distortion"]
+    complexity = p["rings_complexity"]
+
+    # 中心からの距離（歪み効果付き、歪みは常に正確な sin/cos を使う）
+    R = np.sqrt(X**2 + Y**2)
+    distortion_factor = 1.0 + distortion * np.sin(X * 2.0) * np.cos(Y * 2.0)
+    R_distorted = R * distortion_factor
+
+    # 回転した座標
+    cos1, sin1 = _rotation(p["angle1"])
+    cos2, sin2 = _rotation(p["angle2"])
+    X1 = X * cos1 + Y * sin1
+    Y2 = -X * sin2 + Y * cos2
+
+    # 複雑さに基づいて追加の波を生成
+    complexity_factor = 1.0 + complexity * 3.0
+
+    pattern1 = (sin2pi(freq1, R_distorted, phase1, trig) *
+               sin2pi(freq1 * 0.3, X1, phase1 * 0.5, trig) +
+               complexity * sin2pi(freq1 * complexity_factor, R_distorted, phase1 * 1.2, trig))
+
+    pattern2 = (sin2pi(freq2, R_distorted, phase2, trig) *
+               sin2pi(freq2 * 0.4, Y2, phase2 * 0.8, trig) +
+               complexity * sin2pi(freq2 * complexity_factor, R_distorted, phase2 * 0.6, trig))
+
+    return pattern1 * pattern2
+
+
+def circular_pattern(X, Y, p, trig="exact"):
+    """円形パターン"""
+    r = np.sqrt((X - p["center_x"])**2 + (Y - p["center_y"])**2)
+    pattern1 = sin2pi(p["freq1"], r, p["phase1"], trig)
+    pattern2 = sin2pi(p["freq2"], r, p["phase2"], trig)
+    return pattern1 * pattern2
+
+
+def radial_pattern(X, Y, p, trig="exact"):
+    """ラジアルパターン"""
+    theta = np.arctan2(Y - p["center_y"], X - p["center_x"])
+    theta1 = theta + _scalar_or_array(np.radians(p["angle1"]))
+    theta2 = theta + _scalar_or_array(np.radians(p["angle2"]))
+    pattern1 = sin2pi(p["freq1"], theta1, p["phase1"], trig)
+    pattern2 = sin2pi(p["freq2"], theta2, p["phase2"], trig)
+    return pattern1 * pattern2
+
+
+def spiral_pattern(X, Y, p, trig="exact"):
+    """スパイラルパターン"""
+    r = np.sqrt((X - p["center_x"])**2 + (Y - p["center_y"])**2)
+    theta = np.arctan2(Y - p["center_y"], X - p["center_x"])
+    spiral1 = r + p["freq1"] * theta + p["phase1"]
+    spiral2 = r + p["freq2"] * theta + p["phase2"]
+    pattern1 = sin2pi(1.0, spiral1, 0.0, trig)
+    pattern2 = sin2pi(1.0, spiral2, 0.0, trig)
+    return pattern1 * pattern2
+
+
+# パターンタイプ -> 計算関数
+PATTERNS = {
+    "Standard": standard_pattern,
+    "Wave": wave_pattern,
+    "Tree Rings": tree_rings_pattern,
+    "linear": standard_pattern,
+    "circular": circular_pattern,
+    "radial": radial_pattern,
+    "spiral": spiral_pattern,
+}
+
+
+def get_pattern_function(pattern_type):
+    """パターンタイプに対応する計算関数を取得"""
+    try:
+        return PATTERNS[pattern_type]
+    except KeyError:
+        raise ValueError(f"Unknown pattern type: {pattern_type}") from None
+
+
+def _carrier_parity(phase):
+    """sin(u + phase) の u -> -u に対する偶奇（1: 偶, -1: 奇, 0: なし）"""
+    if abs(math.sin(phase)) < SYMMETRY_TOLERANCE:
+        return -1
+    if abs(math.cos(phase)) < SYMMETRY_TOLERANCE:
+        return 1
+    return 0
+
+
+def _sum_parity(*parities):
+    """項の和の偶奇（全項が同じ偶奇のときのみ定まる）"""
+    parities = set(parities)
+    return parities.pop() if len(parities) == 1 else 0
+
+
+def detect_symmetry(pattern_type, params):
+    """パラメータからパターンの対称性を判定
+
+    戻り値は (kind, sign)。kind は "quadrant"（x, y それぞれの鏡映で不変）、
+    "point"（(x, y) -> (-x, -y) で sign 倍）、None（対称性なし）。
+    """
+    p = params
+    if pattern_type == "circular":
+        if abs(p["center_x"]) < SYMMETRY_TOLERANCE and abs(p["center_y"]) < SYMMETRY_TOLERANCE:
+            return "quadrant", 1
+        return None, 0
+
+    if pattern_type in ("Standard", "linear"):
+        # 線形格子は回転座標が奇関数なので、各格子の偶奇は位相だけで決まる
+        sign = _carrier_parity(p["phase1"]) * _carrier_parity(p["phase2"])
+    elif pattern_type == "Wave":
+        # 歪み係数 sin(x * y * 0.5) は点対称で不変、回転座標は奇関数
+        terms1 = [_carrier_parity(p["phase1"]), _carrier_parity(p["phase1"] * 0.7)]
+        terms2 = [_carrier_parity(p["phase2"]), _carrier_parity(p["phase2"] * 1.3)]
+        if p["wave_complexity"] != 0:
+            terms1.append(_carrier_parity(p["phase1"] * 1.5))
+            terms2.append(_carrier_parity(p["phase2"] * 0.8))
+        sign = _sum_parity(*terms1) * _sum_parity(*terms2)
+    elif pattern_type == "Tree Rings":
+        # 歪み sin(2x)cos(2y) は奇関数なので歪みなしのときだけ半径が偶関数になる
+        if p["rings_distortion"] != 0:
+            return None, 0
+        terms1 = [_carrier_parity(p["phase1"] * 0.5)]
+        terms2 = [_carrier_parity(p["phase2"] * 0.8)]
+        if p["rings_complexity"] != 0:
+            # 半径だけの項は常に偶関数
+            terms1.append(1)
+            terms2.append(1)
+        sign = _sum_parity(*terms1) * _sum_parity(*terms2)
+    else:
+        return None, 0
+    return ("point", sign) if sign != 0 else (None, 0)
+
+
+def grating_rates(params):
+    """標準パターンの2つの格子の x, y 方向の周波数（周期/単位長）"""
+    rates = []
+    for freq, angle in ((params["freq1"], params["angle1"]), (params["freq2"], params["angle2"])):
+        cos_a, sin_a = _rotation(angle)
+        rates.append((freq * cos_a, freq * sin_a))
+    return rates
+
+
+def _pixel_period(rates, count, step):
+    """全格子が整数周期になる最小ピクセル数（count の半分以下、なければ None）
+
+    rates は周期/単位長、step はピクセル間隔。出力全体で累積する位相ずれが
+    PERIODIC_TOLERANCE 以下であれば周期とみなす。
+    """
+    limit = count // 2
+    if limit < 1:
+        return None
+    periods = np.arange(1, limit + 1)
+    ok = np.ones(limit, dtype=bool)
+    for rate in rates:
+        cycles = rate * step * periods
+        drift = np.abs(cycles - np.rint(cycles)) * (count / periods)
+        ok &= drift < PERIODIC_TOLERANCE
+    found = np.flatnonzero(ok)
+    return int(periods[found[0]]) if found.size else None
+
+
+def detect_period(pattern_type, width, height, params):
+    """線形格子の周期がピクセル格子と整合する場合のタイルサイズ (rows, cols)
+
+    周期性がない方向は出力サイズそのまま、どちらの方向にもなければ None。
+    """
+    if get_pattern_function(pattern_type) is not standard_pattern:
+        return None
+    extent = PATTERN_EXTENTS[pattern_type]
+    rates = grating_rates(params)
+    period_x = period_y = None
+    if width > 1:
+        period_x = _pixel_period([rx for rx, _ in rates], width, 2 * extent / (width - 1))
+    if height > 1:
+        period_y = _pixel_period([ry for _, ry in rates], height, 2 * extent / (height - 1))
+    if period_x is None and period_y is None:
+        return None
+    return (period_y or height), (period_x or width)
+
+
+def fill_periodic(tile, out):
+    """タイルを縦横に繰り返して出力配列を埋める
+
+    埋めた範囲をそのままコピー元にして倍々に広げるので、コピー回数は log で済む。
+    """
+    height, width = out.shape
+    tile_h, tile_w = tile.shape
+    out[:tile_h, :tile_w] = tile[:height, :width]
+    filled = tile_w
+    while filled < width:
+        count = min(filled, width - filled)
+        out[:tile_h, filled:filled + count] = out[:tile_h, :count]
+        filled += count
+    filled = tile_h
+    while filled < height:
+        count = min(filled, height - filled)
+        out[filled:filled + count] = out[:count]
+        filled += count
+    return out
+
+
+def _evaluate(func, x, y, params, trig):
+    """1次元座標軸上でパターン関数を評価"""
+    if trig == "fast" and func is standard_pattern:
+        return standard_pattern_accumulator(x, y, params)
+    X, Y = np.meshgrid(x, y)
+    return func(X, Y, params, trig)
+
+
+def calculate_on_axes(pattern_type, x, y, params, trig=DEFAULT_TRIG):
+    """任意の1次元座標軸 x, y（ワールド座標）上でパターンを計算"""
+    if trig not in TRIG_MODES:
+        raise ValueError(f"Unknown trig mode: {trig}")
+    return _evaluate(get_pattern_function(pattern_type), x, y, params, trig)
+
+
+def calculate_pattern(pattern_type, width, height, params, rows=None,
+                      precision=DEFAULT_PRECISION, trig=DEFAULT_TRIG, symmetry=True,
+                      periodic=True, cols=None):
+    """モアレパターンを浮動小数点配列として計算
+
+    rows / cols に (start, stop) を渡すとその行・列範囲だけを計算する。
+    precision は "float64" または "float32"、trig は "exact" または "fast"。
+    symmetry=True では対称性があれば基本領域（半分または1/4）だけを計算して残りを鏡映で埋める。
+    periodic=True では線形格子の周期がピクセル格子と整合すれば1タイルだけ計算して複製する。
+    """
+    func = get_pattern_function(pattern_type)
+    if trig not in TRIG_MODES:
+        raise ValueError(f"Unknown trig mode: {trig}")
+    x, y = make_axes(width, height, PATTERN_EXTENTS[pattern_type], get_dtype(precision))
+    if rows is not None or cols is not None:
+        if rows is not None:
+            y = y[rows[0]:rows[1]]
+        if cols is not None:
+            x = x[cols[0]:cols[1]]
+        return _evaluate(func, x, y, params, trig)
+
+    period = detect_period(pattern_type, width, height, params) if periodic else None
+    if period is not None:
+        tile = calculate_tile(pattern_type, width, height, params, period,
+                              precision=precision, trig=trig)
+        return fill_periodic(tile, np.empty((height, width), dtype=x.dtype))
+
+    kind, sign = detect_symmetry(pattern_type, params) if symmetry else (None, 0)
+    if kind is None:
+        return _evaluate(func, x, y, params, trig)
+
+    # 基本領域（上半分、quadrant では左上1/4）だけを計算
+    half_h, half_w = (height + 1) // 2, (width + 1) // 2
+    out = np.empty((height, width), dtype=x.dtype)
+    if kind == "point":
+        out[:half_h] = _evaluate(func, x, y[:half_h], params, trig)
+        # (i, j) -> (H-1-i, W-1-j)
+        np.multiply(out[:height // 2, ::-1][::-1], sign, out=out[half_h:])
+    else:
+        out[:half_h, :half_w] = _evaluate(func, x[:half_w], y[:half_h], params, trig)
+        out[:half_h, half_w:] = out[:half_h, :width // 2][:, ::-1]
+        out[half_h:] = out[:height // 2][::-1]
+    return out
+
+
+def center_pixels(pattern_type, width, height, center_x, center_y):
+    """中心座標をピクセル格子の間隔で丸めた整数オフセット (列, 行)"""
+    extent = PATTERN_EXTENTS[pattern_type]
+    return (int(round(center_x * (width - 1) / (2 * extent))),
+            int(round(center_y * (height - 1) / (2 * extent))))
+
+
+def snap_center(pattern_type, width, height, params):
+    """中心をピクセル格子に丸めたパラメータ（中心のないパターンはそのまま返す）
+
+    中心のドラッグを場の切り出しで表示するときは、通常の描画もこれを通すと
+    ドラッグの前後で中心が半ピクセル跳ばない。
+    """
+    if pattern_type not in CENTERED_PATTERNS:
+        return params
+    extent = PATTERN_EXTENTS[pattern_type]
+    cols, rows = center_pixels(pattern_type, width, height, params["center_x"], params["center_y"])
+    return dict(params, center_x=cols * 2 * extent / (width - 1),
+                center_y=rows * 2 * extent / (height - 1))
+
+
+def calculate_center_field(pattern_type, width, height, params, margin,
+                           precision=DEFAULT_PRECISION, trig=DEFAULT_TRIG):
+    """中心の移動を切り出しだけで表せるよう、上下左右に margin ピクセル広げて計算
+
+    中心はピクセル格子に丸めた位置に置く（誤差は半ピクセル以内）。
+    slice_center_field で任意の中心の表示範囲を取り出せる。
+    """
+    if pattern_type not in CENTERED_PATTERNS:
+        raise ValueError(f"{pattern_type} pattern has no center to move")
+    extent = PATTERN_EXTENTS[pattern_type]
+    dtype = get_dtype(precision)
+    step_x = 2 * extent / (width - 1)
+    step_y = 2 * extent / (height - 1)
+    x = (np.arange(-margin, width + margin) * step_x - extent).astype(dtype)
+    y = (np.arange(-margin, height + margin) * step_y - extent).astype(dtype)
+    field_params = snap_center(pattern_type, width, height, params)
+    return _evaluate(get_pattern_function(pattern_type), x, y, field_params, trig)
+
+
+def slice_center_field(field, margin, base, center, width, height):
+    """calculate_center_field の場から中心 center の表示範囲を切り出す
+
+    base は場を計算したときの中心、center は表示したい中心（どちらも center_pixels の値）。
+    余白の外に出た場合は None を返す。
+    """
+    top = margin - (center[1] - base[1])
+    left = margin - (center[0] - base[0])
+    if not (0 <= top <= 2 * margin and 0 <= left <= 2 * margin):
+        return None
+    return field[top:top + height, left:left + width]
+
+
+def calculate_tile(pattern_type, width, height, params, period, rows=None,
+                   precision=DEFAULT_PRECISION, trig=DEFAULT_TRIG):
+    """width x height の出力グリッドの左上 period = (rows, cols) 部分だけを計算
+
+    rows に (start, stop) を渡すとタイル内のその行範囲だけを計算する。
+    """
+    func = get_pattern_function(pattern_type)
+    x, y = make_axes(width, height, PATTERN_EXTENTS[pattern_type], get_dtype(precision))
+    y = y[:period[0]]
+    if rows is not None:
+        y = y[rows[0]:rows[1]]
+    return _evaluate(func, x[:period[1]], y, params, trig)
+
+
+def render_tileable(pattern_type, tile_width, tile_height, params,
+                    precision=DEFAULT_PRECISION, trig=DEFAULT_TRIG):
+    """継ぎ目なく敷き詰められるテクスチャ（1周期分のタイル）を8bitで描画
+
+    線形格子の周期（単位長）を x, y それぞれで求め、1周期を tile_width x tile_height
+    ピクセルで端点を含めずにサンプリングする。周期が見つからなければ ValueError。
+    """
+    if get_pattern_function(pattern_type) is not standard_pattern:
+        raise ValueError(f"Tileable textures require a linear pattern, not {pattern_type}")
+    rates = grating_rates(params)
+    dtype = get_dtype(precision)
+    axes = []
+    for axis, size in ((0, tile_width), (1, tile_height)):
+        length = world_period([rate[axis] for rate in rates])
+        if length is None:
+            raise ValueError("Grating frequencies and angles are not commensurate")
+        axes.append((np.arange(size) * (length / size)).astype(dtype))
+    return to_gray(_evaluate(standard_pattern, axes[0], axes[1], params, trig))
+
+
+def world_period(rates, max_repeats=MAX_TILE_REPEATS):
+    """全格子が整数周期になる最小の長さ（単位長）、全て0なら1.0、なければ None"""
+    rates = [abs(rate) for rate in rates if abs(rate) > SYMMETRY_TOLERANCE]
+    if not rates:
+        return 1.0
+    for repeats in range(1, max_repeats + 1):
+        length = repeats / rates[0]
+        if all(abs(rate * length - round(rate * length)) < PERIODIC_TOLERANCE for rate in rates[1:]):
+            return length
+    return None
+
+
+def phase_carriers(pattern_type, X, Y, p, trig="exact"):
+    """位相に依存しない搬送波の組 [(sin(2πfu), cos(2πfu), 位相係数), ...] を計算
+
+    2つの格子の積で表せるパターンは sin(2πfu + s·φ) = sin(2πfu)cos(sφ) + cos(2πfu)sin(sφ)
+    と分解できるので、位相だけが変わるフレーム列ではこの場を使い回せる。
+    分解できないパターン（Wave, Tree Rings）では None を返す。
+    """
+    func = get_pattern_function(pattern_type)
+    if func is standard_pattern:
+        grids = []
+        for freq, angle in ((p["freq1"], p["angle1"]), (p["freq2"], p["angle2"])):
+            cos_a, sin_a = _rotation(angle)
+            grids.append((freq, X * cos_a + Y * sin_a, 1.0))
+    elif func is circular_pattern:
+        r = np.sqrt((X - p["center_x"])**2 + (Y - p["center_y"])**2)
+        grids = [(p["freq1"], r, 1.0), (p["freq2"], r, 1.0)]
+    elif func is radial_pattern:
+        theta = np.arctan2(Y - p["center_y"], X - p["center_x"])
+        grids = [(p["freq1"], theta + float(np.radians(p["angle1"])), 1.0),
+                 (p["freq2"], theta + float(np.radians(p["angle2"])), 1.0)]
+    elif func is spiral_pattern:
+        # 位相は周期単位で足されるので 2π 倍して角度に直す
+        r = np.sqrt((X - p["center_x"])**2 + (Y - p["center_y"])**2)
+        theta = np.arctan2(Y - p["center_y"], X - p["center_x"])
+        grids = [(1.0, r + p["freq1"] * theta, 2 * np.pi),
+                 (1.0, r + p["freq2"] * theta, 2 * np.pi)]
+    else:
+        return None
+    return [(sin2pi(freq, u, 0.0, trig), sin2pi(freq, u, np.pi / 2, trig), scale)
+            for freq, u, scale in grids]
+
+
+def combine_carriers(carriers, phase1, phase2):
+    """phase_carriers の搬送波と位相列（長さK）から (K, H, W) のフレームを合成"""
+    frames = None
+    for (sin_u, cos_u, scale), phases in zip(carriers, (phase1, phase2)):
+        angles = np.asarray(phases, dtype=np.float64).reshape(-1, 1, 1) * scale
+        grating = sin_u * np.cos(angles).astype(sin_u.dtype)
+        grating += cos_u * np.sin(angles).astype(sin_u.dtype)
+        if frames is None:
+            frames = grating
+        else:
+            frames *= grating
+    return frames
+
+
+def calculate_phase_batch(pattern_type, width, height, params, phase1, phase2,
+                          precision=DEFAULT_PRECISION, trig=DEFAULT_TRIG, carriers=None):
+    """位相だけが異なるK枚のフレームを (K, H, W) の配列として一括計算
+
+    phase1, phase2 は長さKの配列。carriers に phase_carriers の結果を渡すと
+    位相に依存しない場を再計算せずに合成だけを行う。
+    """
+    if carriers is not None:
+        return combine_carriers(carriers, phase1, phase2)
+    func = get_pattern_function(pattern_type)
+    if trig not in TRIG_MODES:
+        raise ValueError(f"Unknown trig mode: {trig}")
+    dtype = get_dtype(precision)
+    x, y = make_axes(width, height, PATTERN_EXTENTS[pattern_type], dtype)
+    X, Y = np.meshgrid(x, y)
+    carriers = phase_carriers(pattern_type, X, Y, params, trig)
+    if carriers is not None:
+        return combine_carriers(carriers, phase1, phase2)
+    # 位相を (K, 1, 1) にして放送すれば回転・歪みなどの場はバッチ内で1回だけ計算される
+    batch_params = dict(params)
+    batch_params["phase1"] = np.asarray(phase1, dtype=dtype).reshape(-1, 1, 1)
+    batch_params["phase2"] = np.asarray(phase2, dtype=dtype).reshape(-1, 1, 1)
+    return func(X, Y, batch_params, trig)
+
+
+def to_gray(pattern, out=None):
+    """[-1, 1] のパターンを8bitグレースケールに変換（範囲外はクリップ）"""
+    scaled = (pattern + 1) * 127.5
+    np.clip(scaled, 0, 255, out=scaled)
+    if out is None:
+        return scaled.astype(np.uint8)
+    out[...] = scaled
+    return out
+
+
+def gray_to_argb(gray, out=None):
+    """グレースケールを QImage.Format_RGB32 互換の 0xFFRRGGBB に変換"""
+    if out is None:
+        out = np.empty(gray.shape, dtype=np.uint32)
+    np.multiply(gray, 0x010101, out=out, dtype=np.uint32)
+    out |= 0xFF000000
+    return out
+
+
+def render(pattern_type, width, height, params, fmt="gray", precision=DEFAULT_PRECISION,
+           trig=DEFAULT_TRIG):
+    """1フレームを一括で描画（gray: uint8, argb: uint32）"""
+    gray = to_gray(calculate_pattern(pattern_type, width, height, params,
+                                     precision=precision, trig=trig))
+    if fmt == "argb":
+        return gray_to_argb(gray)
+    if fmt != "gray":
+        raise ValueError(f"Unknown output format: {fmt}")
+    return gray
+
+
+def strip_rows(pattern_type, width, scratch_bytes=DEFAULT_SCRATCH_BYTES,
+               precision=DEFAULT_PRECISION):
+    """作業領域に収まるストリップの行数を計算"""
+    bytes_per_row = width * PATTERN_TEMPORARIES[pattern_type] * get_dtype(precision).itemsize
+    return max(1, scratch_bytes // bytes_per_row)
+
+
+def render_strips(pattern_type, width, height, params, fmt="gray",
+                  scratch_bytes=DEFAULT_SCRATCH_BYTES, out=None,
+                  precision=DEFAULT_PRECISION, trig=DEFAULT_TRIG):
+    """横方向のストリップ単位で描画し、結果を出力配列へ直接書き込む
+
+    ピークメモリは出力サイズ + scratch_bytes 程度に抑えられる。
+    """
+    if fmt not in ("gray", "argb"):
+        raise ValueError(f"Unknown output format: {fmt}")
+    dtype = np.uint8 if fmt == "gray" else np.uint32
+    if out is None:
+        out = np.empty((height, width), dtype=dtype)
+    elif out.shape != (height, width) or out.dtype != dtype:
+        raise ValueError(f"Output array must be {dtype.__name__} with shape {(height, width)}")
+
+    # 周期的なら1タイルだけ（タイルもストリップ単位で）計算して複製
+    period = detect_period(pattern_type, width, height, params)
+    if period is not None:
+        tile = np.empty(period, dtype=np.uint8)
+        tile_rows = strip_rows(pattern_type, period[1], scratch_bytes, precision)
+        for start in range(0, period[0], tile_rows):
+            stop = min(period[0], start + tile_rows)
+            to_gray(calculate_tile(pattern_type, width, height, params, period, rows=(start, stop),
+                                   precision=precision, trig=trig), out=tile[start:stop])
+        return fill_periodic(tile if fmt == "gray" else gray_to_argb(tile), out)
+
+    rows = strip_rows(pattern_type, width, scratch_bytes, precision)
+    for start in range(0, height, rows):
+        stop = min(height, start + rows)
+        strip = calculate_pattern(pattern_type, width, height, params, rows=(start, stop),
+                                  precision=precision, trig=trig)
+        if fmt == "gray":
+            to_gray(strip, out=out[start:stop])
+        else:
+            gray_to_argb(to_gray(strip), out=out[start:stop])
+        del strip
+    return out
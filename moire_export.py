@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Moire Animation Export
+計算・エンコードを並行に動かすパイプラインで動画 / 連番画像を書き出す
+
+計算ステージ（moire_animation.iter_frames）とエンコードステージは有限長のキューで
+つながっており、全体の速度は各ステージの合計ではなく最も遅いステージで決まる。
+"""
+
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import moire_animation
+import moire_archive
+import moire_engine
+import moire_io
+import moire_parallel
+
+# 動画として書き出す拡張子（ffmpeg が必要）
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".avi", ".webm")
+
+# 連番画像の形式
+SEQUENCE_FORMATS = ("png", "pgm")
+
+# エンコード待ちにできるフレーム数
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_FPS = 60
+
+# 進捗を通知する間隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+
+def find_ffmpeg():
+    """ffmpeg の実行ファイルのパス（見つからなければ None）"""
+    return shutil.which("ffmpeg")
+
+
+def sequence_pattern(output, fmt="png"):
+    """連番画像のファイル名パターンを作成（"%05d" を含まなければディレクトリとみなす）"""
+    if "%" in output:
+        return output
+    root, ext = os.path.splitext(output)
+    if ext.lower() in VIDEO_EXTENSIONS:
+        # ffmpeg がない場合は動画名のディレクトリに連番で書き出す
+        output = root + "_frames"
+    return os.path.join(output, f"frame_%05d.{fmt}")
+
+
+def remove_file(path):
+    """ファイルを削除（なければ何もしない）"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class FFmpegWriter:
+    """ffmpeg の標準入力へ raw グレースケールを流し込むエンコーダ
+
+    書き込みは専用スレッドで行い、write はキューが満杯のときだけ待つ。
+    動画は 名前.tmp.拡張子 に書き、close で置き換える（中断したときは abort で捨てる）。
+    """
+
+    def __init__(self, path, width, height, fps=DEFAULT_FPS, queue_size=DEFAULT_QUEUE_SIZE,
+                 ffmpeg=None):
+        command = [
+            ffmpeg or find_ffmpeg() or "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            # yuv420p は幅・高さが偶数である必要がある
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+        ]
+        root, ext = os.path.splitext(path)
+        self.path = path
+        # ffmpeg は拡張子でコンテナを決めるので、拡張子の前に .tmp を入れる
+        self.temp_path = root + ".tmp" + ext
+        command.append(self.temp_path)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.process.stdin.write(frame.tobytes())
+            except OSError as e:
+                # 残りのフレームは読み捨てて close で報告する
+                self.error = e
+
+    def write(self, index, frame):
+        self.frames.put(frame)
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        status = self.process.wait()
+        if self.error is not None or status != 0:
+            remove_file(self.temp_path)
+            raise OSError(f"ffmpeg failed (exit status {status}): {self.error or ''}".rstrip(": "))
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """ffmpeg を止めて書きかけの動画を捨てる"""
+        # 先に止めると詰まった書き込みが失敗し、スレッドは残りを読み捨てて終わる
+        self.process.kill()
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        remove_file(self.temp_path)
+
+
+class SequenceWriter:
+    """連番画像をスレッドプールで並列に書き出すエンコーダ
+
+    zlib と書き込みは GIL を解放するので、スレッドでも複数コアを使える。
+    中断したときは abort でそれまでに書いたフレームを消す。
+    """
+
+    def __init__(self, pattern, workers=None, queue_size=DEFAULT_QUEUE_SIZE):
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pattern = pattern
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.futures = []
+        self.written = []
+
+    def _save(self, index, frame):
+        try:
+            moire_io.save_image(self.pattern % index, frame)
+            self.written.append(self.pattern % index)
+        finally:
+            self.slots.release()
+
+    def write(self, index, frame):
+        self.slots.acquire()
+        self.futures.append(self.executor.submit(self._save, index, frame))
+        # 終わったものは結果を確認して手放す（例外はここで送出）
+        while self.futures and self.futures[0].done():
+            self.futures.pop(0).result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+
+    def abort(self):
+        """未着手の書き込みを取り消し、書き出したフレームを消す"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for path in self.written:
+            remove_file(path)
+
+
+def open_writer(output, width, height, fps=DEFAULT_FPS, encoder=None, workers=None,
+                queue_size=DEFAULT_QUEUE_SIZE, archive_format=moire_archive.DEFAULT_FORMAT,
+                archive_chunk=0, metadata=None):
+    """出力先に応じたエンコーダを作成し (writer, 実際の出力先) を返す
+
+    encoder は "ffmpeg", "png", "pgm" のいずれか。省略時は動画の拡張子で ffmpeg が
+    あれば ffmpeg、なければ PNG の連番。拡張子が .mfa ならフレームアーカイブ
+    （archive_format, archive_chunk は moire_archive.ArchiveWriter の fmt, chunk_frames）。
+    """
+    if os.path.splitext(output)[1].lower() == moire_archive.ARCHIVE_EXTENSION:
+        return moire_archive.ArchiveWriter(output, width, height, fps, archive_format,
+                                           archive_chunk, metadata), output
+    is_video = os.path.splitext(output)[1].lower() in VIDEO_EXTENSIONS
+    if encoder is None:
+        encoder = "ffmpeg" if is_video and find_ffmpeg() else "png"
+    if encoder == "ffmpeg":
+        if find_ffmpeg() is None:
+            raise OSError("ffmpeg was not found on PATH")
+        return FFmpegWriter(output, width, height, fps, queue_size), output
+    if encoder not in SEQUENCE_FORMATS:
+        raise ValueError(f"Unknown encoder: {encoder}")
+    pattern = sequence_pattern(output, encoder)
+    return SequenceWriter(pattern, workers, queue_size), pattern
+
+
+def export_animation(pattern_type, width, height, params, frames, output, fps=DEFAULT_FPS,
+                     schedule=None, encoder=None, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                     precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                     processes=None, chunk=moire_parallel.DEFAULT_CHUNK, progress=None,
+                     archive_format=moire_archive.DEFAULT_FORMAT, archive_chunk=0,
+                     **schedule_options):
+    """位相アニメーションを書き出して統計情報の辞書を返す
+
+    processes を指定すると計算ステージを moire_parallel のプロセスプールで行う。
+    progress(done, total, fps) を渡すと PROGRESS_INTERVAL ごとに呼ばれる。
+    統計の compute_wait はエンコーダがフレームを待った時間、encode_wait は
+    エンコーダが詰まって計算側が待たされた時間（バックプレッシャー）。
+    """
+    metadata = {"pattern_type": pattern_type, "params": dict(params), "schedule": schedule,
+                "schedule_options": schedule_options, "precision": precision, "trig": trig}
+    writer, target = open_writer(output, width, height, fps, encoder, workers, queue_size,
+                                 archive_format, archive_chunk, metadata)
+    stats = {"output": target, "frames": 0, "compute_wait": 0.0, "encode_wait": 0.0}
+    start = last_report = time.perf_counter()
+    source = None
+    completed = False
+    try:
+        if processes:
+            source = moire_parallel.iter_frames_parallel(
+                pattern_type, width, height, params, frames, schedule, workers=processes,
+                chunk=chunk, precision=precision, trig=trig, **schedule_options)
+        else:
+            source = moire_animation.iter_frames(pattern_type, width, height, params, frames,
+                                                 schedule, precision=precision, trig=trig,
+                                                 **schedule_options)
+        while True:
+            waited = time.perf_counter()
+            frame = next(source, None)
+            now = time.perf_counter()
+            stats["compute_wait"] += now - waited
+            if frame is None:
+                break
+
+            writer.write(stats["frames"], frame)
+            stats["encode_wait"] += time.perf_counter() - now
+            stats["frames"] += 1
+
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                progress(stats["frames"], frames, stats["frames"] / (now - start))
+        completed = True
+    finally:
+        if source is not None:
+            source.close()
+        # 途中で失敗・中断したら完成させずに捨てる（元の例外をそのまま伝える）
+        if completed:
+            writer.close()
+        else:
+            writer.abort()
+
+    stats["elapsed"] = time.perf_counter() - start
+    stats["fps"] = stats["frames"] / stats["elapsed"] if stats["elapsed"] > 0 else 0.0
+    stats["bottleneck"] = "compute" if stats["compute_wait"] >= stats["encode_wait"] else "encode"
+    if progress is not None:
+        progress(stats["frames"], frames, stats["fps"])
+    return stats
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Moire Image I/O
+PNG / PGM / NPY 形式での画像保存（外部ライブラリ不要）
+JPEG のエンコードだけは Pillow がある場合に使える
+"""
+
+import importlib.util
+import io
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# 拡張子 -> 出力形式
+IMAGE_FORMATS = {
+    ".png": "png",
+    ".pgm": "pgm",
+    ".ppm": "pgm",
+    ".npy": "npy",
+    ".tif": "tiff",
+    ".tiff": "tiff",
+    ".raw": "raw",
+}
+
+# ヘッダーの後に画素を無圧縮で並べる形式（np.memmap で直接書き込める）
+RASTER_FORMATS = ("raw", "pgm", "tiff")
+
+# TIFF の1ストリップあたりの目安バイト数
+TIFF_STRIP_BYTES = 64 * 1024
+
+# TIFF のタグ型
+_TIFF_SHORT = 3
+_TIFF_LONG = 4
+
+
+def format_from_path(path):
+    """ファイル名の拡張子から出力形式を判定"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        return IMAGE_FORMATS[ext]
+    except KeyError:
+        raise ValueError(f"Unsupported output format: {ext or path}") from None
+
+
+def _image_layout(image):
+    """画像の (幅, 高さ, チャンネル数) を取得"""
+    if image.ndim == 2:
+        return image.shape[1], image.shape[0], 1
+    if image.ndim == 3 and image.shape[2] == 3:
+        return image.shape[1], image.shape[0], 3
+    raise ValueError(f"Unsupported image shape: {image.shape}")
+
+
+def _png_chunk(tag, data):
+    """PNGチャンクを作成"""
+    return (struct.pack(">I", len(data)) + tag + data +
+            struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+
+def encode_png(image, level=6):
+    """uint8 のグレースケール (H, W) または RGB (H, W, 3) 画像をPNGバイト列に変換"""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    width, height, channels = _image_layout(image)
+    color_type = 0 if channels == 1 else 2
+
+    # 各行の先頭にフィルタ種別 0（なし）を付ける
+    rows = image.reshape(height, -1)
+    raw = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = rows
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" +
+            _png_chunk(b"IHDR", header) +
+            _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level)) +
+            _png_chunk(b"IEND", b""))
+
+
+def jpeg_available():
+    """JPEG のエンコード（Pillow）が使えるか（読み込みはしない）"""
+    return importlib.util.find_spec("PIL") is not None
+
+
+def encode_jpeg(image, quality=85):
+    """uint8 のグレースケール (H, W) または RGB (H, W, 3) 画像をJPEGバイト列に変換（Pillow が必要）"""
+    from PIL import Image
+
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    _image_layout(image)
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def pgm_header(width, height, channels=1):
+    """グレースケールはPGM(P5)、RGBはPPM(P6)のヘッダー"""
+    magic = "P5" if channels == 1 else "P6"
+    return f"{magic}\n{width} {height}\n255\n".encode("ascii")
+
+
+def _tiff_entry(tag, kind, count, value):
+    """IFDエントリ（値が4バイトに収まらなければ value はオフセット）"""
+    if kind == _TIFF_SHORT and count == 1:
+        return struct.pack("<HHIHH", tag, kind, count, value, 0)
+    return struct.pack("<HHII", tag, kind, count, value)
+
+
+def tiff_header(width, height, channels=1):
+    """無圧縮・ストリップ形式のTIFFヘッダー（画素はヘッダー直後に連続して並ぶ）"""
+    row_bytes = width * channels
+    rows_per_strip = max(1, min(height, TIFF_STRIP_BYTES // row_bytes))
+    strips = -(-height // rows_per_strip)
+
+    # ヘッダー(8) + IFD + BitsPerSample(RGBのみ) + StripOffsets + StripByteCounts + 画素
+    entry_count = 10
+    bits_offset = 8 + 2 + entry_count * 12 + 4
+    offsets_offset = bits_offset + (2 * channels if channels > 1 else 0)
+    counts_offset = offsets_offset + (4 * strips if strips > 1 else 0)
+    data_offset = counts_offset + (4 * strips if strips > 1 else 0)
+    if data_offset + row_bytes * height > 0xFFFFFFFF:
+        raise ValueError("Image is too large for TIFF (4 GiB); use .pgm or .raw instead")
+
+    strip_offsets = [data_offset + i * rows_per_strip * row_bytes for i in range(strips)]
+    strip_counts = [min(rows_per_strip, height - i * rows_per_strip) * row_bytes
+                    for i in range(strips)]
+    entries = [
+        _tiff_entry(256, _TIFF_LONG, 1, width),
+        _tiff_entry(257, _TIFF_LONG, 1, height),
+        _tiff_entry(258, _TIFF_SHORT, channels, 8 if channels == 1 else bits_offset),
+        _tiff_entry(259, _TIFF_SHORT, 1, 1),  # 無圧縮
+        _tiff_entry(262, _TIFF_SHORT, 1, 1 if channels == 1 else 2),  # BlackIsZero / RGB
+        _tiff_entry(273, _TIFF_LONG, strips, strip_offsets[0] if strips == 1 else offsets_offset),
+        _tiff_entry(277, _TIFF_SHORT, 1, channels),
+        _tiff_entry(278, _TIFF_LONG, 1, rows_per_strip),
+        _tiff_entry(279, _TIFF_LONG, strips, strip_counts[0] if strips == 1 else counts_offset),
+        _tiff_entry(284, _TIFF_SHORT, 1, 1),  # チャンネルは画素ごとに並べる
+    ]
+    header = b"II*\x00" + struct.pack("<IH", 8, entry_count) + b"".join(entries)
+    header += struct.pack("<I", 0)
+    if channels > 1:
+        header += struct.pack(f"<{channels}H", *([8] * channels))
+    if strips > 1:
+        header += struct.pack(f"<{strips}I", *strip_offsets)
+        header += struct.pack(f"<{strips}I", *strip_counts)
+    return header
+
+
+def raster_header(fmt, width, height, channels=1):
+    """RASTER_FORMATS のヘッダー（画素データはこの直後から始まる）"""
+    if fmt == "raw":
+        return b""
+    if fmt == "pgm":
+        return pgm_header(width, height, channels)
+    if fmt == "tiff":
+        return tiff_header(width, height, channels)
+    raise ValueError(f"Unsupported raster format: {fmt}")
+
+
+def encode_pgm(image):
+    """uint8 のグレースケールはPGM(P5)、RGBはPPM(P6)のバイト列に変換"""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    return pgm_header(*_image_layout(image)) + image.tobytes()
+
+
+def save_image(path, image, fmt=None):
+    """画像を保存（fmt を省略すると拡張子から判定）"""
+    fmt = fmt or format_from_path(path)
+    if fmt == "npy":
+        np.save(path, image)
+        return
+    if fmt == "png":
+        data = encode_png(image)
+    elif fmt in RASTER_FORMATS:
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        data = raster_header(fmt, *_image_layout(image)) + image.tobytes()
+    else:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Moire Parallel Rendering
+プロセスプールでフレーム範囲を分担してオフライン描画
+
+各ワーカーは共有メモリ上のリングバッファへ直接 uint8 フレームを書き込み、
+親プロセスはピクル化せずにそこから読み出す。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import moire_animation
+import moire_engine
+
+# 1チャンク（1タスク）あたりのフレーム数
+DEFAULT_CHUNK = 8
+
+# 共有メモリのリングバッファの上限（バイト）
+DEFAULT_RING_BYTES = 512 * 1024 * 1024
+
+# ワーカープロセス内の状態（共有メモリと直前のパラメータの搬送波）
+_worker = {}
+
+
+def _init_worker(name, shape):
+    """ワーカー起動時に共有メモリのリングへ接続"""
+    # ワーカーは親と同じ resource_tracker を共有するので、後始末は親の unlink だけでよい
+    ring = shared_memory.SharedMemory(name=name)
+    _worker["shm"] = ring
+    _worker["ring"] = np.ndarray(shape, dtype=np.uint8, buffer=ring.buf)
+
+
+def _render_chunk(pattern_type, width, height, params, phase1, phase2, slot, precision, trig):
+    """1チャンク分のフレームをリングの slot に描画（返すのはスロット番号と枚数だけ）"""
+    key = (pattern_type, width, height, tuple(sorted(params.items())), precision, trig)
+    if _worker.get("key") != key:
+        _worker["carriers"] = moire_animation.animation_carriers(
+            pattern_type, width, height, params, precision, trig)
+        _worker["key"] = key
+    out = _worker["ring"][slot]
+    batch = moire_animation.batch_size(pattern_type, width, height, precision)
+    for start in range(0, len(phase1), batch):
+        stop = min(len(phase1), start + batch)
+        frames = moire_engine.calculate_phase_batch(
+            pattern_type, width, height, params, phase1[start:stop], phase2[start:stop],
+            precision=precision, trig=trig, carriers=_worker["carriers"])
+        moire_engine.to_gray(frames, out=out[start:stop])
+    return slot, len(phase1)
+
+
+def ring_slots(width, height, chunk, workers, ring_bytes=DEFAULT_RING_BYTES):
+    """リングのスロット数（各ワーカーが2チャンクずつ持てる数を上限に ring_bytes 以内）"""
+    chunk_bytes = width * height * chunk
+    return max(1, min(2 * workers, ring_bytes // chunk_bytes))
+
+
+def iter_frames_parallel(pattern_type, width, height, params, frames, schedule=None,
+                         workers=None, chunk=DEFAULT_CHUNK, ring_bytes=DEFAULT_RING_BYTES,
+                         precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                         copy=True, **schedule_options):
+    """アニメーションのフレームをプロセスプールで並列に描画し、順番に1枚ずつ返す
+
+    チャンク（chunk 枚）単位でワーカーに割り当て、結果は共有メモリのリングで受け取る。
+    copy=False ではリング上のビューを返す（次のチャンクに進むと上書きされる）。
+    """
+    workers = workers or os.cpu_count()
+    phase1, phase2 = moire_animation.phase_schedule(pattern_type, frames, params, schedule,
+                                                    **schedule_options)
+    slots = ring_slots(width, height, chunk, workers, ring_bytes)
+    shape = (slots, chunk, height, width)
+    ring = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    buffer = frame = None
+    try:
+        buffer = np.ndarray(shape, dtype=np.uint8, buffer=ring.buf)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(ring.name, shape)) as executor:
+            starts = iter(range(0, frames, chunk))
+            pending = []
+
+            def submit(slot):
+                start = next(starts, None)
+                if start is None:
+                    return
+                stop = min(frames, start + chunk)
+                pending.append(executor.submit(
+                    _render_chunk, pattern_type, width, height, params,
+                    phase1[start:stop], phase2[start:stop], slot, precision, trig))
+
+            for slot in range(slots):
+                submit(slot)
+            try:
+                # 投入順に受け取り、読み終えたスロットへ次のチャンクを投入
+                while pending:
+                    slot, count = pending.pop(0).result()
+                    for frame in buffer[slot, :count]:
+                        yield frame.copy() if copy else frame
+                    submit(slot)
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        buffer = frame = None
+        ring.unlink()
+        try:
+            ring.close()
+        except BufferError:
+            # copy=False のビューが呼び出し側に残っている（ビューが消えれば解放される）
+            pass
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Moire Poster Renderer
+メモリに載らない大判画像をタイル単位でメモリマップ上に描画
+
+出力はヘッダー + 無圧縮画素（raw / PGM / TIFF）で、各ワーカープロセスが
+np.memmap で自分のタイルに直接書き込む。完了したタイルはチェックポイントの
+マニフェストに記録され、中断しても続きから再開できる。
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import moire_engine
+import moire_io
+
+# タイル1辺のピクセル数
+DEFAULT_TILE = 1024
+
+# マニフェストのファイル名（出力ファイル名に付け足す）
+MANIFEST_SUFFIX = ".manifest.json"
+
+# マニフェストを書き直す最短間隔（秒）
+CHECKPOINT_INTERVAL = 1.0
+
+
+def poster_config(pattern_type, width, height, params, fmt, channels, tile, precision, trig):
+    """出力内容を決める設定（マニフェストと一致すれば再開できる）"""
+    return {
+        "pattern_type": pattern_type,
+        "width": width,
+        "height": height,
+        "params": dict(params),
+        "format": fmt,
+        "channels": channels,
+        "tile": tile,
+        "precision": precision,
+        "trig": trig,
+    }
+
+
+def tile_grid(width, height, tile):
+    """タイルの (行範囲, 列範囲) を行優先で列挙"""
+    return [((top, min(height, top + tile)), (left, min(width, left + tile)))
+            for top in range(0, height, tile) for left in range(0, width, tile)]
+
+
+def manifest_path(output):
+    return output + MANIFEST_SUFFIX
+
+
+def load_manifest(output, config):
+    """設定が一致するマニフェストの完了済みタイル番号（なければ None）"""
+    try:
+        with open(manifest_path(output)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("config") != config or not os.path.exists(output):
+        return None
+    return set(manifest.get("done", []))
+
+
+def save_manifest(output, config, done, complete=False):
+    """マニフェストを書き出す（書きかけで壊れないよう置き換えで保存）"""
+    path = manifest_path(output)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"config": config, "done": sorted(done), "complete": complete}, f)
+    os.replace(path + ".tmp", path)
+
+
+def poster_shape(height, width, channels):
+    return (height, width) if channels == 1 else (height, width, channels)
+
+
+def create_poster(output, fmt, width, height, channels):
+    """ヘッダーを書き、画素領域を確保した出力ファイルを作成（画素の開始位置を返す）"""
+    header = moire_io.raster_header(fmt, width, height, channels)
+    with open(output, "wb") as f:
+        f.write(header)
+        # 未描画の部分は疎なファイルのまま（ディスクを即座には消費しない）
+        f.truncate(len(header) + width * height * channels)
+    return len(header)
+
+
+def _render_tile(output, offset, shape, pattern_type, width, height, params, rows, cols,
+                 precision, trig, scratch_bytes):
+    """ワーカープロセスで1タイルを描画して出力ファイルへ直接書き込む"""
+    image = np.memmap(output, dtype=np.uint8, mode="r+", offset=offset, shape=shape)
+    strip = moire_engine.strip_rows(pattern_type, cols[1] - cols[0], scratch_bytes, precision)
+    for top in range(rows[0], rows[1], strip):
+        bottom = min(rows[1], top + strip)
+        gray = moire_engine.to_gray(moire_engine.calculate_pattern(
+            pattern_type, width, height, params, rows=(top, bottom), cols=cols,
+            precision=precision, trig=trig))
+        target = image[top:bottom, cols[0]:cols[1]]
+        target[...] = gray if image.ndim == 2 else gray[..., np.newaxis]
+    image.flush()
+    del image
+
+
+def render_poster(pattern_type, width, height, params, output, tile=DEFAULT_TILE, rgb=False,
+                  workers=None, precision=moire_engine.DEFAULT_PRECISION,
+                  trig=moire_engine.DEFAULT_TRIG, scratch_bytes=moire_engine.DEFAULT_SCRATCH_BYTES,
+                  restart=False, progress=None):
+    """大判画像をタイル単位で描画して統計情報の辞書を返す
+
+    出力形式は拡張子（.raw / .pgm / .ppm / .tif）で決まる。rgb=True では
+    グレースケールを3チャンネルに複製する。同じ設定のマニフェストがあれば
+    完了済みのタイルを飛ばして再開する（restart=True で最初から）。
+    progress(done, total, elapsed) を渡すとタイルが終わるたびに呼ばれる。
+    """
+    fmt = moire_io.format_from_path(output)
+    if fmt not in moire_io.RASTER_FORMATS:
+        raise ValueError(f"Poster output must be one of .raw, .pgm, .ppm or .tif, not {output}")
+    channels = 3 if rgb else 1
+    config = poster_config(pattern_type, width, height, params, fmt, channels, tile,
+                           precision, trig)
+    offset = len(moire_io.raster_header(fmt, width, height, channels))
+
+    done = None if restart else load_manifest(output, config)
+    if done is None:
+        create_poster(output, fmt, width, height, channels)
+        done = set()
+        save_manifest(output, config, done)
+
+    tiles = tile_grid(width, height, tile)
+    remaining = [index for index in range(len(tiles)) if index not in done]
+    stats = {"output": output, "tiles": len(tiles), "skipped": len(tiles) - len(remaining),
+             "rendered": 0}
+    start = last_checkpoint = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = {
+                executor.submit(_render_tile, output, offset,
+                                poster_shape(height, width, channels), pattern_type, width,
+                                height, params, *tiles[index], precision, trig,
+                                scratch_bytes): index
+                for index in remaining
+            }
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    done.add(futures[future])
+                    stats["rendered"] += 1
+                    now = time.perf_counter()
+                    if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                        save_manifest(output, config, done)
+                        last_checkpoint = now
+                    if progress is not None:
+                        progress(len(done), len(tiles), now - start)
+            except BaseException:
+                # 中断時は未着手のタイルを捨て、描画中のタイルだけ待つ
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        save_manifest(output, config, done, complete=len(done) == len(tiles))
+
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Moire Scrub Prefetch
+スライダーのドラッグ中に、次に要求されそうな値を予測して先に描画しておく
+
+スライダーは整数刻みで動くので、ドラッグの向きと速さから次の値はほぼ分かる。
+直近の移動量と速度から先読みする値を決め、空いているコアのプロセスプールで
+プレビュー解像度のフレームを描画して上限付きのキャッシュに入れる。
+向きが変わったら未着手の予測は取り消す。
+"""
+
+import collections
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import moire_cache
+import moire_engine
+
+# 何秒先までの値を先読みするか（速度 x この時間 = 先読みする幅）
+PREFETCH_HORIZON = 0.3
+
+# 1回に予測する値の数の上限
+MAX_LOOKAHEAD = 6
+
+# 先読みしたプレビューを保持するバイト数
+DEFAULT_PREFETCH_BYTES = 64 * 1024 * 1024
+
+# ワーカーの起動方式（GUI はディスク書き込みやサムネイルのスレッドが動いているので、
+# その途中で fork しない）。forkserver がない環境では spawn
+WORKER_START_METHOD = ("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                       else "spawn")
+
+# 速度の指数移動平均の重み（新しい観測の割合）
+VELOCITY_SMOOTHING = 0.5
+
+
+def render_preview(pattern_type, width, height, params, precision, trig):
+    """ワーカープロセスでプレビューを描画（uint8）"""
+    return moire_engine.render(pattern_type, width, height, params, precision=precision,
+                               trig=trig)
+
+
+def predict_values(value, delta, velocity, minimum, maximum, horizon=PREFETCH_HORIZON,
+                   max_lookahead=MAX_LOOKAHEAD):
+    """ドラッグの向き・1回の移動量・速度（単位/秒）から次に来そうな値を近い順に列挙"""
+    if delta == 0:
+        return []
+    stride = abs(delta)
+    count = min(max_lookahead, max(1, round(abs(velocity) * horizon / stride)))
+    direction = 1 if delta > 0 else -1
+    values = []
+    for k in range(1, count + 1):
+        predicted = value + direction * stride * k
+        if not minimum <= predicted <= maximum:
+            break
+        values.append(predicted)
+    return values
+
+
+class ScrubPrefetcher:
+    """スライダーの動きを観測して近くの値を先読みする
+
+    observe はGUIのスレッドから呼び、描画は別プロセスで行う。
+    job(value) はその値の (キャッシュキー, render_preview の引数) を返す関数。
+    """
+
+    def __init__(self, workers=None, cache_bytes=DEFAULT_PREFETCH_BYTES):
+        # GUI のために1コア残す
+        self.workers = workers or max(1, (os.cpu_count() or 1) - 1)
+        self.executor = None
+        self.cache = moire_cache.FrameCache(memory_bytes=cache_bytes)
+        # Future.cancel は完了コールバック（_store）をその場で呼ぶので再入可能なロック
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.queued = collections.OrderedDict()
+        self.slider = None
+        self.last = None
+        self.velocity = 0.0
+        self.stats = {"predicted": 0, "cancelled": 0, "hits": 0, "misses": 0}
+
+    def observe(self, name, value, minimum, maximum, job):
+        """スライダー name が value に動いたことを記録し、先読みを更新"""
+        now = time.perf_counter()
+        if self.slider != name or self.last is None:
+            # 別のスライダーを触り始めたら前の予測は役に立たない
+            self.cancel()
+            self.slider = name
+            self.last = (value, now, 0)
+            return
+        last_value, last_time, last_delta = self.last
+        delta = value - last_value
+        if delta == 0:
+            return
+        if last_delta and (delta > 0) != (last_delta > 0):
+            # 向きが変わった
+            self.cancel()
+        elapsed = max(now - last_time, 1e-3)
+        self.velocity = (VELOCITY_SMOOTHING * delta / elapsed +
+                         (1 - VELOCITY_SMOOTHING) * self.velocity)
+        if (self.velocity > 0) != (delta > 0):
+            self.velocity = delta / elapsed
+        self.last = (value, now, delta)
+
+        wanted = {}
+        for predicted in predict_values(value, delta, self.velocity, minimum, maximum):
+            key, args = job(predicted)
+            wanted[key] = args
+        self._schedule(wanted)
+
+    def _schedule(self, wanted):
+        """予測から外れたものを取り消し、新しい予測を近い順に待ち行列へ入れる"""
+        with self.lock:
+            for key in self.queued:
+                if key not in wanted:
+                    self.stats["cancelled"] += 1
+            # 取り消しでその場で呼ばれる _store が古い予測を投入しないよう、待ち行列を先に置き換える
+            self.queued = collections.OrderedDict(
+                (key, args) for key, args in wanted.items()
+                if key not in self.pending and key not in self.cache.memory)
+            for key, future in list(self.pending.items()):
+                if key not in wanted and future.cancel():
+                    self.stats["cancelled"] += 1
+            self._submit()
+
+    def _submit(self):
+        """空いているワーカーの数だけ待ち行列から投入
+
+        プールに渡した描画は取り消しにくいので、渡すのはワーカー数までにとどめる。
+        """
+        while self.queued and len(self.pending) < self.workers:
+            key, args = self.queued.popitem(last=False)
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+            future = self.executor.submit(render_preview, *args)
+            self.pending[key] = future
+            self.stats["predicted"] += 1
+            future.add_done_callback(lambda future, key=key: self._store(key, future))
+
+    def _store(self, key, future):
+        """描画完了（プールの管理スレッドから呼ばれる）"""
+        with self.lock:
+            self.pending.pop(key, None)
+            if not future.cancelled() and future.exception() is None:
+                self.cache.put(key, future.result())
+            self._submit()
+
+    def get(self, key):
+        """先読み済みのプレビュー（なければ None）"""
+        with self.lock:
+            frame = self.cache.memory.get(key)
+            if frame is not None:
+                self.cache.memory.move_to_end(key)
+        self.stats["hits" if frame is not None else "misses"] += 1
+        return frame
+
+    def put(self, key, frame):
+        """GUI側で描画したプレビューも保存（同じ値に戻ったとき使える）"""
+        with self.lock:
+            self.cache.put(key, frame)
+
+    def cancel(self):
+        """未着手の予測を全て取り消し、ドラッグの記録を消す"""
+        with self.lock:
+            self.stats["cancelled"] += len(self.queued)
+            self.queued.clear()
+            for future in list(self.pending.values()):
+                if future.cancel():
+                    self.stats["cancelled"] += 1
+        self.last = None
+        self.velocity = 0.0
+
+    def summary(self):
+        """情報パネル用の1行"""
+        return (f"Prefetch: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['predicted']} predicted, {self.stats['cancelled']} cancelled")
+
+    def close(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Moire Preset Library
+パターンタイプとパラメータのプリセットを JSON で保存し、Tk版と PyQt版の両方で使う
+
+組み込みのプリセットはこのディレクトリの presets.json、ユーザーが保存したものは
+~/.config/moire/presets.json に置き、同じ名前ならユーザーのものが優先される。
+サムネイルはバックグラウンドのスレッドで描画してディスクのキャッシュにも残す。
+GUIはアイドル時に各プリセットの最初のフレームをバックグラウンドで描画して
+自分のフレームキャッシュへ入れておき（prewarm）、プリセットの切り替えでは
+キャッシュから即座に表示する。
+"""
+
+import json
+import os
+import queue
+import threading
+
+import moire_cache
+import moire_engine
+
+PRESET_VERSION = 1
+
+# 組み込みのプリセットとユーザーのプリセットのファイル
+BUILTIN_PRESETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "presets.json")
+USER_PRESETS_PATH = os.path.join(os.path.expanduser("~"), ".config", "moire", "presets.json")
+
+# サムネイル1辺のピクセル数
+THUMBNAIL_SIZE = 64
+
+# 操作が止まってから最初のフレームの描画を始めるまでの時間と、結果を受け取る間隔（ミリ秒）
+PREWARM_IDLE_MS = 1500
+PREWARM_POLL_MS = 50
+
+
+def make_preset(name, pattern_type, params, speed=None):
+    """プリセットの辞書（params はパターンに影響するものと既定値から変えたものだけ保存）"""
+    moire_engine.get_pattern_function(pattern_type)
+    params = moire_engine.make_params(**params)
+    used = moire_engine.PATTERN_PARAMS[pattern_type]
+    preset = {
+        "name": name,
+        "pattern_type": pattern_type,
+        "params": {key: value for key, value in params.items()
+                   if key in used or value != moire_engine.DEFAULT_PARAMS[key]},
+    }
+    if speed is not None:
+        preset["speed"] = float(speed)
+    return preset
+
+
+def validate_preset(preset):
+    """プリセットの内容を確認（不正なら ValueError）"""
+    if not preset.get("name"):
+        raise ValueError("Preset has no name")
+    moire_engine.get_pattern_function(preset["pattern_type"])
+    moire_engine.make_params(**preset["params"])
+
+
+def preset_params(preset):
+    """プリセットの全パラメータ（省略分は既定値）"""
+    return moire_engine.make_params(**preset["params"])
+
+
+def load_presets(path):
+    """ファイルのプリセットの一覧（ファイルがなければ空）"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    if data.get("version") != PRESET_VERSION:
+        raise ValueError(f"Unsupported preset file version: {data.get('version')}")
+    presets = data.get("presets", [])
+    for preset in presets:
+        validate_preset(preset)
+    return presets
+
+
+def save_presets(presets, path):
+    """JSON で保存（書きかけで壊れないよう置き換えで保存）"""
+    for preset in presets:
+        validate_preset(preset)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": PRESET_VERSION, "presets": presets}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def load_library(builtin_path=BUILTIN_PRESETS_PATH, user_path=USER_PRESETS_PATH):
+    """組み込みとユーザーのプリセットを合わせた一覧（同じ名前はユーザーのもので置き換え）"""
+    library = {preset["name"]: preset for preset in load_presets(builtin_path)}
+    try:
+        user = load_presets(user_path)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring user presets: {e}")
+        user = []
+    for preset in user:
+        library[preset["name"]] = preset
+    return list(library.values())
+
+
+def save_user_preset(preset, path=USER_PRESETS_PATH):
+    """ユーザーのプリセットに追加（同じ名前があれば置き換え）"""
+    presets = [old for old in load_presets(path) if old["name"] != preset["name"]]
+    presets.append(preset)
+    save_presets(presets, path)
+
+
+def presets_for(presets, pattern_types):
+    """GUIで選べるパターンタイプのプリセットだけを返す"""
+    return [preset for preset in presets if preset["pattern_type"] in pattern_types]
+
+
+def thumbnail_key(preset, size=THUMBNAIL_SIZE):
+    return moire_cache.frame_key(preset["pattern_type"], size, size, preset_params(preset),
+                                 thumbnail=True)
+
+
+class BackgroundRenderer:
+    """描画をバックグラウンドのスレッドで順に実行し、結果を poll で受け取る
+
+    GUIのスレッドでは描画しないので、大きなフレームでも操作が止まらない。
+    GUIはタイマーで poll を呼び、届いた結果を表示やキャッシュに使う
+    （Tk と Qt はどちらも別スレッドからウィジェットを触れないため）。
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.ready = queue.Queue()
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, render, *args):
+        """render(*args) の結果を (key, 結果) として poll で返すよう予約"""
+        with self.lock:
+            self.queued += 1
+        self.jobs.put((key, render, args))
+
+    def clear(self):
+        """まだ始まっていない描画を取り消す（描画中のものは最後まで行う）"""
+        cleared = 0
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # close の終了の合図は残す
+                self.jobs.put(None)
+                break
+            cleared += 1
+        with self.lock:
+            self.queued -= cleared
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            key, render, args = job
+            try:
+                self.ready.put((key, render(*args)))
+            except Exception as e:
+                print(f"Background render failed: {e}")
+            with self.lock:
+                self.queued -= 1
+
+    def poll(self):
+        """前回から描画が終わった (key, 結果) の一覧"""
+        finished = []
+        while True:
+            try:
+                finished.append(self.ready.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def idle(self):
+        """予約した描画が全て終わり、結果も poll で受け取ったか"""
+        with self.lock:
+            return self.queued == 0 and self.ready.empty()
+
+    def close(self):
+        self.clear()
+        self.jobs.put(None)
+        self.thread.join()
+
+
+class ThumbnailRenderer(BackgroundRenderer):
+    """プリセットのサムネイル（uint8）をバックグラウンドで描画する
+
+    poll は (プリセット名, サムネイル) を返す。描画済みのものはディスクのキャッシュから
+    読むので、2回目以降の起動ではすぐに揃う。
+    """
+
+    def __init__(self, presets, size=THUMBNAIL_SIZE, cache_dir=moire_cache.DEFAULT_CACHE_DIR):
+        super().__init__()
+        self.size = size
+        self.cache = moire_cache.FrameCache(memory_bytes=len(presets) * size * size + 1,
+                                            cache_dir=cache_dir)
+        for preset in presets:
+            self.submit(preset["name"], self._render, preset)
+
+    def _render(self, preset):
+        params = preset_params(preset)
+        return self.cache.get_or_render(
+            thumbnail_key(preset, self.size),
+            lambda: moire_engine.render(preset["pattern_type"], self.size, self.size, params))
+
+    def close(self):
+        super().close()
+        self.cache.close()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Moire Deep Zoom Pyramid
+巨大なモアレ画像を DZI 形式のタイルピラミッドとして書き出す
+
+縮小すると搬送波がエイリアスしてモアレが消えるため、各レベルは1枚の大きな画像を
+縮小するのではなく、そのレベルのサンプリング間隔で解析的に描画する。
+タイルは内容を決めるパラメータのハッシュをキーにキャッシュされ、パラメータを
+戻したときや出力し直すときは未キャッシュのタイルだけを描画する。
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import moire_engine
+import moire_io
+
+# DZI のタイルサイズと重なり（OpenSeadragon の標準値）
+DEFAULT_TILE = 254
+DEFAULT_OVERLAP = 1
+
+# タイル画像の形式
+TILE_FORMATS = ("png", "pgm")
+
+# 内容アドレスのタイルキャッシュ
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "moire", "tiles")
+
+# ワーカーに1回で渡すタイル数
+TILES_PER_TASK = 16
+
+DZI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{fmt}" Overlap="{overlap}" TileSize="{tile}">
+  <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+
+def max_level(width, height):
+    """最大解像度のレベル番号（レベル0は1x1ピクセル）"""
+    return max(0, math.ceil(math.log2(max(width, height))))
+
+
+def level_size(width, height, level):
+    """レベルの画像サイズ"""
+    scale = 2 ** (max_level(width, height) - level)
+    return math.ceil(width / scale), math.ceil(height / scale)
+
+
+def tile_bounds(index, size, tile, overlap):
+    """タイル番号のピクセル範囲（前後に overlap ピクセル重なる）"""
+    start = index * tile - (overlap if index > 0 else 0)
+    stop = min(size, (index + 1) * tile + overlap)
+    return start, stop
+
+
+def pyramid_tiles(width, height, tile=DEFAULT_TILE):
+    """全レベルの (level, col, row) を列挙"""
+    tiles = []
+    for level in range(max_level(width, height) + 1):
+        level_w, level_h = level_size(width, height, level)
+        for row in range(math.ceil(level_h / tile)):
+            for col in range(math.ceil(level_w / tile)):
+                tiles.append((level, col, row))
+    return tiles
+
+
+def tile_key(pattern_type, width, height, params, level, col, row, tile, overlap, fmt,
+             precision, trig):
+    """タイルの内容を決める値のハッシュ（パターンに影響しないパラメータは含めない）"""
+    content = {
+        "pattern_type": pattern_type,
+        "params": {name: params[name] for name in moire_engine.PATTERN_PARAMS[pattern_type]},
+        "size": [width, height],
+        "tile": [level, col, row, tile, overlap],
+        "format": fmt,
+        "precision": precision,
+        "trig": trig,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_path(cache_dir, key, fmt):
+    """キャッシュ内のタイルのパス（先頭2文字でディレクトリを分ける）"""
+    return os.path.join(cache_dir, key[:2], f"{key}.{fmt}")
+
+
+def render_tile(pattern_type, width, height, params, level, col, row, tile=DEFAULT_TILE,
+                overlap=DEFAULT_OVERLAP, precision=moire_engine.DEFAULT_PRECISION,
+                trig=moire_engine.DEFAULT_TRIG):
+    """1タイルをそのレベルのサンプリング間隔で描画（uint8）
+
+    レベルのピクセル j は最大解像度のピクセル j * scale と同じワールド座標になる。
+    """
+    scale = 2 ** (max_level(width, height) - level)
+    level_w, level_h = level_size(width, height, level)
+    extent = moire_engine.PATTERN_EXTENTS[pattern_type]
+    dtype = moire_engine.get_dtype(precision)
+    axes = []
+    for index, size, full in ((col, level_w, width), (row, level_h, height)):
+        start, stop = tile_bounds(index, size, tile, overlap)
+        step = 2 * extent / (full - 1) if full > 1 else 0.0
+        axes.append((-extent + np.arange(start, stop) * (scale * step)).astype(dtype))
+    return moire_engine.to_gray(moire_engine.calculate_on_axes(pattern_type, axes[0], axes[1],
+                                                               params, trig))
+
+
+def _render_tiles(jobs):
+    """ワーカープロセスで複数のタイルを描画してキャッシュに保存"""
+    for path, args in jobs:
+        image = render_tile(*args)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 途中で止まっても壊れたタイルが残らないよう置き換えで保存
+        moire_io.save_image(path + ".tmp", image, fmt=os.path.splitext(path)[1][1:])
+        os.replace(path + ".tmp", path)
+    return len(jobs)
+
+
+def _place(source, target):
+    """キャッシュのタイルを出力ディレクトリへ配置（可能ならハードリンク）"""
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def build_pyramid(pattern_type, width, height, params, output, tile=DEFAULT_TILE,
+                  overlap=DEFAULT_OVERLAP, fmt="png", cache_dir=DEFAULT_CACHE_DIR, workers=None,
+                  precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                  progress=None):
+    """DZI 形式のピラミッド（output の .dzi と _files ディレクトリ）を書き出す
+
+    キャッシュにないタイルだけをプロセスプールで描画し、統計情報の辞書を返す。
+    progress(done, total) を渡すとタスクが終わるたびに呼ばれる。
+    """
+    if fmt not in TILE_FORMATS:
+        raise ValueError(f"Unknown tile format: {fmt}")
+    root = os.path.splitext(output)[0]
+    files_dir = root + "_files"
+    start = time.perf_counter()
+
+    placements = []
+    missing = []
+    for level, col, row in pyramid_tiles(width, height, tile):
+        key = tile_key(pattern_type, width, height, params, level, col, row, tile, overlap,
+                       fmt, precision, trig)
+        path = cache_path(cache_dir, key, fmt)
+        placements.append((path, os.path.join(files_dir, str(level), f"{col}_{row}.{fmt}")))
+        if not os.path.exists(path):
+            missing.append((path, (pattern_type, width, height, params, level, col, row,
+                                   tile, overlap, precision, trig)))
+
+    if missing:
+        tasks = [missing[i:i + TILES_PER_TASK] for i in range(0, len(missing), TILES_PER_TASK)]
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for count in executor.map(_render_tiles, tasks):
+                done += count
+                if progress is not None:
+                    progress(done, len(missing))
+
+    # サイズが変わるとレベル数も変わるので、前回のタイルは全て置き直す
+    shutil.rmtree(files_dir, ignore_errors=True)
+    for source, target in placements:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _place(source, target)
+    with open(root + ".dzi", "w") as f:
+        f.write(DZI_TEMPLATE.format(fmt=fmt, overlap=overlap, tile=tile, width=width,
+                                    height=height))
+
+    return {"output": root + ".dzi", "tiles": len(placements), "rendered": len(missing),
+            "cached": len(placements) - len(missing), "elapsed": time.perf_counter() - start}
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Moire Parameter Search
+目的の縞（周期・向き）や見えるモアレのコントラストが最大になるパラメータを探す
+
+候補は低解像度（超標本化してから縮小）で moire_sweep.render_batch によりまとめて描画し、
+FFT のスペクトルから安い指標を計算して採点する。候補の評価はプロセスプールで並列に行い、
+最後に上位の候補とその近傍を出力解像度で描画して採点し直す。
+
+探索方法:
+    random  一様乱数で候補を生成
+    grid    各パラメータを等分した格子
+    cmaes   CMA-ES（平均と共分散を更新しながら良い候補の周りを探す）
+
+パラメータは各範囲を [0, 1] に正規化した空間で扱う。
+"""
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import moire_engine
+import moire_sweep
+
+# パラメータの探索範囲（GUIのスライダーの範囲。周波数の下限は格子の線が縞より細かくなるよう4）
+SEARCH_BOUNDS = {
+    "freq1": (4.0, 20.0),
+    "freq2": (4.0, 20.0),
+    "angle1": (0.0, 180.0),
+    "angle2": (0.0, 180.0),
+    "phase1": (0.0, 2 * math.pi),
+    "phase2": (0.0, 2 * math.pi),
+    "wave_complexity": (0.1, 1.0),
+    "wave_distortion": (0.0, 1.0),
+    "rings_distortion": (0.0, 1.0),
+    "rings_complexity": (0.1, 1.0),
+    "center_x": (-3.0, 3.0),
+    "center_y": (-3.0, 3.0),
+    "radius": (1.0, 5.0),
+}
+
+# 既定では探索しないパラメータ（縞を平行移動するだけで指標が変わらない）
+TRANSLATION_PARAMS = ("phase1", "phase2", "center_x", "center_y")
+
+STRATEGIES = ("random", "grid", "cmaes")
+OBJECTIVES = ("contrast", "period")
+
+# 低解像度の採点に使う画像の1辺と、描画するときの超標本化の倍率
+ANALYSIS_SIZE = 128
+SUPERSAMPLE = 3
+
+# 画像の幅（長い辺）に入る周期数がこれ未満の縞を「見えるモアレ」とみなす
+# （格子の線そのものはこれより細かい）
+VISIBLE_CYCLES = 8
+
+# コントラストがこれ未満なら縞はないものとみなす（周期・向きは雑音のピーク）
+MIN_CONTRAST = 0.02
+
+# スペクトルを細かく求めるためのゼロ詰めの倍率（縞が画像に数周期しか入らないため）
+SPECTRUM_PADDING = 4
+
+# 周期を目標にするとき、コントラストに掛ける重み（同じくらい合う候補ならはっきりした方）
+CONTRAST_WEIGHT = 0.1
+
+# 1回の評価で生成する候補の数と、上位の候補の近傍を調べるときの広がり（正規化した空間）
+DEFAULT_BATCH = 32
+DEFAULT_BUDGET = 256
+DEFAULT_REFINE = 4
+REFINE_NEIGHBOURS = 4
+REFINE_SIGMA = 0.02
+
+
+def search_names(pattern_type, names=None):
+    """探索するパラメータ名（省略時はパターンに影響し、平行移動でないもの）"""
+    if names is None:
+        names = [name for name in moire_engine.PATTERN_PARAMS[pattern_type]
+                 if name not in TRANSLATION_PARAMS]
+    unknown = set(names) - set(SEARCH_BOUNDS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    return list(names)
+
+
+def denormalize(unit, bounds):
+    """[0, 1] の候補 (N, D) を実際のパラメータ値に変換"""
+    low = np.array([low for low, _ in bounds])
+    high = np.array([high for _, high in bounds])
+    return low + np.clip(unit, 0.0, 1.0) * (high - low)
+
+
+def spectral_metrics(frames, output_width, output_height):
+    """グレースケールの (N, H, W) から見えるモアレの指標を計算
+
+    frames は出力と同じ範囲を描いた画像（解像度は違ってよい）。FFT の各成分は画像全体に
+    入る周期数なので、出力のピクセル単位の周期に換算できる。
+    見える縞は低い周波数だけなので、縮小した画像で測ってよい。
+    contrast は見える縞の RMS（全振幅の正弦波で約 0.71）、period は最も強い縞の
+    周期（出力のピクセル）、orientation はその縞の法線の向き（度、0〜180）。
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    count, height, width = frames.shape
+    frames = frames - frames.mean(axis=(1, 2), keepdims=True)
+    padded_h, padded_w = height * SPECTRUM_PADDING, width * SPECTRUM_PADDING
+    power = np.abs(np.fft.rfft2(frames, s=(padded_h, padded_w))) ** 2
+    # 実 FFT は右半分だけなので、対になる成分を持つ列は2倍で数える
+    weight = np.full(power.shape[-1], 2.0)
+    weight[0] = 1.0
+    if padded_w % 2 == 0:
+        weight[-1] = 1.0
+    cycles_y = np.fft.fftfreq(padded_h, 1.0 / height)[:, None]
+    cycles_x = np.fft.rfftfreq(padded_w, 1.0 / width)[None, :]
+    # 出力のピクセルあたりの周波数
+    freq_y = cycles_y / output_height
+    freq_x = cycles_x / output_width
+    radius = np.hypot(freq_x, freq_y)
+    visible = (radius > 0) & (radius * max(output_width, output_height) < VISIBLE_CYCLES)
+
+    visible_power = power * (weight * visible)
+    variance = visible_power.sum(axis=(1, 2)) / (height * width * padded_h * padded_w)
+    contrast = np.sqrt(variance) / 127.5
+    peak = visible_power.reshape(count, -1).argmax(axis=1)
+    peak_y, peak_x = np.unravel_index(peak, power.shape[1:])
+    peak_radius = radius[peak_y, peak_x]
+    with np.errstate(divide="ignore"):
+        period = np.where(contrast >= MIN_CONTRAST, 1.0 / peak_radius, np.inf)
+    orientation = np.degrees(np.arctan2(freq_y[peak_y, 0], freq_x[0, peak_x])) % 180.0
+    return {"contrast": contrast, "period": period, "orientation": orientation}
+
+
+def score_metrics(metrics, objective, target_period=None, target_orientation=None):
+    """指標から点数（大きいほど良い）を計算"""
+    if objective == "contrast":
+        return metrics["contrast"]
+    if objective != "period":
+        raise ValueError(f"Unknown objective: {objective}")
+    if target_period is None:
+        raise ValueError("The period objective needs a target period")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.abs(np.log(metrics["period"] / target_period))
+    error = np.where(np.isfinite(error), error, 1e3)
+    if target_orientation is not None:
+        difference = np.abs(metrics["orientation"] - target_orientation % 180.0)
+        error = error + np.minimum(difference, 180.0 - difference) / 90.0
+    return CONTRAST_WEIGHT * metrics["contrast"] - error
+
+
+def analysis_size(output_width, output_height, size=ANALYSIS_SIZE):
+    """出力と同じ縦横比で長い辺が size の採点用の解像度"""
+    scale = size / max(output_width, output_height)
+    return max(8, round(output_width * scale)), max(8, round(output_height * scale))
+
+
+def downsample(gray, factor):
+    """factor x factor の画素を平均して縮小（端の余りは切る）"""
+    height, width = gray.shape[-2] // factor, gray.shape[-1] // factor
+    gray = gray[..., :height * factor, :width * factor]
+    return gray.reshape(*gray.shape[:-2], height, factor, width, factor).mean(axis=(-3, -1))
+
+
+def _score_batch(pattern_type, params, names, values, output_size, objective, target_period,
+                 target_orientation, precision, trig, supersample=SUPERSAMPLE):
+    """ワーカープロセス: 候補 values (N, D) を低解像度で描画して (点数, 指標) を返す"""
+    width, height = analysis_size(*output_size)
+    render_w, render_h = width * supersample, height * supersample
+    step = moire_sweep.chunk_size(pattern_type, render_w, render_h, precision)
+    gray = np.empty((len(values), height, width), dtype=np.float64)
+    for start in range(0, len(values), step):
+        swept = {name: values[start:start + step, i] for i, name in enumerate(names)}
+        frames = moire_sweep.render_batch(pattern_type, render_w, render_h, params, swept,
+                                          precision, trig)
+        # 超標本化した画素をまとめて縮小（格子の折り返しを抑える）
+        gray[start:start + step] = downsample(frames, supersample)
+    metrics = spectral_metrics(gray, *output_size)
+    return score_metrics(metrics, objective, target_period, target_orientation), metrics
+
+
+def _score_full(pattern_type, params, output_size, objective, target_period,
+                target_orientation, precision, trig):
+    """ワーカープロセス: 1つの候補を出力解像度で描画して (点数, 指標) を返す
+
+    測るのは低い周波数だけなので、描画した画像を採点用の大きさ程度まで平均で縮小する
+    （格子の折り返しのない正確な縞が残る）。
+    """
+    gray = moire_engine.render(pattern_type, output_size[0], output_size[1], params,
+                               precision=precision, trig=trig)
+    factor = max(1, max(output_size) // (2 * ANALYSIS_SIZE))
+    metrics = spectral_metrics(downsample(gray[None].astype(np.float64), factor), *output_size)
+    score = score_metrics(metrics, objective, target_period, target_orientation)
+    return float(score[0]), {name: float(value[0]) for name, value in metrics.items()}
+
+
+def random_candidates(dimensions, budget, batch, rng):
+    """一様乱数の候補を batch 個ずつ生成（点数は使わない）"""
+    remaining = budget
+    while remaining > 0:
+        count = min(batch, remaining)
+        yield rng.random((count, dimensions))
+        remaining -= count
+
+
+def grid_candidates(dimensions, budget, batch, rng):
+    """各軸を等分した格子を batch 個ずつ生成
+
+    1軸の点数は格子が budget 点以上になる最小の数（budget の D 乗根の切り上げ）で、
+    budget を超えた分は格子点から無作為に間引く。
+    """
+    points = max(2, round(budget ** (1.0 / dimensions)))
+    if points ** dimensions < budget:
+        points += 1
+    axis = (np.arange(points) + 0.5) / points
+    grid = np.stack(np.meshgrid(*([axis] * dimensions), indexing="ij"), axis=-1)
+    grid = grid.reshape(-1, dimensions)
+    if len(grid) > budget:
+        grid = grid[np.sort(rng.choice(len(grid), budget, replace=False))]
+    for start in range(0, len(grid), batch):
+        yield grid[start:start + batch]
+
+
+def cmaes_candidates(dimensions, budget, batch, rng, sigma=0.3):
+    """CMA-ES の世代ごとに batch 個の候補を生成し、send で点数を受け取って更新"""
+    d = dimensions
+    lam = max(4, batch)
+    mu = lam // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1.0 / np.sum(weights ** 2)
+    cc = (4 + mueff / d) / (d + 4 + 2 * mueff / d)
+    cs = (mueff + 2) / (d + mueff + 5)
+    c1 = 2 / ((d + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((d + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0.0, math.sqrt((mueff - 1) / (d + 1)) - 1) + cs
+    chi_n = math.sqrt(d) * (1 - 1 / (4 * d) + 1 / (21 * d * d))
+
+    mean = np.full(d, 0.5)
+    cov = np.eye(d)
+    path_c = np.zeros(d)
+    path_s = np.zeros(d)
+    generation = 0
+    for _ in range(max(1, budget // lam)):
+        eigenvalues, basis = np.linalg.eigh(cov)
+        scales = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        steps = rng.standard_normal((lam, d)) @ (basis * scales).T
+        candidates = np.clip(mean + sigma * steps, 0.0, 1.0)
+        # 範囲外に出た候補は端に寄せて評価するので、更新にも寄せた後の移動量を使う
+        steps = (candidates - mean) / sigma
+        scores = yield candidates
+
+        # 良い順に mu 個の重み付き平均へ平均を移す
+        best = np.argsort(scores)[::-1][:mu]
+        step = weights @ steps[best]
+        mean = np.clip(mean + sigma * step, 0.0, 1.0)
+        inverse_sqrt = basis @ np.diag(1 / scales) @ basis.T
+        path_s = (1 - cs) * path_s + math.sqrt(cs * (2 - cs) * mueff) * (inverse_sqrt @ step)
+        generation += 1
+        hsig = (np.linalg.norm(path_s) / math.sqrt(1 - (1 - cs) ** (2 * generation)) / chi_n
+                < 1.4 + 2 / (d + 1))
+        path_c = (1 - cc) * path_c + hsig * math.sqrt(cc * (2 - cc) * mueff) * step
+        rank_mu = (steps[best].T * weights) @ steps[best]
+        cov = ((1 - c1 - cmu) * cov
+               + c1 * (np.outer(path_c, path_c) + (1 - hsig) * cc * (2 - cc) * cov)
+               + cmu * rank_mu)
+        sigma *= math.exp((cs / damps) * (np.linalg.norm(path_s) / chi_n - 1))
+        sigma = min(sigma, 1.0)
+
+
+CANDIDATE_GENERATORS = {
+    "random": random_candidates,
+    "grid": grid_candidates,
+    "cmaes": cmaes_candidates,
+}
+
+
+def search(pattern_type, params=None, output_size=(1920, 1080), objective="contrast",
+           target_period=None, target_orientation=None, strategy="cmaes", names=None,
+           bounds=None, budget=DEFAULT_BUDGET, batch=DEFAULT_BATCH, refine=DEFAULT_REFINE,
+           workers=None, seed=None, precision=moire_engine.DEFAULT_PRECISION,
+           trig=moire_engine.DEFAULT_TRIG,
+           progress=None):
+    """パラメータ空間を探索し、出力解像度で採点し直した上位の候補と統計情報を返す
+
+    names は探索するパラメータ名、bounds は {名前: (下限, 上限)} で SEARCH_BOUNDS を上書きする。
+    params は探索しないパラメータの値。結果は点数の高い順の
+    {"params", "score", "metrics"} のリスト。
+    progress(evaluated, budget, best_score) は候補の評価ごとに呼ばれる。
+    """
+    if strategy not in CANDIDATE_GENERATORS:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective}")
+    if objective == "period" and target_period is None:
+        raise ValueError("The period objective needs a target period")
+    names = search_names(pattern_type, names)
+    ranges = dict(SEARCH_BOUNDS, **(bounds or {}))
+    ranges = [ranges[name] for name in names]
+    base = moire_engine.make_params(**(params or {}))
+    rng = np.random.default_rng(seed)
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    common = (output_size, objective, target_period, target_orientation, precision, trig)
+
+    evaluated = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        generator = CANDIDATE_GENERATORS[strategy](len(names), budget, batch, rng)
+        scores = None
+        while True:
+            try:
+                unit = generator.send(scores) if scores is not None else next(generator)
+            except StopIteration:
+                break
+            values = denormalize(unit, ranges)
+            # 候補をワーカー数に分けて並列に採点
+            parts = [part for part in np.array_split(np.arange(len(values)), workers) if len(part)]
+            futures = [executor.submit(_score_batch, pattern_type, base, names, values[part],
+                                       *common) for part in parts]
+            scores = np.empty(len(values))
+            for part, future in zip(parts, futures):
+                scores[part], _ = future.result()
+            evaluated.extend(zip(scores, unit))
+            if progress is not None:
+                progress(len(evaluated), budget, max(score for score, _ in evaluated))
+        low_res_time = time.perf_counter() - start
+
+        # 上位の候補とその近傍を出力解像度で採点し直す
+        evaluated.sort(key=lambda item: item[0], reverse=True)
+        starts = [unit for _, unit in evaluated[:refine]]
+        candidates = []
+        for unit in starts:
+            candidates.append(unit)
+            for _ in range(REFINE_NEIGHBOURS):
+                candidates.append(np.clip(unit + rng.normal(0, REFINE_SIGMA, len(names)), 0, 1))
+        futures = []
+        for unit in candidates:
+            candidate = dict(base, **dict(zip(names, denormalize(unit[None], ranges)[0])))
+            candidate = moire_engine.make_params(**candidate)
+            futures.append((candidate, executor.submit(_score_full, pattern_type, candidate,
+                                                       *common)))
+        results = []
+        for candidate, future in futures:
+            score, metrics = future.result()
+            results.append({"params": candidate, "score": score, "metrics": metrics})
+
+    results.sort(key=lambda result: result["score"], reverse=True)
+    stats = {
+        "evaluated": len(evaluated),
+        "refined": len(results),
+        "low_res_time": low_res_time,
+        "elapsed": time.perf_counter() - start,
+        "names": names,
+    }
+    return results, stats
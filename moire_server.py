@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Moire Render Service
+同じホストの他のツールからモアレ画像を生成するための asyncio HTTP サーバー
+
+エンドポイント:
+    GET  /render?pattern=Wave&width=800&height=600&format=png&freq1=8 ...
+    POST /render   （同じ項目を JSON で送る）
+    POST /batch    {"jobs": [{...}, {...}]} -> 各結果を base64 で返す JSON
+    GET  /health
+
+描画はプロセスプールで行い、同時に届いた同一の要求は1回の描画にまとめる。
+最近の結果はパラメータをキーにした LRU キャッシュから返す。
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+import moire_backends
+import moire_engine
+import moire_io
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# LRU キャッシュに保持する応答の合計バイト数
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# 1枚あたりの最大ピクセル数（巨大な要求でワーカーを塞がないため）
+MAX_PIXELS = 64 * 1024 * 1024
+
+# 出力形式 -> Content-Type
+CONTENT_TYPES = {
+    "png": "image/png",
+    "npy": "application/x-npy",
+}
+
+# ワーカーの起動方式（fork だと受け付け済みのソケットを子プロセスが引き継ぎ、
+# 接続を閉じてもクライアントに EOF が届かない）。forkserver がない環境では spawn
+WORKER_START_METHOD = ("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                       else "spawn")
+
+# リクエストヘッダーと本文の上限
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class BackendUnavailableError(RuntimeError):
+    """インストール済みのバックエンドが実行時に使えない（GPU やドライバーがないなど）"""
+
+
+def parse_job(fields):
+    """リクエストの項目（文字列または数値）を描画ジョブの辞書に変換（不正なら ValueError）"""
+    if not isinstance(fields, dict):
+        raise ValueError("A job must be a JSON object")
+    try:
+        return _parse_fields(dict(fields))
+    except TypeError as e:
+        # 数値の代わりにリストやオブジェクトが送られた場合など
+        raise ValueError(f"Invalid job field: {e}") from None
+
+
+def _parse_fields(fields):
+    pattern_type = fields.pop("pattern", "Standard")
+    moire_engine.get_pattern_function(pattern_type)
+    fmt = fields.pop("format", "png")
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"Unknown format: {fmt}")
+    backend = fields.pop("backend", "CPU")
+    if backend not in moire_backends.BACKEND_MODULES:
+        raise ValueError(f"Unknown backend: {backend}")
+    if not moire_backends.is_available(backend):
+        raise ValueError(f"Backend is not installed: {backend}")
+    linear = moire_engine.get_pattern_function(pattern_type) is moire_engine.standard_pattern
+    if backend in moire_backends.GPU_BACKENDS and not linear:
+        raise ValueError(f"{backend} backend supports only linear patterns, not {pattern_type}")
+    precision = fields.pop("precision", moire_engine.DEFAULT_PRECISION)
+    moire_engine.get_dtype(precision)
+    trig = fields.pop("trig", moire_engine.DEFAULT_TRIG)
+    if trig not in moire_engine.TRIG_MODES:
+        raise ValueError(f"Unknown trig mode: {trig}")
+    width = int(fields.pop("width", 800))
+    height = int(fields.pop("height", 800))
+    if width <= 0 or height <= 0 or width * height > MAX_PIXELS:
+        raise ValueError(f"Invalid size: {width}x{height}")
+    params = moire_engine.make_params(**{name: float(value) for name, value in fields.items()})
+    return {
+        "pattern": pattern_type,
+        "width": width,
+        "height": height,
+        "format": fmt,
+        "backend": backend,
+        "precision": precision,
+        "trig": trig,
+        "params": params,
+    }
+
+
+def job_key(job):
+    """ジョブのキャッシュキー（出力に影響しないパラメータは含めない）"""
+    content = dict(job, params={name: job["params"][name]
+                                for name in moire_engine.PATTERN_PARAMS[job["pattern"]]})
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def render_job(job):
+    """ワーカープロセスでジョブを描画してエンコード済みのバイト列を返す"""
+    try:
+        image = moire_backends.render_gray(job["backend"], job["pattern"], job["width"],
+                                           job["height"], job["params"], job["precision"],
+                                           job["trig"])
+    except ValueError:
+        raise
+    except Exception as e:
+        # ライブラリはあるがデバイスやドライバーがない（OpenCL のプラットフォームなしなど）
+        if job["backend"] == "CPU":
+            raise
+        raise BackendUnavailableError(f"{job['backend']} backend is unavailable: {e}") from None
+    if job["format"] == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, image)
+        return buffer.getvalue()
+    return moire_io.encode_png(image)
+
+
+class RenderService:
+    """描画要求の合流・キャッシュ・プロセスプールへの振り分け"""
+
+    def __init__(self, workers=None, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+        self.cache = collections.OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self.pending = {}
+        self.stats = {"requests": 0, "renders": 0, "cache_hits": 0, "coalesced": 0}
+
+    async def render(self, job):
+        """ジョブの画像バイト列を取得（キャッシュ → 描画中の同一要求 → 新規描画）"""
+        self.stats["requests"] += 1
+        key = job_key(job)
+        data = self.cache.get(key)
+        if data is not None:
+            self.cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return data
+
+        future = self.pending.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, render_job, job)
+        self.pending[key] = future
+        try:
+            data = await asyncio.shield(future)
+        finally:
+            del self.pending[key]
+        self.stats["renders"] += 1
+        self.store(key, data)
+        return data
+
+    def store(self, key, data):
+        """LRU キャッシュに追加し、上限を超えた分を古い順に捨てる"""
+        if len(data) > self.cache_bytes:
+            return
+        self.cache[key] = data
+        self.cached_bytes += len(data)
+        while self.cached_bytes > self.cache_bytes:
+            _, old = self.cache.popitem(last=False)
+            self.cached_bytes -= len(old)
+
+    async def batch(self, jobs):
+        """複数のジョブを並行に描画して JSON 用の結果リストを返す"""
+        async def run(fields):
+            try:
+                job = parse_job(fields)
+                data = await self.render(job)
+            except ValueError as e:
+                return {"status": 400, "error": str(e)}
+            except BackendUnavailableError as e:
+                return {"status": 503, "error": str(e)}
+            return {"status": 200, "content_type": CONTENT_TYPES[job["format"]],
+                    "data": base64.b64encode(data).decode("ascii")}
+        return await asyncio.gather(*(run(fields) for fields in jobs))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def read_request(reader):
+    """HTTP リクエストを読み取り (method, path, query, headers, body) を返す（接続終了なら None）"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("Request header too large") from None
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise OverflowError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return method, url.path, dict(parse_qsl(url.query)), headers, body
+
+
+def response_bytes(status, body, content_type="application/json", keep_alive=True):
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+def json_bytes(value):
+    return json.dumps(value).encode("utf-8")
+
+
+async def dispatch(service, method, path, query, body):
+    """リクエストを処理して (status, body, content_type) を返す"""
+    if path == "/health":
+        return 200, json_bytes(dict(service.stats, cached_bytes=service.cached_bytes)), \
+            "application/json"
+    if path == "/render":
+        if method == "GET":
+            fields = query
+        elif method == "POST":
+            fields = json.loads(body or b"{}")
+        else:
+            return 405, json_bytes({"error": "use GET or POST"}), "application/json"
+        job = parse_job(fields)
+        return 200, await service.render(job), CONTENT_TYPES[job["format"]]
+    if path == "/batch":
+        if method != "POST":
+            return 405, json_bytes({"error": "use POST"}), "application/json"
+        request = json.loads(body or b"{}")
+        if not isinstance(request, dict):
+            raise ValueError('The batch body must be a JSON object like {"jobs": [...]}')
+        jobs = request.get("jobs", [])
+        if not isinstance(jobs, list):
+            raise ValueError("jobs must be a JSON array")
+        return 200, json_bytes({"results": await service.batch(jobs)}), "application/json"
+    return 404, json_bytes({"error": f"unknown path: {path}"}), "application/json"
+
+
+async def handle_connection(service, reader, writer):
+    """1つの接続のリクエストを順に処理（keep-alive 対応）"""
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except OverflowError as e:
+                writer.write(response_bytes(413, json_bytes({"error": str(e)}), keep_alive=False))
+                break
+            except ValueError as e:
+                writer.write(response_bytes(400, json_bytes({"error": str(e)}), keep_alive=False))
+                break
+            if request is None:
+                break
+            method, path, query, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            try:
+                status, data, content_type = await dispatch(service, method, path, query, body)
+            except ValueError as e:
+                # 不正なパラメータや JSON（json.JSONDecodeError も ValueError）
+                status, data, content_type = 400, json_bytes({"error": str(e)}), "application/json"
+            except BackendUnavailableError as e:
+                status, data, content_type = 503, json_bytes({"error": str(e)}), "application/json"
+            except Exception as e:
+                status, data, content_type = 500, json_bytes({"error": str(e)}), "application/json"
+            writer.write(response_bytes(status, data, content_type, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None,
+                cache_bytes=DEFAULT_CACHE_BYTES, ready=None):
+    """サーバーを起動して終了まで待つ（ready を渡すと待ち受け開始時に呼ばれる）"""
+    service = RenderService(workers, cache_bytes)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port,
+        limit=MAX_HEADER_BYTES)
+    try:
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Moire Shared-Memory Frame Ring
+描画したフレームを名前付き共有メモリのリングバッファへ公開し、同じマシンの
+他のプロセスがソケットもエンコードもなしに NumPy で直接読めるようにする
+
+レイアウト（すべてリトルエンディアン）:
+    RING_HEADER（64 バイト）
+    スロット × slots: SLOT_HEADER（64 バイト）+ 画素領域 slot_bytes
+
+書き込みは1プロセスだけ、読み出しは何プロセスでもよい（ロックなし）。
+書き込み側は連番 seq のフレームをスロット seq % slots に次の順で書く:
+    1. begin = seq  2. 幅・高さ・形式・時刻と画素  3. end = seq  4. latest = seq
+読み出し側は latest のスロットで begin == end == latest を確認してから画素を
+コピーせずに参照し、使い終わったら begin が変わっていないか（上書きが
+始まっていないか）を確かめる。あるスロットが上書きされるのは slots - 1 フレーム後。
+"""
+
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# 既定の共有メモリ名（/dev/shm/moire_frames）
+DEFAULT_RING_NAME = "moire_frames"
+
+# スロット数（読み出し側は slots - 1 フレーム分の時間内に読み終えればよい）
+DEFAULT_SLOTS = 4
+
+# 1スロットに入る最大ピクセル数（4K の ARGB まで）
+DEFAULT_MAX_PIXELS = 3840 * 2160
+
+RING_MAGIC = b"MOIRSHM1"
+RING_VERSION = 1
+
+RING_HEADER = np.dtype({
+    "names": ["magic", "version", "slots", "slot_bytes", "latest"],
+    "formats": ["S8", "<u4", "<u4", "<u8", "<u8"],
+    "offsets": [0, 8, 12, 16, 24],
+    "itemsize": 64,
+})
+
+SLOT_HEADER = np.dtype({
+    "names": ["begin", "seq", "width", "height", "format", "timestamp", "end"],
+    "formats": ["<u8", "<u8", "<u4", "<u4", "<u4", "<f8", "<u8"],
+    "offsets": [0, 8, 16, 20, 24, 32, 40],
+    "itemsize": 64,
+})
+
+# 形式名 <-> 番号・画素の型（argb は QImage.Format_RGB32 と同じ 0xAARRGGBB）
+FRAME_FORMATS = {
+    "gray": (1, np.dtype(np.uint8)),
+    "argb": (2, np.dtype("<u4")),
+}
+FORMAT_NAMES = {code: name for name, (code, _) in FRAME_FORMATS.items()}
+
+
+def ring_size(slots, slot_bytes):
+    """共有メモリ全体のバイト数"""
+    return RING_HEADER.itemsize + slots * (SLOT_HEADER.itemsize + slot_bytes)
+
+
+def _views(buffer, slots, slot_bytes):
+    """共有メモリ上のリングヘッダー・スロットヘッダー・画素領域のビュー"""
+    ring = np.ndarray((), dtype=RING_HEADER, buffer=buffer)
+    stride = SLOT_HEADER.itemsize + slot_bytes
+    headers = []
+    pixels = []
+    for slot in range(slots):
+        offset = RING_HEADER.itemsize + slot * stride
+        headers.append(np.ndarray((), dtype=SLOT_HEADER, buffer=buffer, offset=offset))
+        pixels.append(np.ndarray(slot_bytes, dtype=np.uint8, buffer=buffer,
+                                 offset=offset + SLOT_HEADER.itemsize))
+    return ring, headers, pixels
+
+
+class FrameRing:
+    """フレームを書き込む側（1プロセスに1つ、close で共有メモリを削除）"""
+
+    def __init__(self, name=DEFAULT_RING_NAME, slots=DEFAULT_SLOTS,
+                 slot_bytes=DEFAULT_MAX_PIXELS * 4):
+        if slots < 2:
+            raise ValueError("A frame ring needs at least 2 slots")
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=ring_size(slots, slot_bytes))
+        self.name = self.shm.name
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.ring, self.headers, self.pixels = _views(self.shm.buf, slots, slot_bytes)
+        self.ring["slots"] = slots
+        self.ring["slot_bytes"] = slot_bytes
+        self.ring["version"] = RING_VERSION
+        self.ring["latest"] = 0
+        # マジックは最後に書く（読み出し側はこれで初期化済みかを判断する）
+        self.ring["magic"] = RING_MAGIC
+        self.seq = 0
+
+    def publish(self, frame, timestamp=None):
+        """フレーム（uint8 グレースケールまたは uint32 ARGB の (H, W)）を書き込み、連番を返す"""
+        fmt = "argb" if frame.dtype == np.uint32 else "gray"
+        code, dtype = FRAME_FORMATS[fmt]
+        height, width = frame.shape
+        if width * height * dtype.itemsize > self.slot_bytes:
+            raise ValueError(f"Frame {width}x{height} ({fmt}) does not fit in a "
+                             f"{self.slot_bytes}-byte slot")
+        self.seq += 1
+        slot = self.seq % self.slots
+        header = self.headers[slot]
+        header["begin"] = self.seq
+        header["seq"] = self.seq
+        header["width"] = width
+        header["height"] = height
+        header["format"] = code
+        header["timestamp"] = time.time() if timestamp is None else timestamp
+        target = self.pixels[slot][:width * height * dtype.itemsize].view(dtype)
+        np.copyto(target.reshape(height, width), frame, casting="unsafe")
+        header["end"] = self.seq
+        self.ring["latest"] = self.seq
+        return self.seq
+
+    def close(self):
+        """共有メモリを閉じて削除（読み出し側の既存の対応付けはそのまま使える）"""
+        self.ring = self.headers = self.pixels = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach(name):
+    """既存の共有メモリに接続（終了時に resource_tracker に削除されないようにする）"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.12 以前は接続しただけで登録されるので取り消す
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameRingReader:
+    """フレームを読み出す側（何プロセスからでも接続できる）"""
+
+    def __init__(self, name=DEFAULT_RING_NAME):
+        self.shm = _attach(name)
+        ring = np.ndarray((), dtype=RING_HEADER, buffer=self.shm.buf)
+        if ring["magic"] != RING_MAGIC or ring["version"] != RING_VERSION:
+            self.shm.close()
+            raise ValueError(f"{name} is not a moire frame ring")
+        self.slots = int(ring["slots"])
+        self.slot_bytes = int(ring["slot_bytes"])
+        del ring
+        self.ring, self.headers, self.pixels = _views(self.shm.buf, self.slots, self.slot_bytes)
+
+    def latest_seq(self):
+        """最新の完成したフレームの連番（まだなければ 0）"""
+        return int(self.ring["latest"])
+
+    def latest(self, retries=8):
+        """最新フレームを (header, frame) で返す（frame は共有メモリのビュー、なければ None）
+
+        header は seq, width, height, format, timestamp の辞書。frame は書き込み側が
+        同じスロットに戻ってくるまで有効なので、使い終わったら still_valid で確認する。
+        """
+        for _ in range(retries):
+            seq = self.latest_seq()
+            if seq == 0:
+                return None
+            slot = seq % self.slots
+            header = self.headers[slot]
+            end = int(header["end"])
+            info = {
+                "seq": int(header["seq"]),
+                "width": int(header["width"]),
+                "height": int(header["height"]),
+                "format": FORMAT_NAMES.get(int(header["format"])),
+                "timestamp": float(header["timestamp"]),
+            }
+            if int(header["begin"]) != seq or end != seq or info["seq"] != seq \
+                    or info["format"] is None:
+                # 読んでいる間に書き込み側が追い越した
+                continue
+            dtype = FRAME_FORMATS[info["format"]][1]
+            size = info["width"] * info["height"] * dtype.itemsize
+            frame = self.pixels[slot][:size].view(dtype).reshape(info["height"], info["width"])
+            return info, frame
+        return None
+
+    def still_valid(self, header):
+        """latest で得たフレームがまだ上書きされていないか"""
+        return int(self.headers[header["seq"] % self.slots]["begin"]) == header["seq"]
+
+    def wait(self, after, timeout=None, interval=0.001):
+        """連番 after より新しいフレームが出るまで待って latest を返す（タイムアウトで None）"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.latest_seq() <= after:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            time.sleep(interval)
+        return self.latest()
+
+    def close(self):
+        self.ring = self.headers = self.pixels = None
+        self.shm.close()
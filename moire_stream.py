@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Moire Frame Streaming
+描画ループのフレームを localhost のソケットへライブ配信する
+
+    GET /stream.mjpg  multipart/x-mixed-replace（Pillow があれば JPEG、なければ PNG）
+    GET /stream.raw   長さ付きの raw ARGB（ヘッダー RAW_HEADER + 幅 x 高さ x 4 バイト）
+
+publish は描画ループから呼ばれ、決して待たない。エンコードは小さなスレッドプールで
+行い、プールが埋まっているフレームは捨てる。各クライアントは最新の1フレームだけを
+保持するので、送信が遅いクライアントは途中のフレームを飛ばして追いつく。
+"""
+
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import moire_animation
+import moire_engine
+import moire_io
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+
+# エンコード用のスレッド数（同時にエンコード中にできるフレーム数でもある）
+DEFAULT_ENCODE_WORKERS = 2
+
+DEFAULT_JPEG_QUALITY = 85
+
+# パス -> 配信形式
+STREAM_PATHS = {
+    "/": "mjpeg",
+    "/stream.mjpg": "mjpeg",
+    "/stream.raw": "raw",
+}
+
+MULTIPART_BOUNDARY = "moireframe"
+
+# raw 形式の各フレームの先頭: マジック, 連番, 幅, 高さ, タイムスタンプ(UNIX秒), 画素のバイト数
+# 画素はリトルエンディアンの 0xAARRGGBB（QImage.Format_RGB32 と同じ並び）
+RAW_MAGIC = b"MOIR"
+RAW_HEADER = struct.Struct("<4sQIIdI")
+
+# stream_animation で1回にまとめて計算させるフレーム数
+STREAM_BLOCK_FRAMES = 600
+
+# 接続直後のリクエスト行を待つ秒数
+HANDSHAKE_TIMEOUT = 5.0
+
+
+def to_argb(frame):
+    """uint8 のグレースケールまたは uint32 の ARGB フレームを ARGB に揃える"""
+    if frame.dtype == np.uint32:
+        return frame
+    return moire_engine.gray_to_argb(frame)
+
+
+def argb_to_rgb(argb):
+    """ARGB (H, W) を RGB (H, W, 3) に変換（リトルエンディアンのバイト並びは B, G, R, A）"""
+    channels = np.ascontiguousarray(argb).view(np.uint8).reshape(argb.shape + (4,))
+    return channels[..., 2::-1]
+
+
+def encode_frame(fmt, argb, seq, timestamp, quality=DEFAULT_JPEG_QUALITY):
+    """1フレームを配信形式のバイト列（区切り・ヘッダー込み）に変換"""
+    height, width = argb.shape
+    if fmt == "raw":
+        pixels = np.ascontiguousarray(argb, dtype="<u4").tobytes()
+        return RAW_HEADER.pack(RAW_MAGIC, seq, width, height, timestamp, len(pixels)) + pixels
+
+    # パターンはグレースケールなので、全チャンネルが等しければ1チャンネルで符号化する
+    rgb = argb_to_rgb(argb)
+    image = rgb[..., 0] if np.array_equal(rgb[..., 0], rgb[..., 1]) and \
+        np.array_equal(rgb[..., 0], rgb[..., 2]) else rgb
+    if moire_io.jpeg_available():
+        data, content_type = moire_io.encode_jpeg(image, quality), "image/jpeg"
+    else:
+        data, content_type = moire_io.encode_png(image, level=1), "image/png"
+    part = (f"--{MULTIPART_BOUNDARY}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"X-Frame-Sequence: {seq}\r\n"
+            f"X-Timestamp: {timestamp:.6f}\r\n\r\n")
+    return part.encode("latin-1") + data + b"\r\n"
+
+
+def stream_header(fmt):
+    """配信開始時の HTTP 応答ヘッダー"""
+    if fmt == "raw":
+        content_type = "application/octet-stream"
+    else:
+        content_type = f"multipart/x-mixed-replace; boundary={MULTIPART_BOUNDARY}"
+    return (f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Cache-Control: no-cache\r\n"
+            f"Connection: close\r\n\r\n").encode("latin-1")
+
+
+class StreamClient:
+    """1つの接続への送信（最新の1フレームだけを保持）"""
+
+    def __init__(self, connection, fmt):
+        self.connection = connection
+        self.fmt = fmt
+        self.condition = threading.Condition()
+        self.latest = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, data):
+        """送信待ちのフレームを置き換える（未送信のものは捨てる）"""
+        with self.condition:
+            if self.latest is not None:
+                self.dropped += 1
+            self.latest = data
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def run(self):
+        """送信スレッド（切断またはストリーマーの停止まで）"""
+        try:
+            while True:
+                with self.condition:
+                    while self.latest is None and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        break
+                    data, self.latest = self.latest, None
+                self.connection.sendall(data)
+                self.sent += 1
+        except OSError:
+            pass
+        finally:
+            self.closed = True
+            self.connection.close()
+
+
+class FrameStreamer:
+    """描画ループのフレームを配信するサーバー（バックグラウンドスレッドで待ち受け）"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_ENCODE_WORKERS,
+                 quality=DEFAULT_JPEG_QUALITY):
+        self.listener = socket.create_server((host, port))
+        self.address = self.listener.getsockname()[:2]
+        self.workers = workers
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.clients = []
+        self.encoding = 0
+        self.seq = 0
+        self.stats = {"published": 0, "encoded": 0, "dropped": 0}
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handshake, args=(connection,), daemon=True).start()
+
+    def _handshake(self, connection):
+        """リクエスト行から配信形式を決めてクライアントを登録"""
+        try:
+            connection.settimeout(HANDSHAKE_TIMEOUT)
+            request = b""
+            while b"\r\n\r\n" not in request and len(request) < 8192:
+                chunk = connection.recv(1024)
+                if not chunk:
+                    raise OSError("connection closed")
+                request += chunk
+            path = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ")[1].split("?")[0]
+            fmt = STREAM_PATHS.get(path)
+            if fmt is None:
+                connection.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n"
+                                   b"Connection: close\r\n\r\n")
+                connection.close()
+                return
+            connection.settimeout(None)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.sendall(stream_header(fmt))
+        except (OSError, IndexError):
+            connection.close()
+            return
+        client = StreamClient(connection, fmt)
+        with self.lock:
+            self.clients.append(client)
+        client.run()
+        with self.lock:
+            self.clients.remove(client)
+
+    def active(self):
+        """受信中のクライアントがいるか（いなければフレームを用意する必要はない）"""
+        return bool(self.clients)
+
+    def publish(self, frame):
+        """フレーム（uint8 グレースケールまたは uint32 ARGB）を配信（描画ループを待たせない）"""
+        with self.lock:
+            self.stats["published"] += 1
+            if not self.clients:
+                return
+            if self.encoding >= self.workers:
+                self.stats["dropped"] += 1
+                return
+            self.encoding += 1
+            self.seq += 1
+            seq = self.seq
+        # 呼び出し元はバッファを使い回すので、エンコード用にコピーする
+        self.executor.submit(self._encode, np.array(frame), seq, time.time())
+
+    def _encode(self, frame, seq, timestamp):
+        """エンコードスレッド: 接続中の形式ごとに1回だけ符号化して各クライアントへ渡す"""
+        try:
+            argb = to_argb(frame)
+            with self.lock:
+                clients = list(self.clients)
+            encoded = {}
+            for client in clients:
+                if client.fmt not in encoded:
+                    encoded[client.fmt] = encode_frame(client.fmt, argb, seq, timestamp,
+                                                       self.quality)
+                client.offer(encoded[client.fmt])
+        finally:
+            with self.lock:
+                self.encoding -= 1
+                self.stats["encoded"] += 1
+
+    def client_stats(self):
+        """クライアントごとの (形式, 送信数, 捨てたフレーム数)"""
+        with self.lock:
+            return [(client.fmt, client.sent, client.dropped) for client in self.clients]
+
+    def close(self):
+        """待ち受けを止めて全クライアントを切断"""
+        self.listener.close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+        self.executor.shutdown(wait=True)
+
+
+def stream_animation(sinks, pattern_type, width, height, params, fps=60, frames=None,
+                     schedule=None, precision=moire_engine.DEFAULT_PRECISION,
+                     trig=moire_engine.DEFAULT_TRIG, **schedule_options):
+    """GUIなしでアニメーションを fps で描画して配信（frames=None なら止めるまで続ける）
+
+    sinks は publish(frame) を持つ配信先（FrameStreamer や moire_shm.FrameRing）のリスト。
+
+    描画が fps に追いつかないときは遅れを溜めずにそのまま次のフレームへ進む。
+    """
+    interval = 1.0 / fps
+    deadline = time.perf_counter()
+    remaining = frames
+    while remaining is None or remaining > 0:
+        count = STREAM_BLOCK_FRAMES if remaining is None else min(remaining, STREAM_BLOCK_FRAMES)
+        for frame in moire_animation.iter_frames(pattern_type, width, height, params, count,
+                                                 schedule, precision=precision, trig=trig,
+                                                 **schedule_options):
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            deadline = max(deadline + interval, time.perf_counter())
+            for sink in sinks:
+                sink.publish(frame)
+        # 次のブロックは続きの位相から
+        phase1, phase2 = moire_animation.phase_schedule(pattern_type, count + 1, params,
+                                                        schedule, **schedule_options)
+        params = dict(params, phase1=float(phase1[-1]), phase2=float(phase2[-1]))
+        if remaining is not None:
+            remaining -= count
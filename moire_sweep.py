@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Moire Parameter Sweep
+パラメータの組み合わせのサムネイルを一括で描画し、ラベル付きのコンタクトシートにする
+
+スイープする値を (N, 1, 1) の配列としてパターン関数に渡すと、座標 (H, W) と放送されて
+N 枚のサムネイルが1回の NumPy の計算で求まる。N はメモリの上限に収まるよう
+チャンクに分ける。
+"""
+
+import numpy as np
+
+import moire_engine
+
+# サムネイル1辺のピクセル数
+DEFAULT_THUMBNAIL = 96
+
+# 1チャンクの計算で使う一時配列の合計バイト数の上限
+DEFAULT_SWEEP_BYTES = 256 * 1024 * 1024
+
+# サムネイルの間隔と、ラベルの文字の拡大率
+SHEET_GAP = 4
+LABEL_SCALE = 1
+
+# シートの背景とラベルの輝度
+SHEET_BACKGROUND = 32
+LABEL_COLOR = 230
+
+# ラベル用の 3x5 ドットのフォント（上の行から3ビットずつ）
+FONT_WIDTH, FONT_HEIGHT = 3, 5
+FONT_GLYPHS = {
+    "0": "111101101101111", "1": "010110010010111", "2": "111001111100111",
+    "3": "111001111001111", "4": "101101111001001", "5": "111100111001111",
+    "6": "111100111101111", "7": "111001001010010", "8": "111101111101111",
+    "9": "111101111001111", "a": "010101111101101", "b": "110101110101110",
+    "c": "011100100100011", "d": "110101101101110", "e": "111100110100111",
+    "f": "111100110100100", "g": "011100101101011", "h": "101101111101101",
+    "i": "111010010010111", "j": "001001001101010", "k": "101101110101101",
+    "l": "100100100100111", "m": "101111111101101", "n": "110101101101101",
+    "o": "010101101101010", "p": "110101110100100", "q": "010101101110011",
+    "r": "110101110101101", "s": "011100010001110", "t": "111010010010010",
+    "u": "101101101101111", "v": "101101101101010", "w": "101101111111101",
+    "x": "101101010101101", "y": "101101010010010", "z": "111001010100111",
+    ".": "000000000000010", "-": "000000111000000", "=": "000111000111000",
+    "_": "000000000000111", ":": "000010000010000", "/": "001001010100100",
+    "+": "000010111010000", ",": "000000000010100", " ": "000000000000000",
+}
+
+
+def parse_values(text):
+    """"START:STOP:COUNT"（等間隔）または "A,B,C" を値の配列に変換"""
+    if ":" in text:
+        start, stop, count = text.split(":")
+        return np.linspace(float(start), float(stop), int(count))
+    return np.array([float(value) for value in text.split(",")])
+
+
+def sweep_grid(axes):
+    """{パラメータ名: 値の列} の直積を、名前 -> 平坦化した値の配列 と格子の形で返す"""
+    names = list(axes)
+    values = [np.asarray(axes[name], dtype=np.float64) for name in names]
+    grids = np.meshgrid(*values, indexing="ij")
+    shape = grids[0].shape if grids else ()
+    return {name: grid.reshape(-1) for name, grid in zip(names, grids)}, shape
+
+
+def chunk_size(pattern_type, width, height, precision, max_bytes=DEFAULT_SWEEP_BYTES):
+    """1回の計算に含めるサムネイルの枚数（一時配列の見積もりが max_bytes 以下）"""
+    per_item = (width * height * moire_engine.get_dtype(precision).itemsize *
+                moire_engine.PATTERN_TEMPORARIES[pattern_type])
+    return max(1, max_bytes // per_item)
+
+
+def render_batch(pattern_type, width, height, params, swept, precision=moire_engine.DEFAULT_PRECISION,
+                 trig=moire_engine.DEFAULT_TRIG):
+    """swept（名前 -> 長さ N の配列）の各組み合わせを (N, H, W) の uint8 で一括描画"""
+    func = moire_engine.get_pattern_function(pattern_type)
+    dtype = moire_engine.get_dtype(precision)
+    count = len(next(iter(swept.values())))
+    x, y = moire_engine.make_axes(width, height, moire_engine.PATTERN_EXTENTS[pattern_type], dtype)
+    X, Y = np.meshgrid(x, y)
+    # 座標を (N, H, W) に見せておけば、途中の配列も全て先頭軸付きになり in-place の演算が通る
+    X = np.broadcast_to(X, (count, height, width))
+    Y = np.broadcast_to(Y, (count, height, width))
+    batch_params = dict(params)
+    for name, values in swept.items():
+        batch_params[name] = np.asarray(values, dtype=dtype).reshape(-1, 1, 1)
+    pattern = func(X, Y, batch_params, trig)
+    return moire_engine.to_gray(np.broadcast_to(pattern, (count, height, width)))
+
+
+def render_sweep(pattern_type, params, axes, thumbnail=DEFAULT_THUMBNAIL,
+                 precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                 max_bytes=DEFAULT_SWEEP_BYTES):
+    """axes の直積のサムネイルを (*格子の形, H, W) の uint8 で返す
+
+    thumbnail は1辺のピクセル数または (幅, 高さ)。
+    """
+    width, height = (thumbnail, thumbnail) if np.ndim(thumbnail) == 0 else thumbnail
+    unknown = set(axes) - set(moire_engine.DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    params = moire_engine.make_params(**params)
+    swept, shape = sweep_grid(axes)
+    count = int(np.prod(shape))
+    if count == 0:
+        raise ValueError("The sweep has no values")
+    thumbnails = np.empty((count, height, width), dtype=np.uint8)
+    step = chunk_size(pattern_type, width, height, precision, max_bytes)
+    for start in range(0, count, step):
+        chunk = {name: values[start:start + step] for name, values in swept.items()}
+        thumbnails[start:start + step] = render_batch(pattern_type, width, height, params, chunk,
+                                                      precision, trig)
+    return thumbnails.reshape(*shape, height, width)
+
+
+def draw_text(image, text, left, top, scale=LABEL_SCALE, color=LABEL_COLOR):
+    """image に 3x5 ドットのフォントで text を書く（はみ出した部分は切る）"""
+    for position, char in enumerate(text.lower()):
+        bits = FONT_GLYPHS.get(char, FONT_GLYPHS[" "])
+        glyph = np.array([bit == "1" for bit in bits]).reshape(FONT_HEIGHT, FONT_WIDTH)
+        glyph = glyph.repeat(scale, axis=0).repeat(scale, axis=1)
+        x = left + position * (FONT_WIDTH + 1) * scale
+        region = image[top:top + glyph.shape[0], x:x + glyph.shape[1]]
+        region[glyph[:region.shape[0], :region.shape[1]]] = color
+
+
+def format_value(value):
+    return f"{value:.4g}"
+
+
+def contact_sheet(thumbnails, labels=None, title=None, gap=SHEET_GAP, scale=LABEL_SCALE):
+    """(行, 列, H, W) または (N, H, W) のサムネイルを並べたシート（uint8）
+
+    labels は行優先で各サムネイルの下に書く文字列、title はシートの上に書く文字列。
+    1次元ならほぼ正方形になるよう折り返す。
+    """
+    if thumbnails.ndim == 3:
+        count = len(thumbnails)
+        columns = int(np.ceil(np.sqrt(count)))
+        rows = -(-count // columns)
+        padded = np.full((rows * columns,) + thumbnails.shape[1:], SHEET_BACKGROUND,
+                         dtype=np.uint8)
+        padded[:count] = thumbnails
+        thumbnails = padded.reshape(rows, columns, *thumbnails.shape[1:])
+    rows, columns, height, width = thumbnails.shape
+    line = (FONT_HEIGHT + 2) * scale
+    label_height = line if labels is not None else 0
+    title_height = line + gap if title else 0
+    cell_w, cell_h = width + gap, height + label_height + gap
+    sheet = np.full((title_height + gap + rows * cell_h, gap + columns * cell_w),
+                    SHEET_BACKGROUND, dtype=np.uint8)
+    if title:
+        draw_text(sheet, title, gap, gap, scale)
+    for row in range(rows):
+        for column in range(columns):
+            top = title_height + gap + row * cell_h
+            left = gap + column * cell_w
+            sheet[top:top + height, left:left + width] = thumbnails[row, column]
+            index = row * columns + column
+            if labels is not None and index < len(labels):
+                # サムネイルの幅に入る分だけ書く
+                label = labels[index][:width // ((FONT_WIDTH + 1) * scale)]
+                draw_text(sheet[:, :left + width], label, left, top + height + scale, scale)
+    return sheet
+
+
+def sweep_sheet(pattern_type, params, axes, thumbnail=DEFAULT_THUMBNAIL,
+                precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                max_bytes=DEFAULT_SWEEP_BYTES, scale=LABEL_SCALE):
+    """スイープを描画してラベル付きのコンタクトシートを返す
+
+    最後のパラメータが列、それ以外のパラメータの組み合わせが行（1次元なら折り返す）。
+    各サムネイルの下にはスイープした
+    値を "/" 区切りで、シートの上にはパターンタイプとパラメータ名を書く。
+    """
+    thumbnails = render_sweep(pattern_type, params, axes, thumbnail, precision, trig, max_bytes)
+    swept, shape = sweep_grid(axes)
+    names = list(axes)
+    labels = ["/".join(format_value(swept[name][index]) for name in names)
+              for index in range(int(np.prod(shape)))]
+    title = f"{pattern_type}: {' / '.join(names)}"
+    height, width = thumbnails.shape[-2:]
+    if len(shape) >= 2:
+        thumbnails = thumbnails.reshape(-1, shape[-1], height, width)
+    return contact_sheet(thumbnails, labels, title, scale=scale)
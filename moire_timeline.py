@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Moire Keyframe Timeline
+パラメータごとのキーフレームとイージングでアニメーションを記述し、JSON で保存する
+
+タイムラインは辞書で、JSON にそのまま書き出せる:
+    {
+        "version": 1, "pattern_type": "Wave", "frames": 600, "fps": 60,
+        "params": {...キーフレームのないパラメータの値...},
+        "tracks": {"freq1": [{"frame": 0, "value": 8.0, "easing": "ease_in_out"},
+                             {"frame": 300, "value": 12.0, "easing": "linear"}]}
+    }
+各キーフレームの easing は次のキーフレームまでの区間の補間方法。最初のキーより前と
+最後のキーより後は端の値のまま。パラメータの評価はタイムライン全体をまとめて
+NumPy で行う。オフライン描画は各ワーカーが独立したフレーム範囲を受け持つ。
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import moire_archive
+import moire_engine
+import moire_export
+import moire_io
+
+TIMELINE_VERSION = 1
+DEFAULT_FRAMES = 300
+DEFAULT_FPS = 60
+
+# 区間の補間方法（t は 0..1 の配列）
+EASINGS = {
+    "linear": lambda t: t,
+    "ease_in": lambda t: t * t,
+    "ease_out": lambda t: t * (2 - t),
+    "ease_in_out": lambda t: t * t * (3 - 2 * t),
+    "sine": lambda t: 0.5 - 0.5 * np.cos(np.pi * t),
+    "step": lambda t: np.zeros_like(t),
+}
+DEFAULT_EASING = "ease_in_out"
+
+# 1ワーカーあたりに分けるフレーム範囲の数（範囲ごとの重さの違いをならす）
+RANGES_PER_WORKER = 4
+
+# GUIのプレビューの解像度の倍率の範囲と、1段階で変える割合
+MIN_PREVIEW_SCALE = 0.2
+PREVIEW_SCALE_STEP = 1.25
+
+
+def new_timeline(pattern_type, params, frames=DEFAULT_FRAMES, fps=DEFAULT_FPS):
+    """キーフレームのない空のタイムライン"""
+    moire_engine.get_pattern_function(pattern_type)
+    return {
+        "version": TIMELINE_VERSION,
+        "pattern_type": pattern_type,
+        "frames": int(frames),
+        "fps": float(fps),
+        "params": moire_engine.make_params(**params),
+        "tracks": {},
+    }
+
+
+def _is_number(value):
+    """JSON の数値か（True / False は数値として扱わない）"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_timeline(timeline):
+    """タイムラインの内容を確認（不正なら ValueError）
+
+    読み込んだ JSON をそのまま渡してよい（型の違いも TypeError ではなく ValueError）。
+    """
+    if not isinstance(timeline, dict):
+        raise ValueError("A timeline must be a JSON object")
+    if timeline.get("version") != TIMELINE_VERSION:
+        raise ValueError(f"Unsupported timeline version: {timeline.get('version')}")
+    missing = {"pattern_type", "frames", "fps", "params", "tracks"} - set(timeline)
+    if missing:
+        raise ValueError(f"Timeline is missing: {', '.join(sorted(missing))}")
+    if not isinstance(timeline["pattern_type"], str):
+        raise ValueError(f"Invalid pattern type: {timeline['pattern_type']!r}")
+    moire_engine.get_pattern_function(timeline["pattern_type"])
+    if (not isinstance(timeline["frames"], int) or isinstance(timeline["frames"], bool)
+            or not _is_number(timeline["fps"])):
+        raise ValueError("Timeline frames must be an integer and fps a number")
+    if timeline["frames"] <= 0 or timeline["fps"] <= 0:
+        raise ValueError("Timeline frames and fps must be positive")
+    if not isinstance(timeline["params"], dict) or not all(
+            _is_number(value) for value in timeline["params"].values()):
+        raise ValueError("Timeline params must map names to numbers")
+    moire_engine.make_params(**timeline["params"])
+    if not isinstance(timeline["tracks"], dict):
+        raise ValueError("Timeline tracks must be a JSON object")
+    for name, keys in timeline["tracks"].items():
+        if name not in moire_engine.DEFAULT_PARAMS:
+            raise ValueError(f"Unknown parameter track: {name}")
+        if not isinstance(keys, list) or not keys:
+            raise ValueError(f"Track {name} has no keyframes")
+        for key in keys:
+            if (not isinstance(key, dict) or not isinstance(key.get("frame"), int)
+                    or isinstance(key["frame"], bool) or not _is_number(key.get("value"))):
+                raise ValueError(f"Keyframes of {name} need an integer frame and a number value")
+            easing = key.get("easing", DEFAULT_EASING)
+            if not isinstance(easing, str) or easing not in EASINGS:
+                raise ValueError(f"Unknown easing: {easing!r}")
+        frames = [key["frame"] for key in keys]
+        if frames != sorted(set(frames)):
+            raise ValueError(f"Keyframes of {name} must have increasing frame numbers")
+
+
+def add_keyframe(timeline, name, frame, value, easing=DEFAULT_EASING):
+    """キーフレームを追加（同じフレームにあれば置き換え）"""
+    if name not in moire_engine.DEFAULT_PARAMS:
+        raise ValueError(f"Unknown parameter: {name}")
+    if easing not in EASINGS:
+        raise ValueError(f"Unknown easing: {easing}")
+    keys = [key for key in timeline["tracks"].get(name, []) if key["frame"] != frame]
+    keys.append({"frame": int(frame), "value": float(value), "easing": easing})
+    keys.sort(key=lambda key: key["frame"])
+    timeline["tracks"][name] = keys
+
+
+def remove_keyframe(timeline, name, frame):
+    """キーフレームを削除（最後の1つを消したらトラックごと削除）"""
+    keys = [key for key in timeline["tracks"].get(name, []) if key["frame"] != frame]
+    if keys:
+        timeline["tracks"][name] = keys
+    else:
+        timeline["tracks"].pop(name, None)
+
+
+def load_timeline(path):
+    with open(path) as f:
+        timeline = json.load(f)
+    validate_timeline(timeline)
+    return timeline
+
+
+def save_timeline(timeline, path):
+    """JSON で保存（書きかけで壊れないよう置き換えで保存）"""
+    validate_timeline(timeline)
+    with open(path + ".tmp", "w") as f:
+        json.dump(timeline, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def evaluate_track(keys, frames):
+    """1つのトラックの値をフレーム番号の配列 frames 全体で評価"""
+    frames = np.asarray(frames, dtype=np.float64)
+    positions = np.array([key["frame"] for key in keys], dtype=np.float64)
+    values = np.array([key["value"] for key in keys], dtype=np.float64)
+    if len(keys) == 1:
+        return np.full(frames.shape, values[0])
+
+    # 各フレームが属する区間 [positions[i], positions[i + 1])
+    segment = np.clip(np.searchsorted(positions, frames, side="right") - 1, 0, len(keys) - 2)
+    start = positions[segment]
+    t = np.clip((frames - start) / (positions[segment + 1] - start), 0.0, 1.0)
+    eased = np.empty_like(t)
+    easings = np.array([key.get("easing", DEFAULT_EASING) for key in keys[:-1]])
+    for name in np.unique(easings):
+        mask = easings[segment] == name
+        eased[mask] = EASINGS[name](t[mask])
+    result = values[segment] + (values[segment + 1] - values[segment]) * eased
+    # 最初のキーより前は最初の値、最後のキー以降は最後の値（step でも最後の値になる）
+    result = np.where(frames < positions[0], values[0], result)
+    return np.where(frames >= positions[-1], values[-1], result)
+
+
+def evaluate_timeline(timeline, frames=None):
+    """全パラメータの値をフレームの配列でまとめて評価し、名前 -> 配列の辞書を返す"""
+    if frames is None:
+        frames = np.arange(timeline["frames"])
+    frames = np.asarray(frames)
+    values = {name: np.full(frames.shape, float(value))
+              for name, value in moire_engine.make_params(**timeline["params"]).items()}
+    for name, keys in timeline["tracks"].items():
+        values[name] = evaluate_track(keys, frames)
+    return values
+
+
+def frame_params(values, index):
+    """evaluate_timeline の結果から index 番目（配列上の位置）のパラメータ辞書"""
+    return moire_engine.make_params(**{name: array[index] for name, array in values.items()})
+
+
+def adapt_preview_scale(scale, elapsed, budget):
+    """プレビューの描画時間が予算を超えたら解像度を下げ、余裕があれば上げる"""
+    if elapsed > budget:
+        scale /= PREVIEW_SCALE_STEP
+    elif elapsed * PREVIEW_SCALE_STEP ** 2 < budget:
+        scale *= PREVIEW_SCALE_STEP
+    return min(1.0, max(MIN_PREVIEW_SCALE, scale))
+
+
+def frame_ranges(frames, parts):
+    """0..frames を連続した parts 個以下の範囲に分ける"""
+    size = -(-frames // max(1, parts))
+    return [(start, min(frames, start + size)) for start in range(0, frames, size)]
+
+
+def _render_range(timeline, start, stop, width, height, target, offset, precision, trig):
+    """ワーカープロセスで担当範囲のフレームを描画して書き込む
+
+    target がアーカイブなら np.memmap の担当部分へ、そうでなければ連番画像へ書く。
+    """
+    values = evaluate_timeline(timeline, np.arange(start, stop))
+    frames = None
+    if offset is not None:
+        frames = np.memmap(target, dtype=np.uint8, mode="r+", offset=offset,
+                           shape=(timeline["frames"], height, width))
+    for position, index in enumerate(range(start, stop)):
+        gray = moire_engine.render(timeline["pattern_type"], width, height,
+                                   frame_params(values, position), precision=precision,
+                                   trig=trig)
+        if frames is not None:
+            frames[index] = gray
+        else:
+            moire_io.save_image(target % index, gray)
+    if frames is not None:
+        frames.flush()
+        del frames
+    return stop - start
+
+
+def render_timeline(timeline, output, width, height, workers=None,
+                    precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG,
+                    progress=None):
+    """タイムラインを全コアで描画して統計情報の辞書を返す
+
+    output の拡張子が .mfa なら無圧縮のフレームアーカイブ（各ワーカーが担当の
+    フレームへ直接書き込む）、それ以外は連番画像（moire_export.sequence_pattern）。
+    progress(done, total, fps) を渡すと範囲が終わるたびに呼ばれる。
+    """
+    validate_timeline(timeline)
+    frames = timeline["frames"]
+    start = time.perf_counter()
+    if os.path.splitext(output)[1].lower() == moire_archive.ARCHIVE_EXTENSION:
+        metadata = {"pattern_type": timeline["pattern_type"], "timeline": timeline,
+                    "precision": precision, "trig": trig}
+        offset = moire_archive.create_archive(output, width, height, frames, timeline["fps"],
+                                              "gray", metadata)
+        target = output
+    else:
+        offset = None
+        target = moire_export.sequence_pattern(output)
+        directory = os.path.dirname(target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    workers = workers or os.cpu_count()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_render_range, timeline, range_start, range_stop, width,
+                                   height, target, offset, precision, trig)
+                   for range_start, range_stop in frame_ranges(frames,
+                                                               workers * RANGES_PER_WORKER)]
+        try:
+            for future in as_completed(futures):
+                done += future.result()
+                if progress is not None:
+                    progress(done, frames, done / (time.perf_counter() - start))
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    elapsed = time.perf_counter() - start
+    return {"output": target, "frames": frames, "elapsed": elapsed,
+            "fps": frames / elapsed if elapsed > 0 else 0.0}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Moire Viewport
+パン・ズーム用の表示範囲（ワールド座標の矩形）と、その範囲だけの描画
+
+表示範囲は辞書 {"x0", "y0", "step_x", "step_y"} で表し、画面のピクセル (i, j) は
+ワールド座標 (x0 + j * step_x, y0 + i * step_y) に対応する。
+パンはピクセル単位で行うので、既に描画済みの部分はずらすだけで再利用できる。
+"""
+
+import numpy as np
+
+import moire_engine
+
+# ホイール1段あたりの拡大率
+ZOOM_STEP = 1.25
+
+# 拡大率の範囲（初期表示に対する倍率）
+MIN_ZOOM = 0.05
+MAX_ZOOM = 1e6
+
+
+def default_view(pattern_type, width, height):
+    """エンジンの既定の座標範囲 [-extent, extent] を画面全体に表示する範囲"""
+    extent = moire_engine.PATTERN_EXTENTS[pattern_type]
+    return {
+        "x0": -extent,
+        "y0": -extent,
+        "step_x": 2 * extent / max(1, width - 1),
+        "step_y": 2 * extent / max(1, height - 1),
+    }
+
+
+def view_zoom(view, pattern_type, width, height):
+    """既定の表示範囲に対する拡大率"""
+    return default_view(pattern_type, width, height)["step_x"] / view["step_x"]
+
+
+def view_axes(view, width, height, dtype=np.float64, cols=(0, None), rows=(0, None)):
+    """表示範囲の x, y 座標軸（cols / rows で一部の列・行だけ）"""
+    x = view["x0"] + np.arange(width)[cols[0]:cols[1]] * view["step_x"]
+    y = view["y0"] + np.arange(height)[rows[0]:rows[1]] * view["step_y"]
+    return x.astype(dtype), y.astype(dtype)
+
+
+def zoom_view(view, factor, px, py, pattern_type, width, height):
+    """画面上の点 (px, py) を固定して factor 倍に拡大した表示範囲"""
+    zoom = view_zoom(view, pattern_type, width, height)
+    factor = min(max(zoom * factor, MIN_ZOOM), MAX_ZOOM) / zoom
+    step_x = view["step_x"] / factor
+    step_y = view["step_y"] / factor
+    return {
+        "x0": view["x0"] + px * (view["step_x"] - step_x),
+        "y0": view["y0"] + py * (view["step_y"] - step_y),
+        "step_x": step_x,
+        "step_y": step_y,
+    }
+
+
+def pan_view(view, dx, dy):
+    """内容を画面上で (dx, dy) ピクセル動かした表示範囲"""
+    return dict(view, x0=view["x0"] - dx * view["step_x"], y0=view["y0"] - dy * view["step_y"])
+
+
+def render_view(pattern_type, view, width, height, params, precision=moire_engine.DEFAULT_PRECISION,
+                trig=moire_engine.DEFAULT_TRIG, out=None, cols=(0, None), rows=(0, None)):
+    """表示範囲のうち見えている部分だけを uint8 で描画（cols / rows で一部だけ）"""
+    x, y = view_axes(view, width, height, moire_engine.get_dtype(precision), cols, rows)
+    pattern = moire_engine.calculate_on_axes(pattern_type, x, y, params, trig)
+    return moire_engine.to_gray(pattern, out=out)
+
+
+def pan_buffer(pattern_type, view, buffer, dx, dy, params,
+               precision=moire_engine.DEFAULT_PRECISION, trig=moire_engine.DEFAULT_TRIG):
+    """描画済みの buffer を (dx, dy) ずらし、新しく見えた帯だけを描画
+
+    新しい表示範囲を返す。buffer はその場で更新される。
+    """
+    height, width = buffer.shape
+    view = pan_view(view, dx, dy)
+    if abs(dx) >= width or abs(dy) >= height:
+        render_view(pattern_type, view, width, height, params, precision, trig, out=buffer)
+        return view
+
+    # 重なる部分をずらす（NumPy のスライス代入は重なりを正しく扱う）
+    src_rows = slice(max(0, -dy), height - max(0, dy))
+    dst_rows = slice(max(0, dy), height - max(0, -dy))
+    src_cols = slice(max(0, -dx), width - max(0, dx))
+    dst_cols = slice(max(0, dx), width - max(0, -dx))
+    buffer[dst_rows, dst_cols] = buffer[src_rows, src_cols]
+
+    # 上下に現れた帯（全幅）
+    if dy:
+        rows = (0, dy) if dy > 0 else (height + dy, height)
+        render_view(pattern_type, view, width, height, params, precision, trig,
+                    out=buffer[rows[0]:rows[1]], rows=rows)
+    # 左右に現れた帯（上下の帯を除いた行だけ）
+    if dx:
+        cols = (0, dx) if dx > 0 else (width + dx, width)
+        rows = (dst_rows.start, dst_rows.stop)
+        render_view(pattern_type, view, width, height, params, precision, trig,
+                    out=buffer[rows[0]:rows[1], cols[0]:cols[1]], cols=cols, rows=rows)
+    return view
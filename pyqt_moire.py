@@ -8,42 +8,42 @@ import numpy as np
 import time
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QLabel, QSlider, QPushButton, QFrame,
-                           QSizePolicy, QComboBox)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QBrush, QColor
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # バックエンドをAggに設定
+                           QSizePolicy, QComboBox, QCheckBox, QFileDialog, QSpinBox,
+                           QInputDialog)
+from PyQt5.QtCore import Qt, QTimer, QSize
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QBrush, QColor, QIcon
 
-# GPUアクセラレーション用のライブラリを試行
-try:
-    import cupy as cp
-    CUPY_AVAILABLE = True
-    print("CuPy detected - GPU acceleration enabled")
-except ImportError:
-    CUPY_AVAILABLE = False
-    print("CuPy not available")
+import moire_archive
+import moire_backends
+import moire_cache
+import moire_engine
+import moire_prefetch
+import moire_presets
+import moire_shm
+import moire_stream
+import moire_timeline
+import moire_viewport
 
-try:
-    import numba
-    from numba import jit, cuda
-    NUMBA_AVAILABLE = True
-    print("Numba detected - JIT compilation enabled")
-except ImportError:
-    NUMBA_AVAILABLE = False
-    print("Numba not available")
-
-try:
-    import pyopencl as cl
-    OPENCL_AVAILABLE = True
-    print("OpenCL detected - GPU acceleration enabled")
-except ImportError:
-    OPENCL_AVAILABLE = False
-    print("OpenCL not available")
+# GPUアクセラレーション用のライブラリの有無（読み込みは使用時まで遅延）
+CUPY_AVAILABLE = moire_backends.is_available("CuPy")
+NUMBA_AVAILABLE = moire_backends.is_available("Numba")
+OPENCL_AVAILABLE = moire_backends.is_available("OpenCL")
 
 # GPU利用可能かどうかの判定
 GPU_AVAILABLE = CUPY_AVAILABLE or NUMBA_AVAILABLE or OPENCL_AVAILABLE
 
+# スライダーのドラッグ中に表示するプレビューの縮小率（描画解像度に対して）
+PREVIEW_DIVISOR = 2
+
+# アーカイブ再生の速度（負の値は逆再生）
+ARCHIVE_SPEEDS = ["-2x", "-1x", "0.25x", "0.5x", "1x", "2x", "4x", "8x"]
+
+# このアプリで選べるパターンタイプ（プリセットもこの中のものだけ表示）
+QT_PATTERN_TYPES = ["Standard", "Wave", "Tree Rings"]
+
+# プリセット選択のアイコン（サムネイル）の表示サイズ
+PRESET_ICON_SIZE = 48
+
 class MoirePatternWidget(QWidget):
     def __init__(self):
         super().__init__()
@@ -59,8 +59,22 @@ class MoirePatternWidget(QWidget):
         self.use_gpu = GPU_AVAILABLE
         print(f"Initial GPU mode: {self.use_gpu}")
         
+        # GPUモード・CPUモードそれぞれで使うバックエンド（優先順位: OpenCL > CuPy > Numba）
+        self.gpu_backend = None
+        for backend in moire_backends.GPU_BACKENDS:
+            if moire_backends.is_available(backend):
+                self.gpu_backend = backend
+                break
+        self.cpu_backend = "CPU"
+        
         self.gpu_label = None
         
+        # 計算精度（全バックエンド共通）
+        self.precision = moire_engine.DEFAULT_PRECISION
+        
+        # 三角関数の計算方式（バックエンドごとに保持）
+        self.trig_modes = {backend: moire_engine.DEFAULT_TRIG for backend in moire_backends.BACKEND_MODULES}
+        
         # FPS計測用
         self.frame_times = []
         self.last_frame_time = time.time()
@@ -70,6 +84,51 @@ class MoirePatternWidget(QWidget):
         self.animation_timer.timeout.connect(self.animate)
         self.animation_running = False
         
+        # パン・ズームの表示範囲（None なら従来の全体表示）
+        self.view = None
+        self.view_buffer = None
+        self.view_key = None
+        self.drag_pos = None
+        
+        # 描画済みフレームのキャッシュ（ディスクはチェックボックスで有効化）
+        self.frame_cache = moire_cache.FrameCache()
+        
+        # スライダーのドラッグ中に次の値のプレビューを先読みする
+        self.prefetcher = moire_prefetch.ScrubPrefetcher()
+        
+        # フレームのライブ配信と共有メモリへの公開（チェックボックスで開始）
+        self.streamer = None
+        self.frame_ring = None
+        
+        # フレームアーカイブの再生（開いている間は計算せずにアーカイブを表示）
+        self.archive = None
+        self.read_ahead = None
+        self.archive_position = 0.0
+        self.archive_timer = QTimer()
+        self.archive_timer.timeout.connect(self.on_archive_tick)
+        
+        # キーフレームのタイムライン（Add Key で作成、Play Keys でプレビュー）
+        self.keyframes = None
+        self.key_values = None
+        self.key_position = 0
+        self.key_scale = 1.0
+        self.key_timer = QTimer()
+        self.key_timer.timeout.connect(self.on_key_tick)
+        
+        # プリセット（サムネイルはバックグラウンドで描画し、操作が止まったら
+        # 各プリセットの最初のフレームをフレームキャッシュへ先に描画しておく）
+        self.presets = moire_presets.presets_for(moire_presets.load_library(), QT_PATTERN_TYPES)
+        self.thumbnails = moire_presets.ThumbnailRenderer(self.presets)
+        self.thumbnail_timer = QTimer()
+        self.thumbnail_timer.timeout.connect(self.on_thumbnail_tick)
+        self.thumbnail_timer.start(100)
+        self.prewarm = moire_presets.BackgroundRenderer()
+        self.prewarm_timer = QTimer()
+        self.prewarm_timer.setSingleShot(True)
+        self.prewarm_timer.timeout.connect(self.start_prewarm)
+        self.prewarm_poll_timer = QTimer()
+        self.prewarm_poll_timer.timeout.connect(self.on_prewarm_tick)
+        
         # アニメーション設定（より動的）
         self.phase1_step = 150  # フェーズ1の変化量（さらに大きく）
         self.phase2_step = 120  # フェーズ2の変化量（さらに大きく）
@@ -136,7 +195,7 @@ class MoirePatternWidget(QWidget):
         # パターンタイプ選択
         control_layout.addWidget(QLabel("Pattern Type:"))
         self.pattern_type_combo = QComboBox()
-        self.pattern_type_combo.addItems(["Standard", "Wave", "Tree Rings"])
+        self.pattern_type_combo.addItems(QT_PATTERN_TYPES)
         self.pattern_type_combo.currentTextChanged.connect(self.on_pattern_type_changed)
         control_layout.addWidget(self.pattern_type_combo)
         
@@ -198,6 +257,51 @@ class MoirePatternWidget(QWidget):
         
         control_layout.addLayout(button_layout)
         
+        # プリセット（組み込みの presets.json とユーザーのプリセット）
+        preset_layout = QHBoxLayout()
+        preset_layout.addWidget(QLabel("Preset:"))
+        self.preset_combo = QComboBox()
+        self.preset_combo.setIconSize(QSize(PRESET_ICON_SIZE, PRESET_ICON_SIZE))
+        self.preset_combo.addItem("--")
+        for preset in self.presets:
+            self.preset_combo.addItem(preset["name"])
+        self.preset_combo.activated.connect(self.on_preset_selected)
+        preset_layout.addWidget(self.preset_combo)
+        save_preset_button = QPushButton("Save Preset")
+        save_preset_button.clicked.connect(self.save_preset)
+        preset_layout.addWidget(save_preset_button)
+        control_layout.addLayout(preset_layout)
+        
+        # キーフレーム（現在のスライダーの値を指定フレームに記録）
+        key_layout = QHBoxLayout()
+        key_layout.addWidget(QLabel("Key:"))
+        self.key_frame_spin = QSpinBox()
+        self.key_frame_spin.setRange(0, moire_timeline.DEFAULT_FRAMES - 1)
+        key_layout.addWidget(self.key_frame_spin)
+        self.key_easing_combo = QComboBox()
+        self.key_easing_combo.addItems(list(moire_timeline.EASINGS))
+        self.key_easing_combo.setCurrentText(moire_timeline.DEFAULT_EASING)
+        key_layout.addWidget(self.key_easing_combo)
+        control_layout.addLayout(key_layout)
+        
+        key_button_layout = QHBoxLayout()
+        add_key_button = QPushButton("Add Key")
+        add_key_button.clicked.connect(self.add_keyframe)
+        key_button_layout.addWidget(add_key_button)
+        self.play_keys_button = QPushButton("Play Keys")
+        self.play_keys_button.clicked.connect(self.toggle_key_playback)
+        key_button_layout.addWidget(self.play_keys_button)
+        control_layout.addLayout(key_button_layout)
+        
+        key_file_layout = QHBoxLayout()
+        save_keys_button = QPushButton("Save Keys")
+        save_keys_button.clicked.connect(self.save_keyframes)
+        key_file_layout.addWidget(save_keys_button)
+        load_keys_button = QPushButton("Load Keys")
+        load_keys_button.clicked.connect(self.load_keyframes)
+        key_file_layout.addWidget(load_keys_button)
+        control_layout.addLayout(key_file_layout)
+        
         # 情報表示
         self.info_label = QLabel("")
         control_layout.addWidget(self.info_label)
@@ -211,33 +315,64 @@ class MoirePatternWidget(QWidget):
         gpu_layout = QHBoxLayout()
         
         # 利用可能なGPU技術を表示
-        if self.use_gpu:
-            if OPENCL_AVAILABLE:
-                gpu_text = "GPU: OpenCL"
-                gpu_color = "green"
-            elif CUPY_AVAILABLE:
-                gpu_text = "GPU: CuPy"
-                gpu_color = "blue"
-            elif NUMBA_AVAILABLE:
-                gpu_text = "GPU: Numba"
-                gpu_color = "purple"
-            else:
-                gpu_text = "GPU: None"
-                gpu_color = "red"
-        else:
-            gpu_text = "GPU: Disabled"
-            gpu_color = "red"
+        gpu_text, gpu_color = self.gpu_status()
         
         self.gpu_label = QLabel(gpu_text)
         self.gpu_label.setStyleSheet(f"color: {gpu_color}; font-weight: bold;")
         gpu_layout.addWidget(self.gpu_label)
         
-        self.gpu_toggle_button = QPushButton("Switch to CPU")
+        self.gpu_toggle_button = QPushButton("Switch to CPU" if self.use_gpu else "Switch to GPU")
         self.gpu_toggle_button.clicked.connect(self.toggle_gpu_mode)
         gpu_layout.addWidget(self.gpu_toggle_button)
         
         control_layout.addLayout(gpu_layout)
         
+        # バックエンドの選択
+        backend_layout = QHBoxLayout()
+        backend_layout.addWidget(QLabel("Backend:"))
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItems(moire_backends.available_backends())
+        self.backend_combo.setCurrentText(self.current_backend())
+        self.backend_combo.currentTextChanged.connect(self.on_backend_changed)
+        backend_layout.addWidget(self.backend_combo)
+        control_layout.addLayout(backend_layout)
+        
+        # 計算精度の選択
+        precision_layout = QHBoxLayout()
+        precision_layout.addWidget(QLabel("Precision:"))
+        self.precision_combo = QComboBox()
+        self.precision_combo.addItems(list(moire_engine.PRECISIONS))
+        self.precision_combo.setCurrentText(self.precision)
+        self.precision_combo.currentTextChanged.connect(self.on_precision_changed)
+        precision_layout.addWidget(self.precision_combo)
+        control_layout.addLayout(precision_layout)
+        
+        # 高速三角関数（現在のバックエンドに対して設定）
+        self.fast_trig_checkbox = QCheckBox("Fast Trig")
+        self.fast_trig_checkbox.toggled.connect(self.on_fast_trig_toggled)
+        control_layout.addWidget(self.fast_trig_checkbox)
+        self.sync_backend_controls()
+        
+        # 描画済みフレームをディスクにも保存（次回の起動でも使える）
+        self.disk_cache_checkbox = QCheckBox("Disk Cache")
+        self.disk_cache_checkbox.toggled.connect(self.on_disk_cache_toggled)
+        control_layout.addWidget(self.disk_cache_checkbox)
+        
+        # 表示中のフレームを localhost へ配信（MJPEG / raw ARGB）
+        self.stream_checkbox = QCheckBox(f"Stream (port {moire_stream.DEFAULT_PORT})")
+        self.stream_checkbox.toggled.connect(self.on_stream_toggled)
+        control_layout.addWidget(self.stream_checkbox)
+        
+        # 表示中のフレームを共有メモリのリングへ公開（shm_reader_moire.py で読める）
+        self.shm_checkbox = QCheckBox(f"Shared Memory ({moire_shm.DEFAULT_RING_NAME})")
+        self.shm_checkbox.toggled.connect(self.on_shm_toggled)
+        control_layout.addWidget(self.shm_checkbox)
+        
+        # 書き出し済みのフレームアーカイブ（.mfa）を開いて再生
+        self.archive_button = QPushButton("Open Archive")
+        self.archive_button.clicked.connect(self.on_archive_button)
+        control_layout.addWidget(self.archive_button)
+        
         control_layout.addStretch()
         control_widget.setLayout(control_layout)
         control_widget.setFixedWidth(250)
@@ -248,14 +383,60 @@ class MoirePatternWidget(QWidget):
         self.display_label.setFrameStyle(QFrame.Box)
         self.display_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         
+        # アーカイブ再生用のタイムライン（アーカイブを開いたときだけ表示）
+        self.timeline_widget = QWidget()
+        timeline_layout = QHBoxLayout()
+        timeline_layout.setContentsMargins(0, 0, 0, 0)
+        self.archive_play_button = QPushButton("Play")
+        self.archive_play_button.clicked.connect(self.toggle_archive_playback)
+        timeline_layout.addWidget(self.archive_play_button)
+        self.timeline_slider = QSlider(Qt.Horizontal)
+        self.timeline_slider.valueChanged.connect(self.show_archive_frame)
+        timeline_layout.addWidget(self.timeline_slider, 1)
+        self.archive_speed_combo = QComboBox()
+        self.archive_speed_combo.addItems(ARCHIVE_SPEEDS)
+        self.archive_speed_combo.setCurrentText("1x")
+        timeline_layout.addWidget(self.archive_speed_combo)
+        self.archive_frame_label = QLabel()
+        timeline_layout.addWidget(self.archive_frame_label)
+        self.timeline_widget.setLayout(timeline_layout)
+        self.timeline_widget.setVisible(False)
+        
+        display_layout = QVBoxLayout()
+        display_layout.addWidget(self.display_label, 1)
+        display_layout.addWidget(self.timeline_widget)
+        
         main_layout.addWidget(control_widget)
-        main_layout.addWidget(self.display_label, 1)  # 表示エリアを拡張可能に
+        main_layout.addLayout(display_layout, 1)  # 表示エリアを拡張可能に
         
         self.setLayout(main_layout)
         
         # リサイズイベントを監視
         self.display_label.resizeEvent = self.on_display_resize
         
+        # マウスホイールで拡大・縮小、ドラッグでパン、ダブルクリックで全体表示に戻す
+        self.display_label.wheelEvent = self.on_display_wheel
+        self.display_label.mousePressEvent = self.on_display_press
+        self.display_label.mouseMoveEvent = self.on_display_move
+        self.display_label.mouseReleaseEvent = self.on_display_release
+        self.display_label.mouseDoubleClickEvent = self.on_display_double_click
+        
+        # ドラッグ中に先読みするスライダー -> (パラメータ名, スライダー値の除数)
+        self.scrub_sliders = {
+            self.freq1_slider: ("freq1", 10.0),
+            self.freq2_slider: ("freq2", 10.0),
+            self.angle1_slider: ("angle1", 1.0),
+            self.angle2_slider: ("angle2", 1.0),
+            self.phase1_slider: ("phase1", 100.0),
+            self.phase2_slider: ("phase2", 100.0),
+            self.wave_complexity_slider: ("wave_complexity", 100.0),
+            self.wave_distortion_slider: ("wave_distortion", 100.0),
+            self.tree_rings_distortion_slider: ("rings_distortion", 100.0),
+            self.tree_rings_complexity_slider: ("rings_complexity", 100.0),
+        }
+        for slider in self.scrub_sliders:
+            slider.sliderReleased.connect(self.on_slider_released)
+        
     def create_pattern(self):
         try:
             # FPS計測開始
@@ -264,22 +445,52 @@ class MoirePatternWidget(QWidget):
             # 解像度を表示サイズに比例させる
             print("Creating moire pattern...")
             # 表示サイズに応じて解像度を比例的に増加
-            resolution_x = max(300, min(1200, self.display_label.width() // 2))
-            resolution_y = max(300, min(1200, self.display_label.height() // 2))
+            resolution_x, resolution_y = self.render_resolution()
+            
+            # アーカイブを開いている間は計算せずに現在のフレームを表示し直す
+            if self.archive is not None:
+                self.show_archive_frame(self.timeline_slider.value())
+                return
+            
+            # スライダーのドラッグ中はプレビューを表示（離したときに通常の描画をする）
+            if self.view is None and self.show_scrub_preview(resolution_x, resolution_y):
+                self.update_fps(time.time() - start_time)
+                return
+            
+            # 同じ設定で描画済みならキャッシュの8bit画像を表示（パン・ズーム中は使わない）
+            cached = None
+            if self.view is None:
+                cached = self.frame_cache.get(self.frame_key(resolution_x, resolution_y))
             
-            # GPU描画かCPU描画かを選択
-            if self.use_gpu:
+            # パン・ズーム中は表示範囲だけを描画、それ以外はGPU描画かCPU描画かを選択
+            gray = None
+            if cached is not None:
+                self.show_gray(cached)
+            elif self.view is not None:
+                self.create_pattern_view()
+            elif self.use_gpu:
                 print(f"=== GPU MODE ENABLED ===")
                 print(f"OpenCL: {OPENCL_AVAILABLE}, CuPy: {CUPY_AVAILABLE}, Numba: {NUMBA_AVAILABLE}")
-                self.create_pattern_gpu(resolution_x, resolution_y)
+                gray = self.create_pattern_gpu(resolution_x, resolution_y)
             else:
                 print(f"=== CPU MODE ENABLED ===")
-                self.create_pattern_cpu(resolution_x, resolution_y)
+                gray = self.create_pattern_cpu(resolution_x, resolution_y)
+            
+            # 再生中のフレームは二度と使われないので保存しない（プリセットの先行描画を
+            # LRU から追い出し、ディスクキャッシュにも書き込んでしまう）。
+            # GPUからCPUへのフォールバックもあるので、キーは描画後の状態で作る
+            if gray is not None and not self.playing():
+                self.frame_cache.put(self.frame_key(resolution_x, resolution_y), gray)
             
             # FPS計測終了と更新
             end_time = time.time()
             frame_time = end_time - start_time
             self.update_fps(frame_time)
+            self.publish_frame()
+            
+            # 操作中はプリセットの先行描画を止め、操作が止まったら描画しておく
+            self.prewarm.clear()
+            self.prewarm_timer.start(moire_presets.PREWARM_IDLE_MS)
             
             print("Pattern created and displayed successfully!")
             
@@ -287,7 +498,7 @@ class MoirePatternWidget(QWidget):
             print(f"Error creating pattern: {e}")
             
     def create_pattern_gpu(self, resolution_x, resolution_y):
-        """GPUを使用したモアレパターン生成"""
+        """GPUを使用したモアレパターン生成（描画した8bit画像を返す）"""
         try:
             # パラメータ取得
             freq1 = self.freq1_slider.value() / 10.0
@@ -311,18 +522,19 @@ class MoirePatternWidget(QWidget):
             image = QImage(display_width, display_height, QImage.Format_RGB32)
             image.fill(QColor(255, 255, 255))  # 白で初期化
             
-            # GPU計算でモアレパターンを生成（優先順位: OpenCL > CuPy > Numba）
-            if OPENCL_AVAILABLE:
+            # 選択中のGPUバックエンドでモアレパターンを生成
+            if self.gpu_backend == "OpenCL":
                 moire_pattern = self.calculate_moire_gpu_opencl(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
-            elif CUPY_AVAILABLE:
+            elif self.gpu_backend == "CuPy":
                 moire_pattern = self.calculate_moire_gpu_cupy(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
-            elif NUMBA_AVAILABLE:
+            elif self.gpu_backend == "Numba":
                 moire_pattern = self.calculate_moire_gpu_numba(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
             else:
                 raise Exception("No GPU acceleration available")
             
-            # QImageに描画
-            self.draw_pattern_to_image(image, moire_pattern, display_width, display_height)
+            # モアレパターンをグレースケールに変換してQImageに描画
+            gray_pattern = ((moire_pattern + 1) / 2 * 255).astype(np.uint8)
+            self.draw_pattern_to_image(image, gray_pattern, display_width, display_height)
             
             # QPixmapに変換して表示
             pixmap = QPixmap.fromImage(image)
@@ -330,16 +542,19 @@ class MoirePatternWidget(QWidget):
             
             # 情報更新
             self.update_info()
+            return gray_pattern
             
         except Exception as e:
             print(f"GPU rendering failed, falling back to CPU: {e}")
             self.use_gpu = False
             self.gpu_label.setText("GPU: Disabled (fallback)")
             self.gpu_label.setStyleSheet("color: red; font-weight: bold;")
-            self.create_pattern_cpu(resolution_x, resolution_y)
+            self.gpu_toggle_button.setText("Switch to GPU")
+            self.sync_backend_controls()
+            return self.create_pattern_cpu(resolution_x, resolution_y)
             
     def create_pattern_cpu(self, resolution_x, resolution_y):
-        """CPUを使用したモアレパターン生成（従来のmatplotlib方式）"""
+        """CPUを使用したモアレパターン生成（エンジンの8bit出力をそのまま表示して返す）"""
         # パラメータ取得
         freq1 = self.freq1_slider.value() / 10.0
         freq2 = self.freq2_slider.value() / 10.0
@@ -374,39 +589,23 @@ class MoirePatternWidget(QWidget):
         print(f"CPU Display size: {display_width}x{display_height}, Resolution: {resolution_x}x{resolution_y}")
         
         # パターンタイプに応じて計算メソッドを選択
-        if pattern_type == "Wave":
+        if self.cpu_backend == "NumExpr":
+            params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+            moire_pattern = moire_backends.calculate_numexpr(pattern_type, resolution_x, resolution_y, params, self.precision)
+        elif pattern_type == "Wave":
             moire_pattern = self.calculate_wave_pattern(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
         elif pattern_type == "Tree Rings":
             moire_pattern = self.calculate_tree_rings_pattern(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
         else:  # Standard
             moire_pattern = self.calculate_moire_cpu_fallback(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
         
-        # matplotlibでプロット（横と縦の比率を保持）
-        fig_width = max(4, display_width / 100)
-        fig_height = max(4, display_height / 100)
-        fig, ax = plt.subplots(figsize=(fig_width, fig_height), dpi=100)
-        im = ax.imshow(moire_pattern, cmap='gray', extent=[-2, 2, -2, 2], 
-                      aspect='auto', vmin=-1, vmax=1)
-        ax.set_title(f'Moire Pattern - {pattern_type}')
-        ax.axis('off')
-        
-        # 画像をQPixmapに変換
-        fig.canvas.draw()
-        buf = np.frombuffer(fig.canvas.tostring_rgb(), dtype=np.uint8)
-        buf = buf.reshape(fig.canvas.get_width_height()[::-1] + (3,))
-        
-        height, width, channel = buf.shape
-        bytes_per_line = 3 * width
-        q_image = QImage(buf.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_image)
-        
         # 表示エリアに合わせてスケール（横と縦を最大限活用）
-        scaled_pixmap = pixmap.scaled(self.display_label.size(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-        self.display_label.setPixmap(scaled_pixmap)
-        plt.close(fig)
+        gray = moire_engine.to_gray(moire_pattern)
+        self.display_label.setPixmap(self.gray_pixmap(gray))
         
         # 情報更新
         self.update_info()
+        return gray
     
     def on_pattern_type_changed(self):
         """パターンタイプ変更時の処理"""
@@ -448,160 +647,22 @@ class MoirePatternWidget(QWidget):
         
     def calculate_moire_gpu_cupy(self, resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2):
         """CuPyを使用したGPU計算"""
-        # グリッド作成
-        x = cp.linspace(-2, 2, resolution_x)
-        y = cp.linspace(-2, 2, resolution_y)
-        X, Y = cp.meshgrid(x, y)
-        
-        # 第1パターン
-        angle1_rad = cp.radians(angle1)
-        rotated_x1 = X * cp.cos(angle1_rad) + Y * cp.sin(angle1_rad)
-        pattern1 = cp.sin(2 * cp.pi * freq1 * rotated_x1 + phase1)
-        
-        # 第2パターン
-        angle2_rad = cp.radians(angle2)
-        rotated_x2 = X * cp.cos(angle2_rad) + Y * cp.sin(angle2_rad)
-        pattern2 = cp.sin(2 * cp.pi * freq2 * rotated_x2 + phase2)
-        
-        # モアレパターン
-        moire_pattern = pattern1 * pattern2
-        
-        # CPUに戻す
-        return cp.asnumpy(moire_pattern)
+        params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+        return moire_backends.calculate_standard_cupy(resolution_x, resolution_y, params, self.precision,
+                                                       self.trig_modes["CuPy"])
         
     def calculate_moire_gpu_numba(self, resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2):
-        """Numbaを使用したGPU計算"""
-        @jit(nopython=True, parallel=True)
-        def calculate_pattern(x, y, freq, angle, phase):
-            result = np.zeros((len(y), len(x)))
-            angle_rad = np.radians(angle)
-            cos_a = np.cos(angle_rad)
-            sin_a = np.sin(angle_rad)
-            
-            for i in range(len(y)):
-                for j in range(len(x)):
-                    rotated_x = x[j] * cos_a + y[i] * sin_a
-                    result[i, j] = np.sin(2 * np.pi * freq * rotated_x + phase)
-            return result
-        
-        # グリッド作成
-        x = np.linspace(-2, 2, resolution_x)
-        y = np.linspace(-2, 2, resolution_y)
-        
-        # パターン計算
-        pattern1 = calculate_pattern(x, y, freq1, angle1, phase1)
-        pattern2 = calculate_pattern(x, y, freq2, angle2, phase2)
-        
-        # モアレパターン
-        return pattern1 * pattern2
+        """Numbaを使用した並列計算"""
+        params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+        return moire_backends.calculate_standard_numba(resolution_x, resolution_y, params, self.precision,
+                                                       self.trig_modes["Numba"])
         
     def calculate_moire_gpu_opencl(self, resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2):
         """OpenCLを使用したGPU計算"""
         try:
-            # OpenCLコンテキストとキューの初期化
-            if not hasattr(self, 'cl_ctx'):
-                print("=== OpenCL Initialization ===")
-                # プラットフォームとデバイスを自動選択
-                platforms = cl.get_platforms()
-                print(f"Found {len(platforms)} OpenCL platforms:")
-                for i, p in enumerate(platforms):
-                    print(f"  [{i}] {p.name}")
-                
-                if not platforms:
-                    raise Exception("No OpenCL platforms found")
-                
-                # Appleプラットフォームを優先
-                platform = None
-                for p in platforms:
-                    if 'Apple' in p.name:
-                        platform = p
-                        break
-                if not platform:
-                    platform = platforms[0]  # 最初のプラットフォームを使用
-                
-                print(f"Selected platform: {platform.name}")
-                
-                # GPUデバイスを優先
-                devices = platform.get_devices(cl.device_type.GPU)
-                if not devices:
-                    devices = platform.get_devices(cl.device_type.ALL)
-                
-                print(f"Found {len(devices)} OpenCL devices:")
-                for i, d in enumerate(devices):
-                    print(f"  [{i}] {d.name} ({d.type})")
-                
-                if not devices:
-                    raise Exception("No OpenCL devices found")
-                
-                self.cl_ctx = cl.Context(devices)
-                self.cl_queue = cl.CommandQueue(self.cl_ctx)
-                print(f"OpenCL context created with {len(devices)} device(s)")
-                print("=== OpenCL Ready ===")
-                
-                # OpenCLカーネルコード
-                kernel_code = """
-                __kernel void calculate_moire(
-                    __global const float* x_coords,
-                    __global const float* y_coords,
-                    __global float* result,
-                    const float freq1, const float freq2,
-                    const float angle1, const float angle2,
-                    const float phase1, const float phase2,
-                    const int width, const int height
-                ) {
-                    int gid = get_global_id(0);
-                    int x = gid % width;
-                    int y = gid / width;
-                    
-                    if (y >= height) return;
-                    
-                    float x_val = x_coords[x];
-                    float y_val = y_coords[y];
-                    
-                    // 第1パターン
-                    float angle1_rad = angle1 * 0.0174533f; // degrees to radians
-                    float rotated_x1 = x_val * cos(angle1_rad) + y_val * sin(angle1_rad);
-                    float pattern1 = sin(2.0f * 3.14159f * freq1 * rotated_x1 + phase1);
-                    
-                    // 第2パターン
-                    float angle2_rad = angle2 * 0.0174533f; // degrees to radians
-                    float rotated_x2 = x_val * cos(angle2_rad) + y_val * sin(angle2_rad);
-                    float pattern2 = sin(2.0f * 3.14159f * freq2 * rotated_x2 + phase2);
-                    
-                    // モアレパターン
-                    result[gid] = pattern1 * pattern2;
-                }
-                """
-                
-                # カーネルをコンパイル
-                self.cl_program = cl.Program(self.cl_ctx, kernel_code).build()
-            
-            # グリッド作成
-            x = np.linspace(-2, 2, resolution_x, dtype=np.float32)
-            y = np.linspace(-2, 2, resolution_y, dtype=np.float32)
-            
-            # GPUバッファを作成
-            x_buf = cl.Buffer(self.cl_ctx, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=x)
-            y_buf = cl.Buffer(self.cl_ctx, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=y)
-            result_buf = cl.Buffer(self.cl_ctx, cl.mem_flags.WRITE_ONLY, size=resolution_x * resolution_y * 4)
-            
-            # カーネルを実行
-            global_size = (resolution_x * resolution_y,)
-            print(f"Executing OpenCL kernel with {global_size[0]} work items...")
-            
-            self.cl_program.calculate_moire(
-                self.cl_queue, global_size, None,
-                x_buf, y_buf, result_buf,
-                np.float32(freq1), np.float32(freq2),
-                np.float32(angle1), np.float32(angle2),
-                np.float32(phase1), np.float32(phase2),
-                np.int32(resolution_x), np.int32(resolution_y)
-            )
-            
-            # 結果を取得
-            result = np.empty((resolution_y, resolution_x), dtype=np.float32)
-            cl.enqueue_copy(self.cl_queue, result, result_buf)
-            
+            params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+            result = moire_backends.calculate_standard_opencl(resolution_x, resolution_y, params, self.precision,
+                                                       self.trig_modes["OpenCL"])
             print(f"OpenCL calculation completed: {result.shape}")
             return result
             
@@ -610,116 +671,44 @@ class MoirePatternWidget(QWidget):
             # フォールバック: CPU計算
             return self.calculate_moire_cpu_fallback(resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2)
     
+    def current_params(self):
+        """スライダーの値からエンジン用のパラメータ辞書を作成"""
+        return self.get_params(self.freq1_slider.value() / 10.0, self.freq2_slider.value() / 10.0,
+                               self.angle1_slider.value(), self.angle2_slider.value(),
+                               self.phase1_slider.value() / 100.0, self.phase2_slider.value() / 100.0)
+    
+    def get_params(self, freq1, freq2, angle1, angle2, phase1, phase2):
+        """エンジン用のパラメータ辞書を作成"""
+        return moire_engine.make_params(
+            freq1=freq1, freq2=freq2, angle1=angle1, angle2=angle2,
+            phase1=phase1, phase2=phase2,
+            wave_complexity=self.wave_complexity_slider.value() / 100.0,
+            wave_distortion=self.wave_distortion_slider.value() / 100.0,
+            rings_distortion=self.tree_rings_distortion_slider.value() / 100.0,
+            rings_complexity=self.tree_rings_complexity_slider.value() / 100.0)
+    
     def calculate_moire_cpu_fallback(self, resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2):
         """CPUフォールバック計算"""
-        # グリッド作成
-        x = np.linspace(-2, 2, resolution_x)
-        y = np.linspace(-2, 2, resolution_y)
-        X, Y = np.meshgrid(x, y)
-        
-        # 第1パターン
-        angle1_rad = np.radians(angle1)
-        rotated_x1 = X * np.cos(angle1_rad) + Y * np.sin(angle1_rad)
-        pattern1 = np.sin(2 * np.pi * freq1 * rotated_x1 + phase1)
-        
-        # 第2パターン
-        angle2_rad = np.radians(angle2)
-        rotated_x2 = X * np.cos(angle2_rad) + Y * np.sin(angle2_rad)
-        pattern2 = np.sin(2 * np.pi * freq2 * rotated_x2 + phase2)
-        
-        # モアレパターン
-        return pattern1 * pattern2
+        params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+        return moire_engine.calculate_pattern("Standard", resolution_x, resolution_y, params,
+                                              precision=self.precision, trig=self.trig_modes["CPU"])
     
     def calculate_wave_pattern(self, resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2):
         """波模様パターン生成（拡張版）"""
-        # 追加パラメーターを取得
-        complexity = self.wave_complexity_slider.value() / 100.0
-        distortion = self.wave_distortion_slider.value() / 100.0
-        
-        # グリッド作成
-        x = np.linspace(-3, 3, resolution_x)
-        y = np.linspace(-3, 3, resolution_y)
-        X, Y = np.meshgrid(x, y)
-        
-        # 角度をラジアンに変換
-        angle1_rad = np.radians(angle1)
-        angle2_rad = np.radians(angle2)
-        
-        # 回転した座標
-        X1 = X * np.cos(angle1_rad) + Y * np.sin(angle1_rad)
-        Y1 = -X * np.sin(angle1_rad) + Y * np.cos(angle1_rad)
-        X2 = X * np.cos(angle2_rad) + Y * np.sin(angle2_rad)
-        Y2 = -X * np.sin(angle2_rad) + Y * np.cos(angle2_rad)
-        
-        # 歪み効果を追加
-        distortion_factor = 1.0 + distortion * np.sin(X * Y * 0.5)
-        X1 *= distortion_factor
-        Y1 *= distortion_factor
-        X2 *= distortion_factor
-        Y2 *= distortion_factor
-        
-        # 複雑さに基づいて波の数を調整
-        complexity_factor = 1.0 + complexity * 2.0
-        
-        # 波模様パターン（複雑さと歪みを考慮）
-        pattern1 = (np.sin(2 * np.pi * freq1 * X1 + phase1) + 
-                   np.sin(2 * np.pi * freq1 * 0.5 * Y1 + phase1 * 0.7) +
-                   complexity * np.sin(2 * np.pi * freq1 * complexity_factor * (X1 + Y1) + phase1 * 1.5))
-        
-        pattern2 = (np.sin(2 * np.pi * freq2 * X2 + phase2) + 
-                   np.sin(2 * np.pi * freq2 * 0.7 * Y2 + phase2 * 1.3) +
-                   complexity * np.sin(2 * np.pi * freq2 * complexity_factor * (X2 - Y2) + phase2 * 0.8))
-        
-        # 波模様のモアレパターン
-        return pattern1 * pattern2
+        params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+        return moire_engine.calculate_pattern("Wave", resolution_x, resolution_y, params,
+                                              precision=self.precision, trig=self.trig_modes["CPU"])
     
     def calculate_tree_rings_pattern(self, resolution_x, resolution_y, freq1, freq2, angle1, angle2, phase1, phase2):
         """木の年輪パターン生成（拡張版）"""
-        # 追加パラメーターを取得
-        distortion = self.tree_rings_distortion_slider.value() / 100.0
-        complexity = self.tree_rings_complexity_slider.value() / 100.0
-        
-        # グリッド作成
-        x = np.linspace(-2, 2, resolution_x)
-        y = np.linspace(-2, 2, resolution_y)
-        X, Y = np.meshgrid(x, y)
-        
-        # 中心からの距離を計算（歪み効果を追加）
-        R = np.sqrt(X**2 + Y**2)
+        params = self.get_params(freq1, freq2, angle1, angle2, phase1, phase2)
+        return moire_engine.calculate_pattern("Tree Rings", resolution_x, resolution_y, params,
+                                              precision=self.precision, trig=self.trig_modes["CPU"])
         
-        # 歪み効果：年輪を楕円形や不規則な形にする
-        distortion_factor = 1.0 + distortion * np.sin(X * 2.0) * np.cos(Y * 2.0)
-        R_distorted = R * distortion_factor
-        
-        # 角度をラジアンに変換
-        angle1_rad = np.radians(angle1)
-        angle2_rad = np.radians(angle2)
-        
-        # 回転した座標
-        X1 = X * np.cos(angle1_rad) + Y * np.sin(angle1_rad)
-        Y1 = -X * np.sin(angle1_rad) + Y * np.cos(angle1_rad)
-        X2 = X * np.cos(angle2_rad) + Y * np.sin(angle2_rad)
-        Y2 = -X * np.sin(angle2_rad) + Y * np.cos(angle2_rad)
-        
-        # 複雑さに基づいて追加の波を生成
-        complexity_factor = 1.0 + complexity * 3.0
-        
-        # 年輪パターン（歪みと複雑さを考慮）
-        pattern1 = (np.sin(2 * np.pi * freq1 * R_distorted + phase1) * 
-                   np.sin(2 * np.pi * freq1 * 0.3 * X1 + phase1 * 0.5) +
-                   complexity * np.sin(2 * np.pi * freq1 * complexity_factor * R_distorted + phase1 * 1.2))
-        
-        pattern2 = (np.sin(2 * np.pi * freq2 * R_distorted + phase2) * 
-                   np.sin(2 * np.pi * freq2 * 0.4 * Y2 + phase2 * 0.8) +
-                   complexity * np.sin(2 * np.pi * freq2 * complexity_factor * R_distorted + phase2 * 0.6))
-        
-        # 年輪のモアレパターン
-        return pattern1 * pattern2
-        
-    def draw_pattern_to_image(self, image, moire_pattern, display_width, display_height):
-        """モアレパターンをQImageに描画（最適化版）"""
+    def draw_pattern_to_image(self, image, gray_pattern, display_width, display_height):
+        """8bitグレースケールのモアレパターンをQImageに描画（最適化版）"""
         # パターンのサイズ
-        pattern_height, pattern_width = moire_pattern.shape
+        pattern_height, pattern_width = gray_pattern.shape
         
         # スケール計算
         scale_x = display_width / pattern_width
@@ -729,9 +718,6 @@ class MoirePatternWidget(QWidget):
         bits = image.bits()
         bits.setsize(display_width * display_height * 4)  # 32bit = 4 bytes
         
-        # モアレパターンをグレースケールに変換
-        gray_pattern = ((moire_pattern + 1) / 2 * 255).astype(np.uint8)
-        
         # 各ピクセルを描画（最適化）
         for y in range(pattern_height):
             for x in range(pattern_width):
@@ -758,31 +744,565 @@ class MoirePatternWidget(QWidget):
                             bits[offset + 2] = gray_value # Red
                             bits[offset + 3] = 255        # Alpha
               
+    def create_pattern_view(self, pan=None):
+        """表示範囲（パン・ズーム）の部分だけを画面解像度で描画
+
+        pan=(dx, dy) のときは前回の画像をずらし、新しく見えた帯だけを計算する。
+        """
+        width = self.display_label.width()
+        height = self.display_label.height()
+        pattern_type = self.pattern_type_combo.currentText()
+        params = self.current_params()
+        trig = self.trig_modes["CPU"]
+        key = (pattern_type, tuple(params.items()), self.precision, trig, width, height,
+               self.view["step_x"], self.view["step_y"])
+        
+        if pan is not None and self.view_buffer is not None and key == self.view_key:
+            self.view = moire_viewport.pan_buffer(pattern_type, self.view, self.view_buffer,
+                                                  pan[0], pan[1], params, self.precision, trig)
+        else:
+            if pan is not None:
+                self.view = moire_viewport.pan_view(self.view, pan[0], pan[1])
+            self.view_buffer = moire_viewport.render_view(pattern_type, self.view, width, height,
+                                                          params, self.precision, trig)
+        self.view_key = key
+        
+        # QImage.Format_RGB32 の配列を直接表示（fromImage でコピーされる）
+        argb = moire_engine.gray_to_argb(self.view_buffer)
+        image = QImage(argb.data, width, height, width * 4, QImage.Format_RGB32)
+        self.display_label.setPixmap(QPixmap.fromImage(image))
+        self.update_info()
+    
+    def ensure_view(self):
+        """パン・ズームを始めるときに全体表示と同じ表示範囲を用意"""
+        if self.view is None:
+            self.view = moire_viewport.default_view(self.pattern_type_combo.currentText(),
+                                                    self.display_label.width(),
+                                                    self.display_label.height())
+    
+    def reset_view(self):
+        """パン・ズームを解除して全体表示に戻す"""
+        self.view = None
+        self.view_buffer = None
+        self.view_key = None
+        self.create_pattern()
+    
+    def on_display_wheel(self, event):
+        """マウスホイールでカーソル位置を中心に拡大・縮小"""
+        steps = event.angleDelta().y() / 120
+        if steps == 0:
+            return
+        self.ensure_view()
+        self.view = moire_viewport.zoom_view(
+            self.view, moire_viewport.ZOOM_STEP ** steps, event.pos().x(), event.pos().y(),
+            self.pattern_type_combo.currentText(), self.display_label.width(),
+            self.display_label.height())
+        self.create_pattern()
+    
+    def on_display_press(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_pos = event.pos()
+    
+    def on_display_move(self, event):
+        """ドラッグでパン（描画済みの部分はずらして再利用）"""
+        if self.drag_pos is None:
+            return
+        dx = event.pos().x() - self.drag_pos.x()
+        dy = event.pos().y() - self.drag_pos.y()
+        if dx == 0 and dy == 0:
+            return
+        self.drag_pos = event.pos()
+        self.ensure_view()
+        start_time = time.time()
+        try:
+            self.create_pattern_view(pan=(dx, dy))
+        except Exception as e:
+            print(f"Error panning pattern: {e}")
+        self.update_fps(time.time() - start_time)
+        self.publish_frame()
+    
+    def on_display_release(self, event):
+        self.drag_pos = None
+    
+    def on_display_double_click(self, event):
+        self.reset_view()
+    
+    def on_stream_toggled(self, checked):
+        """フレーム配信の開始・停止"""
+        if checked:
+            try:
+                self.streamer = moire_stream.FrameStreamer()
+            except OSError as e:
+                print(f"Could not start streaming: {e}")
+                self.stream_checkbox.blockSignals(True)
+                self.stream_checkbox.setChecked(False)
+                self.stream_checkbox.blockSignals(False)
+                return
+            host, port = self.streamer.address
+            print(f"Streaming on http://{host}:{port}/stream.mjpg and /stream.raw")
+        elif self.streamer is not None:
+            self.streamer.close()
+            self.streamer = None
+    
+    def on_shm_toggled(self, checked):
+        """共有メモリへの公開の開始・停止"""
+        if checked:
+            try:
+                self.frame_ring = moire_shm.FrameRing()
+            except (OSError, ValueError) as e:
+                print(f"Could not create shared memory: {e}")
+                self.shm_checkbox.blockSignals(True)
+                self.shm_checkbox.setChecked(False)
+                self.shm_checkbox.blockSignals(False)
+                return
+            print(f"Publishing frames to shared memory {self.frame_ring.name}")
+        elif self.frame_ring is not None:
+            self.frame_ring.close()
+            self.frame_ring = None
+    
+    def render_resolution(self):
+        """表示サイズに比例した描画解像度"""
+        return (max(300, min(1200, self.display_label.width() // 2)),
+                max(300, min(1200, self.display_label.height() // 2)))
+    
+    def frame_key(self, resolution_x, resolution_y, pattern_type=None, params=None):
+        """表示中の設定でのフレームキャッシュのキー（パターンとパラメータは指定もできる）"""
+        backend = self.current_backend()
+        if pattern_type is None:
+            pattern_type = self.pattern_type_combo.currentText()
+        if params is None:
+            params = self.current_params()
+        return moire_cache.frame_key(
+            pattern_type, resolution_x, resolution_y, params, self.precision,
+            self.trig_modes[backend], backend, colormap="gray", gpu=self.use_gpu)
+    
+    def playing(self):
+        """アニメーション・キーフレーム・アーカイブを再生中か"""
+        return (self.animation_running or self.key_timer.isActive()
+                or self.archive_timer.isActive())
+    
+    def displayed_frame(self):
+        """表示中の画像を uint8 の (H, W, 4)（0xFFRRGGBB のバイト列）で取得（なければ None）"""
+        pixmap = self.display_label.pixmap()
+        if pixmap is None or pixmap.isNull():
+            return None
+        image = pixmap.toImage().convertToFormat(QImage.Format_RGB32)
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        # 行末のパディングを除く（QImage が解放されるのでコピーする）
+        rows = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+        return rows[:, :image.width() * 4].reshape(image.height(), image.width(), 4).copy()
+    
+    def gray_pixmap(self, gray, transformation=Qt.SmoothTransformation):
+        """8bitグレースケールの画像を表示エリアの大きさに拡大した QPixmap"""
+        height, width = gray.shape
+        argb = moire_engine.gray_to_argb(gray)
+        image = QImage(argb.data, width, height, width * 4, QImage.Format_RGB32)
+        # fromImage でコピーされるので argb は解放してよい
+        return QPixmap.fromImage(image).scaled(self.display_label.size(), Qt.IgnoreAspectRatio,
+                                               transformation)
+    
+    def show_gray(self, gray):
+        """キャッシュの8bit画像を表示（GPU描画のフレームは GPU 描画と同じく最近傍で拡大）"""
+        transformation = Qt.FastTransformation if self.use_gpu else Qt.SmoothTransformation
+        self.display_label.setPixmap(self.gray_pixmap(gray, transformation))
+        self.update_info()
+    
+    def show_scrub_preview(self, resolution_x, resolution_y):
+        """スライダーのドラッグ中ならプレビューを表示（先読み済みなら描画を待たない）"""
+        slider = self.sender()
+        if slider not in self.scrub_sliders or not slider.isSliderDown():
+            return False
+        name, divisor = self.scrub_sliders[slider]
+        pattern_type = self.pattern_type_combo.currentText()
+        params = self.current_params()
+        width = resolution_x // PREVIEW_DIVISOR
+        height = resolution_y // PREVIEW_DIVISOR
+        trig = self.trig_modes["CPU"]
+        
+        def job(value):
+            job_params = dict(params, **{name: value / divisor})
+            key = moire_cache.frame_key(pattern_type, width, height, job_params, self.precision,
+                                        trig, preview=True)
+            return key, (pattern_type, width, height, job_params, self.precision, trig)
+        
+        self.prefetcher.observe(name, slider.value(), slider.minimum(), slider.maximum(), job)
+        key, args = job(slider.value())
+        gray = self.prefetcher.get(key)
+        if gray is None:
+            gray = moire_prefetch.render_preview(*args)
+            self.prefetcher.put(key, gray)
+        self.display_label.setPixmap(self.gray_pixmap(gray, Qt.FastTransformation))
+        self.update_info()
+        return True
+    
+    def on_slider_released(self):
+        """ドラッグ終了: 先読みを取り消して通常の解像度で描画"""
+        self.prefetcher.cancel()
+        self.create_pattern()
+    
+    def on_archive_button(self):
+        """アーカイブを開く・閉じる"""
+        if self.archive is not None:
+            self.close_archive()
+            return
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Open Frame Archive", "",
+            f"Moire frame archives (*{moire_archive.ARCHIVE_EXTENSION})")
+        if path:
+            self.open_archive(path)
+    
+    def open_archive(self, path):
+        """アーカイブを np.memmap で開き、タイムラインを表示"""
+        try:
+            archive = moire_archive.FrameArchive(path)
+        except (OSError, ValueError) as e:
+            print(f"Could not open archive: {e}")
+            return
+        if len(archive) == 0:
+            print(f"Archive {path} has no frames")
+            return
+        self.archive = archive
+        self.read_ahead = moire_archive.ReadAhead(archive)
+        self.archive_position = 0.0
+        self.archive_button.setText("Close Archive")
+        self.timeline_slider.blockSignals(True)
+        self.timeline_slider.setRange(0, len(archive) - 1)
+        self.timeline_slider.setValue(0)
+        self.timeline_slider.blockSignals(False)
+        self.timeline_widget.setVisible(True)
+        print(f"Opened archive {path}: {len(archive)} frames, {archive.width}x{archive.height}, "
+              f"{archive.fmt}, {archive.fps:g} fps")
+        self.show_archive_frame(0)
+    
+    def close_archive(self):
+        """アーカイブを閉じて通常の描画に戻る"""
+        self.archive_timer.stop()
+        self.archive_play_button.setText("Play")
+        self.read_ahead.close()
+        self.archive.close()
+        self.archive = None
+        self.read_ahead = None
+        self.archive_button.setText("Open Archive")
+        self.timeline_widget.setVisible(False)
+        self.create_pattern()
+    
+    def show_archive_frame(self, index):
+        """アーカイブの index 番目のフレームを表示（シークはファイル上の位置の計算だけ）"""
+        if self.archive is None:
+            return
+        frame = self.archive.frame(index)
+        self.read_ahead.seek(index)
+        argb = frame if self.archive.fmt == "argb" else moire_engine.gray_to_argb(frame)
+        image = QImage(np.ascontiguousarray(argb).data, self.archive.width, self.archive.height,
+                       self.archive.width * 4, QImage.Format_RGB32)
+        self.display_label.setPixmap(QPixmap.fromImage(image).scaled(
+            self.display_label.size(), Qt.IgnoreAspectRatio, Qt.FastTransformation))
+        self.archive_frame_label.setText(f"{index + 1}/{len(self.archive)}")
+        self.publish_frame()
+    
+    def toggle_archive_playback(self):
+        """アーカイブの再生・一時停止（アーカイブの fps で進める）"""
+        if self.archive_timer.isActive():
+            self.archive_timer.stop()
+            self.archive_play_button.setText("Play")
+        else:
+            self.archive_position = float(self.timeline_slider.value())
+            self.archive_timer.start(max(1, int(round(1000 / self.archive.fps))))
+            self.archive_play_button.setText("Pause")
+    
+    def on_archive_tick(self):
+        """再生中に速度の分だけ進める（端で折り返してループ）"""
+        speed = float(self.archive_speed_combo.currentText().rstrip("x"))
+        self.archive_position = (self.archive_position + speed) % len(self.archive)
+        self.timeline_slider.setValue(int(self.archive_position))
+    
+    def add_keyframe(self):
+        """表示中のパターンのパラメータを全て、指定フレームのキーフレームとして記録"""
+        pattern_type = self.pattern_type_combo.currentText()
+        if self.keyframes is None or self.keyframes["pattern_type"] != pattern_type:
+            self.keyframes = moire_timeline.new_timeline(pattern_type, self.current_params())
+        params = self.current_params()
+        frame = self.key_frame_spin.value()
+        for name in moire_engine.PATTERN_PARAMS[pattern_type]:
+            moire_timeline.add_keyframe(self.keyframes, name, frame, params[name],
+                                        self.key_easing_combo.currentText())
+        print(f"Added keyframe at frame {frame} ({pattern_type})")
+    
+    def save_keyframes(self):
+        """タイムラインを JSON で保存（moire.py timeline で書き出せる）"""
+        if self.keyframes is None:
+            print("No keyframes to save")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Timeline", "", "Timelines (*.json)")
+        if path:
+            moire_timeline.save_timeline(self.keyframes, path)
+            print(f"Saved timeline {path}")
+    
+    def load_keyframes(self):
+        """JSON のタイムラインを読み込む"""
+        path, _ = QFileDialog.getOpenFileName(self, "Load Timeline", "", "Timelines (*.json)")
+        if not path:
+            return
+        # ウィジェットに触る前に内容を全て確かめる（不正なファイルでは何も変えない）
+        try:
+            keyframes = moire_timeline.load_timeline(path)
+            if keyframes["pattern_type"] not in QT_PATTERN_TYPES:
+                raise ValueError(f"{keyframes['pattern_type']} is not available in this window")
+        except (OSError, ValueError) as e:
+            print(f"Could not load timeline: {e}")
+            return
+        # 再生中なら止める（評価済みの値は前のタイムラインのもの）
+        if self.key_timer.isActive():
+            self.toggle_key_playback()
+        self.keyframes = keyframes
+        self.pattern_type_combo.setCurrentText(self.keyframes["pattern_type"])
+        self.key_frame_spin.setRange(0, self.keyframes["frames"] - 1)
+        print(f"Loaded timeline {path}: {len(self.keyframes['tracks'])} tracks")
+    
+    def toggle_key_playback(self):
+        """タイムラインのプレビュー再生・停止（全フレームのパラメータは開始時にまとめて評価）"""
+        if self.key_timer.isActive():
+            self.key_timer.stop()
+            self.play_keys_button.setText("Play Keys")
+            self.create_pattern()
+            return
+        if self.keyframes is None:
+            print("No keyframes to play")
+            return
+        self.key_values = moire_timeline.evaluate_timeline(self.keyframes)
+        self.key_position = 0
+        self.key_timer.start(max(1, int(round(1000 / self.keyframes["fps"]))))
+        self.play_keys_button.setText("Stop Keys")
+    
+    def on_key_tick(self):
+        """タイムラインの1フレームを描画（間に合わなければ解像度を下げる）"""
+        start = time.perf_counter()
+        width = max(16, int(self.display_label.width() // 2 * self.key_scale))
+        height = max(16, int(self.display_label.height() // 2 * self.key_scale))
+        gray = moire_engine.render(self.keyframes["pattern_type"], width, height,
+                                   moire_timeline.frame_params(self.key_values, self.key_position),
+                                   precision=self.precision, trig=self.trig_modes["CPU"])
+        self.display_label.setPixmap(self.gray_pixmap(gray, Qt.FastTransformation))
+        self.key_frame_spin.setValue(self.key_position)
+        self.key_position = (self.key_position + 1) % self.keyframes["frames"]
+        elapsed = time.perf_counter() - start
+        self.key_scale = moire_timeline.adapt_preview_scale(self.key_scale, elapsed,
+                                                            1.0 / self.keyframes["fps"])
+        self.update_fps(elapsed)
+        self.publish_frame()
+    
+    def preset_slider_values(self, preset):
+        """プリセットのパラメータをスライダーの値に変換"""
+        params = moire_presets.preset_params(preset)
+        return {slider: int(round(params[name] * divisor))
+                for slider, (name, divisor) in self.scrub_sliders.items()}
+    
+    def set_controls(self, pattern_type, values):
+        """パターンタイプとスライダーの値を設定（描画し直さないようシグナルを止める）"""
+        widgets = [self.pattern_type_combo] + list(values)
+        for widget in widgets:
+            widget.blockSignals(True)
+        self.pattern_type_combo.setCurrentText(pattern_type)
+        for slider, value in values.items():
+            slider.setValue(value)
+        for widget in widgets:
+            widget.blockSignals(False)
+    
+    def apply_preset(self, preset):
+        """プリセットを表示（先に描画済みならフレームキャッシュから即座に表示される）"""
+        print(f"Applying preset {preset['name']}")
+        self.view = None
+        self.set_controls(preset["pattern_type"], self.preset_slider_values(preset))
+        # 追加パラメーターの表示を切り替えて描画
+        self.on_pattern_type_changed()
+    
+    def on_preset_selected(self, index):
+        if index > 0:
+            self.apply_preset(self.presets[index - 1])
+    
+    def save_preset(self):
+        """表示中のパターンをユーザーのプリセットとして保存"""
+        name, ok = QInputDialog.getText(self, "Save Preset", "Preset name:")
+        if not ok or not name:
+            return
+        preset = moire_presets.make_preset(name, self.pattern_type_combo.currentText(),
+                                           self.current_params())
+        try:
+            moire_presets.save_user_preset(preset)
+        except (OSError, ValueError) as e:
+            print(f"Could not save preset: {e}")
+            return
+        names = [old["name"] for old in self.presets]
+        if name in names:
+            self.presets[names.index(name)] = preset
+        else:
+            self.presets.append(preset)
+            self.preset_combo.addItem(name)
+        # 1枚だけなのでサムネイルはその場で描画する
+        size = moire_presets.THUMBNAIL_SIZE
+        self.set_preset_icon(name, moire_engine.render(preset["pattern_type"], size, size,
+                                                       moire_presets.preset_params(preset)))
+        self.preset_combo.setCurrentText(name)
+        print(f"Saved preset {name} to {moire_presets.USER_PRESETS_PATH}")
+    
+    def set_preset_icon(self, name, gray):
+        """プリセット選択の項目にサムネイルのアイコンを付ける"""
+        index = self.preset_combo.findText(name)
+        if index < 0:
+            return
+        height, width = gray.shape
+        argb = moire_engine.gray_to_argb(gray)
+        # argb が解放されても残るよう QImage はコピーする
+        image = QImage(argb.data, width, height, width * 4, QImage.Format_RGB32).copy()
+        self.preset_combo.setItemIcon(index, QIcon(QPixmap.fromImage(image)))
+    
+    def on_thumbnail_tick(self):
+        """バックグラウンドで描画が終わったサムネイルをアイコンにする"""
+        for name, gray in self.thumbnails.poll():
+            self.set_preset_icon(name, gray)
+        if self.thumbnails.idle():
+            self.thumbnail_timer.stop()
+    
+    def preset_control_params(self, preset):
+        """プリセットを適用したときにスライダーから得られるパラメータ（値の丸めも同じ）"""
+        values = self.preset_slider_values(preset)
+        return moire_engine.make_params(**{name: values[slider] / divisor
+                                           for slider, (name, divisor) in self.scrub_sliders.items()})
+    
+    def start_prewarm(self):
+        """アイドル時に、まだキャッシュにないプリセットの最初のフレームをバックグラウンドで描画
+        
+        スライダーや表示は触らず、プリセットのパラメータを直接渡して CPU のバックエンドで
+        描画する。キャッシュへの保存は届いた順に on_prewarm_tick で行う。
+        """
+        # 再生中やパン・ズーム中は表示中の描画を優先し、GPU描画の表示とは一致しないので行わない
+        if self.view is not None or self.archive is not None or self.playing() or self.use_gpu:
+            return
+        resolution_x, resolution_y = self.render_resolution()
+        backend = self.cpu_backend
+        for preset in self.presets:
+            params = self.preset_control_params(preset)
+            key = self.frame_key(resolution_x, resolution_y, preset["pattern_type"], params)
+            if key in self.frame_cache.memory:
+                continue
+            self.prewarm.submit(key, moire_backends.render_gray, backend,
+                                preset["pattern_type"], resolution_x, resolution_y, params,
+                                self.precision, self.trig_modes[backend])
+        if not self.prewarm.idle():
+            self.prewarm_poll_timer.start(moire_presets.PREWARM_POLL_MS)
+    
+    def on_prewarm_tick(self):
+        """描画が終わったプリセットの8bit画像をキャッシュに入れる"""
+        for key, gray in self.prewarm.poll():
+            self.frame_cache.put(key, gray)
+        if self.prewarm.idle():
+            self.prewarm_poll_timer.stop()
+    
+    def shutdown(self):
+        """ウィンドウを閉じるときにスレッド・プロセス・共有メモリなどを片付ける"""
+        for timer in (self.animation_timer, self.archive_timer, self.key_timer,
+                      self.thumbnail_timer, self.prewarm_timer, self.prewarm_poll_timer):
+            timer.stop()
+        if self.archive is not None:
+            self.read_ahead.close()
+            self.archive.close()
+            self.archive = None
+            self.read_ahead = None
+        if self.streamer is not None:
+            self.streamer.close()
+            self.streamer = None
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+            self.frame_ring = None
+        self.prefetcher.close()
+        self.prewarm.close()
+        self.thumbnails.close()
+        # 書きかけのディスクキャッシュの書き込みを待つ
+        self.frame_cache.close()
+    
+    def on_disk_cache_toggled(self, checked):
+        """フレームキャッシュのディスクストアの有効・無効"""
+        self.frame_cache.cache_dir = moire_cache.DEFAULT_CACHE_DIR if checked else None
+    
+    def publish_frame(self):
+        """表示中の画像を配信・共有メモリへ公開（どちらも使っていなければ何もしない）"""
+        streaming = self.streamer is not None and self.streamer.active()
+        if not streaming and self.frame_ring is None:
+            return
+        frame = self.displayed_frame()
+        if frame is None:
+            return
+        frame = frame.view(np.uint32).reshape(frame.shape[:2])
+        if streaming:
+            self.streamer.publish(frame)
+        if self.frame_ring is not None:
+            try:
+                self.frame_ring.publish(frame)
+            except ValueError as e:
+                print(f"Shared memory: {e}")
+    
+    def current_backend(self):
+        """現在使用中のバックエンド名"""
+        if self.use_gpu and self.gpu_backend is not None:
+            return self.gpu_backend
+        return self.cpu_backend
+        
+    def gpu_status(self):
+        """GPU状態ラベルの文字列と色"""
+        if not self.use_gpu:
+            return "GPU: Disabled", "red"
+        colors = {"OpenCL": "green", "CuPy": "blue", "Numba": "purple"}
+        if self.gpu_backend is None:
+            return "GPU: None", "red"
+        return f"GPU: {self.gpu_backend}", colors[self.gpu_backend]
+        
+    def sync_backend_controls(self):
+        """バックエンド選択と高速三角関数の表示を現在の状態に合わせる"""
+        backend = self.current_backend()
+        for widget in (self.backend_combo, self.fast_trig_checkbox):
+            widget.blockSignals(True)
+        self.backend_combo.setCurrentText(backend)
+        self.fast_trig_checkbox.setEnabled(backend in moire_backends.FAST_TRIG_BACKENDS)
+        self.fast_trig_checkbox.setChecked(self.trig_modes[backend] == "fast")
+        for widget in (self.backend_combo, self.fast_trig_checkbox):
+            widget.blockSignals(False)
+        
+    def on_backend_changed(self, backend):
+        """バックエンド選択時の処理（GPU系ならGPUモード、それ以外はCPUモード）"""
+        if backend in moire_backends.GPU_BACKENDS:
+            self.gpu_backend = backend
+            self.use_gpu = True
+        else:
+            self.cpu_backend = backend
+            self.use_gpu = False
+        gpu_text, gpu_color = self.gpu_status()
+        self.gpu_label.setText(gpu_text)
+        self.gpu_label.setStyleSheet(f"color: {gpu_color}; font-weight: bold;")
+        self.gpu_toggle_button.setText("Switch to CPU" if self.use_gpu else "Switch to GPU")
+        self.sync_backend_controls()
+        self.create_pattern()
+        
+    def on_fast_trig_toggled(self, checked):
+        """高速三角関数の切り替え（現在のバックエンドのみ）"""
+        self.trig_modes[self.current_backend()] = "fast" if checked else "exact"
+        self.create_pattern()
+        
+    def on_precision_changed(self, precision):
+        """計算精度変更時の処理"""
+        self.precision = precision
+        self.create_pattern()
+        
     def toggle_gpu_mode(self):
         """GPU/CPUモードを切り替え"""
         self.use_gpu = not self.use_gpu
-        if self.use_gpu:
-            # 利用可能なGPU技術を表示
-            if OPENCL_AVAILABLE:
-                gpu_text = "GPU: OpenCL"
-                gpu_color = "green"
-            elif CUPY_AVAILABLE:
-                gpu_text = "GPU: CuPy"
-                gpu_color = "blue"
-            elif NUMBA_AVAILABLE:
-                gpu_text = "GPU: Numba"
-                gpu_color = "purple"
-            else:
-                gpu_text = "GPU: None"
-                gpu_color = "red"
-            
-            self.gpu_label.setText(gpu_text)
-            self.gpu_label.setStyleSheet(f"color: {gpu_color}; font-weight: bold;")
-            self.gpu_toggle_button.setText("Switch to CPU")
-        else:
-            self.gpu_label.setText("GPU: Disabled")
-            self.gpu_label.setStyleSheet("color: red; font-weight: bold;")
-            self.gpu_toggle_button.setText("Switch to GPU")
+        gpu_text, gpu_color = self.gpu_status()
+        self.gpu_label.setText(gpu_text)
+        self.gpu_label.setStyleSheet(f"color: {gpu_color}; font-weight: bold;")
+        self.gpu_toggle_button.setText("Switch to CPU" if self.use_gpu else "Switch to GPU")
+        
+        # 切り替え先バックエンドの設定を反映
+        self.sync_backend_controls()
         
         # パターンを再生成
         self.create_pattern()
@@ -816,10 +1336,17 @@ class MoirePatternWidget(QWidget):
         info_text += f"Angle2: {self.angle2_slider.value():.1f}°\n"
         info_text += f"Phase1: {self.phase1_slider.value() / 100.0:.2f}\n"
         info_text += f"Phase2: {self.phase2_slider.value() / 100.0:.2f}"
+        if self.view is not None:
+            zoom = moire_viewport.view_zoom(self.view, self.pattern_type_combo.currentText(),
+                                            self.display_label.width(), self.display_label.height())
+            info_text += f"\nZoom: x{zoom:.2f} (double-click to reset)"
+        info_text += f"\n{self.frame_cache.summary()}"
+        info_text += f"\n{self.prefetcher.summary()}"
         self.info_label.setText(info_text)
     
     def reset(self):
         print("Resetting parameters to default values...")
+        self.view = None
         self.freq1_slider.setValue(80)
         self.freq2_slider.setValue(90)
         self.angle1_slider.setValue(0)
@@ -872,6 +1399,10 @@ class MainWindow(QMainWindow):
         
         self.moire_widget = MoirePatternWidget()
         self.setCentralWidget(self.moire_widget)
+    
+    def closeEvent(self, event):
+        self.moire_widget.shutdown()
+        super().closeEvent(event)
 
 def main():
     print("=== Application Starting ===")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Moire Shared-Memory Reader
+共有メモリのフレームリング（moire_shm.py）の参照実装の読み出し側
+
+    python moire.py stream --shm moire_frames --no-socket &
+    python shm_reader_moire.py --name moire_frames --frames 300
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import moire_shm
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read frames from a moire shared-memory ring")
+    parser.add_argument("--name", default=moire_shm.DEFAULT_RING_NAME)
+    parser.add_argument("--frames", type=int, default=300, help="stop after this many frames")
+    parser.add_argument("--timeout", type=float, default=5.0,
+                        help="give up when no new frame arrives for this many seconds")
+    parser.add_argument("--save", help="save the last frame as .npy")
+    args = parser.parse_args()
+
+    reader = moire_shm.FrameRingReader(args.name)
+    print(f"Attached to {args.name} ({reader.slots} slots of {reader.slot_bytes} bytes)")
+    received = skipped = overwritten = 0
+    latencies = []
+    last_seq = reader.latest_seq()
+    last = None
+    try:
+        while received < args.frames:
+            result = reader.wait(last_seq, timeout=args.timeout)
+            if result is None:
+                print("No new frame, stopping")
+                break
+            header, frame = result
+            latencies.append(time.time() - header["timestamp"])
+            # ここで frame をコピーせずに使う（例として平均輝度を計算）
+            mean = float(frame.mean()) if header["format"] == "gray" else \
+                float((frame & 0xFF).mean())
+            if not reader.still_valid(header):
+                # 使っている間に上書きされた（読み出しが slots - 1 フレーム以上遅れた）
+                overwritten += 1
+                continue
+            if last_seq and header["seq"] > last_seq + 1:
+                skipped += header["seq"] - last_seq - 1
+            last_seq = header["seq"]
+            received += 1
+            if args.save:
+                last = frame.copy()
+            if received % 60 == 0:
+                print(f"seq {header['seq']}: {header['width']}x{header['height']} "
+                      f"{header['format']}, mean {mean:.1f}")
+    finally:
+        reader.close()
+
+    if latencies:
+        print(f"Received {received} frames, skipped {skipped}, overwritten while reading "
+              f"{overwritten}; latency mean {np.mean(latencies) * 1000:.2f} ms, "
+              f"max {np.max(latencies) * 1000:.2f} ms")
+    if args.save and last is not None:
+        np.save(args.save, last)
+        print(f"Saved {args.save}")
+
+
+if __name__ == "__main__":
+    main()
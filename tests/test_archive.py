@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+import moire_animation
+import moire_archive
+import moire_engine
+import moire_export
+
+WIDTH, HEIGHT = 24, 16
+
+
+def make_frames(count):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (count, HEIGHT, WIDTH), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("chunk_frames", [0, 3], ids=["raw", "compressed"])
+@pytest.mark.parametrize("fmt", list(moire_archive.ARCHIVE_FORMATS))
+def test_archive_round_trip(tmp_path, fmt, chunk_frames):
+    """書いたフレームとメタデータがそのまま読み出せる（端数のチャンクも含む）"""
+    path = str(tmp_path / "frames.mfa")
+    frames = make_frames(7)
+    writer = moire_archive.ArchiveWriter(path, WIDTH, HEIGHT, fps=24.0, fmt=fmt,
+                                         chunk_frames=chunk_frames, metadata={"pattern": "Wave"})
+    for index, frame in enumerate(frames):
+        writer.write(index, frame)
+    writer.close()
+    assert not os.path.exists(path + ".tmp")
+
+    archive = moire_archive.FrameArchive(path)
+    expected = frames if fmt == "gray" else moire_engine.gray_to_argb(frames)
+    assert (len(archive), archive.fps, archive.metadata) == (7, 24.0, {"pattern": "Wave"})
+    for index in (6, 0, 4, 3):
+        np.testing.assert_array_equal(archive.frame(index), expected[index])
+    archive.close()
+
+
+def test_archive_writer_abort_keeps_existing_file(tmp_path):
+    """abort は書きかけを消し、出力先の既存のアーカイブには触れない"""
+    path = str(tmp_path / "frames.mfa")
+    with open(path, "wb") as f:
+        f.write(b"previous")
+    writer = moire_archive.ArchiveWriter(path, WIDTH, HEIGHT)
+    writer.write(0, make_frames(1)[0])
+    writer.abort()
+    assert not os.path.exists(path + ".tmp")
+    with open(path, "rb") as f:
+        assert f.read() == b"previous"
+
+
+def interrupted_frames(count):
+    """count 枚返したあと中断されるフレームの列"""
+    def iter_frames(*args, **kwargs):
+        yield from make_frames(count)
+        raise KeyboardInterrupt
+    return iter_frames
+
+
+def test_interrupted_export_leaves_no_archive(tmp_path, monkeypatch):
+    """書き出しが途中で止まっても、途中までのフレームのアーカイブを完成させない"""
+    monkeypatch.setattr(moire_animation, "iter_frames", interrupted_frames(5))
+    path = str(tmp_path / "int.mfa")
+    with pytest.raises(KeyboardInterrupt):
+        moire_export.export_animation("Standard", WIDTH, HEIGHT, moire_engine.make_params(), 50,
+                                      path)
+    assert os.listdir(tmp_path) == []
+
+
+def test_interrupted_sequence_export_removes_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(moire_animation, "iter_frames", interrupted_frames(5))
+    output = str(tmp_path / "frames")
+    with pytest.raises(KeyboardInterrupt):
+        moire_export.export_animation("Standard", WIDTH, HEIGHT, moire_engine.make_params(), 50,
+                                      output, encoder="pgm")
+    assert os.listdir(output) == []
+
+
+@pytest.mark.skipif(moire_export.find_ffmpeg() is None, reason="ffmpeg is not installed")
+def test_interrupted_video_export_leaves_no_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(moire_animation, "iter_frames", interrupted_frames(5))
+    with pytest.raises(KeyboardInterrupt):
+        moire_export.export_animation("Standard", WIDTH, HEIGHT, moire_engine.make_params(), 50,
+                                      str(tmp_path / "int.mp4"), encoder="ffmpeg")
+    assert os.listdir(tmp_path) == []
+
+
+def test_export_writes_complete_archive(tmp_path):
+    path = str(tmp_path / "anim.mfa")
+    params = moire_engine.make_params()
+    stats = moire_export.export_animation("Standard", WIDTH, HEIGHT, params, 6, path)
+    archive = moire_archive.FrameArchive(path)
+    assert stats["frames"] == len(archive) == 6
+    assert archive.metadata["pattern_type"] == "Standard"
+    archive.close()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import moire_backends
+import moire_engine
+
+# GPUなしで動くバックエンド（ライブラリがなければ skip）
+CPU_BACKENDS = ["CPU", "NumExpr", "Numba"]
+
+# 比較に使う解像度
+CHECK_WIDTH, CHECK_HEIGHT = 257, 193
+
+# 既定値に加えて、範囲縮小が効く高周波・大きな位相の組み合わせ
+CHECK_PARAMS = [
+    moire_engine.make_params(),
+    moire_engine.make_params(freq1=29.7, freq2=27.3, angle1=13.0, angle2=71.0,
+                             phase1=5.9, phase2=3.1, center_x=0.4, center_y=-0.7),
+]
+
+
+def supports(backend, pattern_type):
+    """バックエンドがパターンを描画できるか（GPU系は線形格子のみ）"""
+    if backend in moire_backends.GPU_BACKENDS:
+        return moire_engine.get_pattern_function(pattern_type) is moire_engine.standard_pattern
+    return True
+
+
+def backend_cases():
+    cases = []
+    for backend in CPU_BACKENDS:
+        for pattern_type in moire_engine.PATTERN_TEMPORARIES:
+            marks = []
+            if not moire_backends.is_available(backend):
+                marks.append(pytest.mark.skip(reason=f"{backend} is not installed"))
+            elif not supports(backend, pattern_type):
+                marks.append(pytest.mark.skip(reason=f"{backend} does not draw {pattern_type}"))
+            cases.append(pytest.param(backend, pattern_type, marks=marks,
+                                      id=f"{backend}-{pattern_type}"))
+    return cases
+
+
+def max_difference(a, b):
+    return int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max())
+
+
+@pytest.mark.parametrize("params", CHECK_PARAMS, ids=["default", "high_freq"])
+@pytest.mark.parametrize("backend,pattern_type", backend_cases())
+def test_float32_within_one_lsb(backend, pattern_type, params):
+    """float32 の8bit出力が float64 と1階調以内"""
+    expected = moire_engine.render(pattern_type, CHECK_WIDTH, CHECK_HEIGHT, params,
+                                   precision="float64")
+    gray = moire_backends.render_gray(backend, pattern_type, CHECK_WIDTH, CHECK_HEIGHT, params,
+                                      precision="float32")
+    assert gray.dtype == np.uint8
+    assert max_difference(gray, expected) <= 1
+
+
+def fast_trig_cases():
+    return [case for case in backend_cases()
+            if case.values[0] in moire_backends.FAST_TRIG_BACKENDS]
+
+
+@pytest.mark.parametrize("precision", list(moire_engine.PRECISIONS))
+@pytest.mark.parametrize("params", CHECK_PARAMS, ids=["default", "high_freq"])
+@pytest.mark.parametrize("backend,pattern_type", fast_trig_cases())
+def test_fast_trig_within_one_lsb(backend, pattern_type, params, precision):
+    """trig="fast" の8bit出力が同じ精度の trig="exact" と1階調以内"""
+    exact = moire_backends.render_gray(backend, pattern_type, CHECK_WIDTH, CHECK_HEIGHT, params,
+                                       precision=precision, trig="exact")
+    fast = moire_backends.render_gray(backend, pattern_type, CHECK_WIDTH, CHECK_HEIGHT, params,
+                                      precision=precision, trig="fast")
+    assert max_difference(fast, exact) <= 1
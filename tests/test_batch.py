@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+
+import moire_archive
+import moire_batch
+import moire_engine
+
+
+def write_manifest(directory, jobs, defaults=None):
+    path = str(directory / "jobs.json")
+    with open(path, "w") as f:
+        json.dump({"defaults": defaults or {"size": "32x24"}, "jobs": jobs}, f)
+    return path
+
+
+def statuses(report):
+    return {entry["name"]: entry["status"] for entry in report["jobs"]}
+
+
+JOBS = [
+    {"name": "wave", "pattern": "Wave", "params": {"freq1": 6.0}, "output": "stills/wave.npy"},
+    {"name": "rings", "pattern": "Tree Rings", "output": "stills/rings.pgm"},
+    {"name": "clip", "frames": 3, "output": "clips/standard.mfa"},
+]
+
+
+def test_run_manifest_renders_then_skips(tmp_path):
+    """2回目は出力があり設定が同じジョブを飛ばし、変わったものだけ描画し直す"""
+    path = write_manifest(tmp_path, JOBS)
+    report = moire_batch.run_manifest(path, workers=1)
+    assert statuses(report) == {"wave": "rendered", "rings": "rendered", "clip": "rendered"}
+    assert report["counts"] == {"rendered": 3, "skipped": 0, "failed": 0}
+
+    image = np.load(tmp_path / "stills" / "wave.npy")
+    expected = moire_engine.render("Wave", 32, 24, moire_engine.make_params(freq1=6.0))
+    np.testing.assert_array_equal(image, expected)
+    archive = moire_archive.FrameArchive(str(tmp_path / "clips" / "standard.mfa"))
+    assert len(archive) == 3
+    archive.close()
+
+    assert statuses(moire_batch.run_manifest(path, workers=1)) == {
+        "wave": "skipped", "rings": "skipped", "clip": "skipped"}
+
+    # 設定を変えたジョブと、出力を消したジョブだけ描画し直す
+    changed = [dict(JOBS[0], params={"freq1": 7.0})] + JOBS[1:]
+    path = write_manifest(tmp_path, changed)
+    os.remove(tmp_path / "stills" / "rings.pgm")
+    assert statuses(moire_batch.run_manifest(path, workers=1)) == {
+        "wave": "rendered", "rings": "rendered", "clip": "skipped"}
+
+    assert set(statuses(moire_batch.run_manifest(path, workers=1, force=True)).values()) == {
+        "rendered"}
+
+
+def test_run_manifest_resumes_after_failure(tmp_path):
+    """失敗したジョブは記録されず、次の実行で続きから描画する"""
+    (tmp_path / "blocked").write_text("not a directory")
+    jobs = [{"name": "ok", "output": "ok.png"},
+            {"name": "bad", "output": "blocked/bad.png"}]
+    path = write_manifest(tmp_path, jobs)
+    report = moire_batch.run_manifest(path, workers=1)
+    assert statuses(report) == {"ok": "rendered", "bad": "failed"}
+    assert "error" in report["jobs"][1]
+    assert list(moire_batch.load_state(path)) == [str(tmp_path / "ok.png")]
+
+    os.remove(tmp_path / "blocked")
+    assert statuses(moire_batch.run_manifest(path, workers=1)) == {"ok": "skipped",
+                                                                   "bad": "rendered"}
+    with open(path + moire_batch.REPORT_SUFFIX) as f:
+        assert json.load(f)["counts"] == {"rendered": 1, "skipped": 1, "failed": 0}
+
+
+def test_load_manifest_toml_and_defaults(tmp_path):
+    path = tmp_path / "jobs.toml"
+    path.write_text('[defaults]\nsize = "64x48"\nprecision = "float32"\n\n'
+                    '[[jobs]]\npattern = "Wave"\noutput = "a.png"\n\n'
+                    '[[jobs]]\nsize = 20\noutput = "b.png"\n')
+    first, second = moire_batch.load_manifest(str(path))
+    assert (first["size"], first["precision"], first["name"]) == ([64, 48], "float32", "a.png")
+    assert (second["size"], second["pattern"]) == ([20, 20], "Standard")
+    assert first["output"] == str(tmp_path / "a.png")
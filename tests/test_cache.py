@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+import moire_cache
+import moire_engine
+
+
+def frame(value, shape=(10, 10)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_frame_key_ignores_rounding_and_unused_params():
+    """量子化の刻みより小さい差と、パターンに影響しないパラメータはキーを変えない"""
+    params = moire_engine.make_params(freq1=8.3)
+    key = moire_cache.frame_key("Standard", 64, 48, params)
+    assert moire_cache.frame_key("Standard", 64, 48, dict(params, freq1=8.3 + 1e-9)) == key
+    assert moire_cache.frame_key("Standard", 64, 48, dict(params, wave_complexity=0.9)) == key
+    assert moire_cache.frame_key("Standard", 64, 48, dict(params, freq1=8.4)) != key
+    assert moire_cache.frame_key("Standard", 64, 49, params) != key
+
+
+def test_memory_lru_evicts_by_bytes():
+    """合計バイト数が上限を超えたら最近使っていないものから捨てる"""
+    cache = moire_cache.FrameCache(memory_bytes=300)
+    for key in "abc":
+        cache.put(key, frame(ord(key)))
+    assert cache.cached_bytes == 300
+    cache.get("a")
+    cache.put("d", frame(4))
+    assert list(cache.memory) == ["c", "a", "d"]
+    assert cache.cached_bytes == 300
+
+    # 同じキーの置き換えは二重に数えない
+    cache.put("d", frame(5))
+    assert cache.cached_bytes == 300
+    np.testing.assert_array_equal(cache.get("d"), frame(5))
+
+    # 上限より大きいフレームは入れない（他のものも追い出さない）
+    cache.put("big", frame(0, (20, 20)))
+    assert "big" not in cache.memory and len(cache.memory) == 3
+    assert cache.cached_bytes == sum(f.nbytes for f in cache.memory.values())
+    cache.close()
+
+
+def test_put_copies_and_freezes():
+    cache = moire_cache.FrameCache()
+    original = frame(7)
+    cache.put("k", original)
+    original[:] = 0
+    cached = cache.get("k")
+    assert cached[0, 0] == 7
+    assert not cached.flags.writeable
+    cache.close()
+
+
+def test_disk_round_trip(tmp_path):
+    """ディスクに書いたフレームを別のキャッシュ（次の起動）から読み込める"""
+    gray = np.arange(60, dtype=np.uint8).reshape(6, 10)
+    argb = np.arange(240, dtype=np.uint8).reshape(6, 10, 4)
+    cache = moire_cache.FrameCache(cache_dir=str(tmp_path))
+    cache.put("gray", gray)
+    cache.put("argb", argb)
+    cache.close()
+
+    cache = moire_cache.FrameCache(cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(cache.get("gray"), gray)
+    np.testing.assert_array_equal(cache.get("argb"), argb)
+    assert cache.stats == {"memory_hits": 0, "disk_hits": 2, "misses": 0}
+    assert cache.get("gray") is not None
+    assert cache.stats["memory_hits"] == 1
+    cache.close()
+
+
+def test_corrupt_disk_frame_is_a_miss(tmp_path):
+    cache = moire_cache.FrameCache(cache_dir=str(tmp_path))
+    path = cache._disk_path("broken")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(moire_cache.encode_frame(frame(1))[:-4])
+    assert cache.get("broken") is None
+    assert cache.stats["misses"] == 1
+    cache.close()
+
+
+def test_prune_disk_removes_least_recently_used(tmp_path):
+    """ディスクの使用量を上限の 3/4 以下まで、更新時刻の古い順に減らす"""
+    cache = moire_cache.FrameCache(cache_dir=str(tmp_path))
+    for number in range(8):
+        cache.put(f"key{number}", np.random.default_rng(number).integers(
+            0, 256, (32, 32), dtype=np.uint8))
+    cache.close()
+    entries = {os.path.basename(path): size for _, size, path in cache._disk_entries()}
+    for number in range(8):
+        os.utime(cache._disk_path(f"key{number}"), (1000 + number, 1000 + number))
+
+    # 4ファイル分を上限にすると 3/4 以下の3ファイルまで減らす
+    size = max(entries.values())
+    cache.disk_bytes = 4 * size
+    cache.prune_disk()
+    kept = sorted(os.path.basename(path) for _, _, path in cache._disk_entries())
+    assert kept == [f"key{number}.frame" for number in range(5, 8)]
+    assert cache.disk_used == sum(entries[name] for name in kept) <= 3 * size
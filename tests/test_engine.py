@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import moire_engine
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 出力に比べて作業領域を十分小さくし、一括描画なら上限を大きく超える大きさにする
+STRIP_WIDTH, STRIP_HEIGHT = 1024, 768
+STRIP_SCRATCH_BYTES = 1024 * 1024
+
+# 別プロセスで render_strips だけを tracemalloc で計測する（import 時の確保は含めない）
+STRIP_SCRIPT = """
+import hashlib, json, sys, tracemalloc
+import moire_engine
+pattern_type, width, height, scratch = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+params = moire_engine.make_params(angle1=10.0)
+tracemalloc.start()
+out = moire_engine.render_strips(pattern_type, width, height, params, scratch_bytes=scratch)
+peak = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+print(json.dumps({"peak": peak, "nbytes": out.nbytes,
+                  "sha256": hashlib.sha256(out.tobytes()).hexdigest()}))
+"""
+
+
+def run_strips(pattern_type):
+    result = subprocess.run(
+        [sys.executable, "-c", STRIP_SCRIPT, pattern_type, str(STRIP_WIDTH), str(STRIP_HEIGHT),
+         str(STRIP_SCRATCH_BYTES)],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize("pattern_type", list(moire_engine.PATTERN_TEMPORARIES))
+def test_render_strips_peak_memory(pattern_type):
+    """ピークメモリが出力サイズ + scratch_bytes 以下"""
+    stats = run_strips(pattern_type)
+    assert stats["peak"] <= stats["nbytes"] + STRIP_SCRATCH_BYTES
+
+
+def test_render_strips_matches_render():
+    """大きな Wave のフレームがストリップ描画でも一括描画とバイト単位で一致する"""
+    stats = run_strips("Wave")
+    params = moire_engine.make_params(angle1=10.0)
+    expected = moire_engine.render("Wave", STRIP_WIDTH, STRIP_HEIGHT, params)
+    assert stats["sha256"] == hashlib.sha256(expected.tobytes()).hexdigest()
+
+
+@pytest.mark.parametrize("pattern_type", list(moire_engine.PATTERN_TEMPORARIES))
+def test_render_strips_matches_render_small(pattern_type):
+    """作業領域が1行分に満たなくても一括描画と一致する"""
+    params = moire_engine.make_params(angle1=10.0)
+    expected = moire_engine.render(pattern_type, 120, 90, params)
+    out = moire_engine.render_strips(pattern_type, 120, 90, params, scratch_bytes=1)
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize("freq,phase", [(1.0, 0.0), (1.0, -2.5), (7.3, 40.0), (29.7, -100.0)])
+def test_fast_sin_error_float64(freq, phase):
+    """正弦テーブルの誤差が大きな引数・負の引数でも FAST_TRIG_MAX_ERROR 以下"""
+    # 周期の整数倍に揃わないよう 1/3 ずらした ±100万周期の密な格子
+    u = np.linspace(-1e6, 1e6, 2_000_003) + 1.0 / 3.0
+    fast = moire_engine.sin2pi(freq, u, phase, trig="fast")
+    error = np.abs(fast - np.sin(2 * np.pi * freq * u + phase)).max()
+    assert error <= moire_engine.FAST_TRIG_MAX_ERROR
+
+
+@pytest.mark.parametrize("freq,phase", [(1.0, 0.0), (1.0, -2.5), (7.3, 40.0), (29.7, -100.0)])
+def test_fast_sin_error_float32(freq, phase):
+    """float32 でも np.sin（同じ範囲縮小をした exact）との差が FAST_TRIG_MAX_ERROR 以下
+
+    float32 の freq * u 自体の丸め誤差は exact と共通なので、float64 の真値とは比べない。
+    """
+    u = (np.linspace(-1e5, 1e5, 2_000_003) + 1.0 / 3.0).astype(np.float32)
+    fast = moire_engine.sin2pi(freq, u, phase, trig="fast")
+    exact = moire_engine.sin2pi(freq, u, phase, trig="exact")
+    assert fast.dtype == np.float32
+    assert np.abs(fast.astype(np.float64) - exact).max() <= moire_engine.FAST_TRIG_MAX_ERROR
+
+
+def test_sine_table_matches_sin():
+    """テーブルの各要素が np.sin と一致し、書き換えられない"""
+    table = moire_engine.sine_table()
+    k = np.arange(moire_engine.SINE_TABLE_SIZE)
+    np.testing.assert_allclose(table, np.sin(2 * np.pi * k / moire_engine.SINE_TABLE_SIZE),
+                               atol=1e-15)
+    assert not table.flags.writeable
+
+
+@pytest.mark.parametrize("pattern_type", list(moire_engine.CENTERED_PATTERNS))
+def test_center_field_slice_matches_snapped_render(pattern_type):
+    """中心を丸めた通常の計算と、場から切り出した画像の中心が一致する（跳ばない）"""
+    size, margin = 120, 60
+    base = moire_engine.make_params(center_x=0.37, center_y=-0.21)
+    moved = moire_engine.make_params(center_x=1.13, center_y=0.52)
+    field = moire_engine.calculate_center_field(pattern_type, size, size, base, margin)
+
+    def pixels(p):
+        return moire_engine.center_pixels(pattern_type, size, size, p["center_x"], p["center_y"])
+
+    for params in (base, moved):
+        view = moire_engine.slice_center_field(field, margin, pixels(base), pixels(params),
+                                               size, size)
+        snapped = moire_engine.snap_center(pattern_type, size, size, params)
+        expected = moire_engine.calculate_pattern(pattern_type, size, size, snapped)
+        np.testing.assert_allclose(view, expected, atol=1e-9)
@@ -0,0 +1,61 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import moire_engine
+import moire_prefetch
+
+
+class HeldExecutor:
+    """投入された描画を開始しない（取り消しは必ず成功する）プール"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append(args)
+        return Future()
+
+
+def test_predict_values_follows_direction():
+    """ドラッグの向きに移動量ずつ、範囲内の値だけを予測する"""
+    assert moire_prefetch.predict_values(10, 2, 40.0, 0, 100) == [12, 14, 16, 18, 20, 22]
+    assert moire_prefetch.predict_values(3, -1, 10.0, 0, 100) == [2, 1, 0]
+    assert moire_prefetch.predict_values(10, 0, 40.0, 0, 100) == []
+
+
+def test_reschedule_does_not_submit_stale_predictions():
+    """向きが変わったとき、取り消しで空いたワーカーに古い予測が投入されない"""
+    prefetcher = moire_prefetch.ScrubPrefetcher(workers=2)
+    executor = prefetcher.executor = HeldExecutor()
+    prefetcher._schedule({key: (key,) for key in ["a", "b", "c", "d"]})
+    assert set(prefetcher.pending) == {"a", "b"}
+
+    prefetcher._schedule({key: (key,) for key in ["x", "y"]})
+    assert set(prefetcher.pending) == {"x", "y"}
+    assert not prefetcher.queued
+    assert [args[0] for args in executor.submitted] == ["a", "b", "x", "y"]
+
+
+def test_pool_renders_without_forking_from_threads():
+    """プールは fork 以外で起動し（GUI のスレッドを引き継がない）、予測を描画して保存する"""
+    prefetcher = moire_prefetch.ScrubPrefetcher(workers=1)
+    params = moire_engine.make_params()
+    args = ("Wave", 16, 12, params, moire_engine.DEFAULT_PRECISION, moire_engine.DEFAULT_TRIG)
+    # fork を避ける理由になる、動いたままの別スレッド
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        prefetcher._schedule({"wave": args})
+        assert prefetcher.executor._mp_context.get_start_method() != "fork"
+        deadline = time.monotonic() + 30
+        while prefetcher.get("wave") is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        np.testing.assert_array_equal(prefetcher.get("wave"), moire_engine.render(*args[:4]))
+    finally:
+        stop.set()
+        thread.join()
+        prefetcher.close()
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import numpy as np
+
+import moire_engine
+import moire_presets
+
+
+def wait_idle(renderer, timeout=10.0):
+    """renderer の描画が全て終わるまで poll し、届いた結果を返す"""
+    results = []
+    deadline = time.monotonic() + timeout
+    while not renderer.idle():
+        assert time.monotonic() < deadline
+        results += renderer.poll()
+        time.sleep(0.005)
+    return results + renderer.poll()
+
+
+def test_user_presets_override_builtin(tmp_path):
+    """ユーザーのプリセットは同じ名前の組み込みのものを置き換え、新しいものは後ろに足す"""
+    user_path = str(tmp_path / "config" / "presets.json")
+    moire_presets.save_user_preset(
+        moire_presets.make_preset("Circular", "circular", {"freq1": 7.0}, speed=0.1), user_path)
+    moire_presets.save_user_preset(moire_presets.make_preset("Mine", "Wave", {}), user_path)
+    library = moire_presets.load_library(user_path=user_path)
+    names = [preset["name"] for preset in library]
+    assert names == ["Standard", "Wave", "Tree Rings", "Linear", "Circular", "Spiral", "Mine"]
+    circular = library[names.index("Circular")]
+    assert circular["params"]["freq1"] == 7.0 and circular["speed"] == 0.1
+    assert [preset["name"] for preset in moire_presets.presets_for(library, ["Wave"])] == \
+        ["Wave", "Mine"]
+
+
+def test_thumbnails_render_in_background(tmp_path):
+    """サムネイルはエンジンの描画と一致し、2回目はディスクのキャッシュから読む"""
+    presets = moire_presets.load_library(user_path=str(tmp_path / "none.json"))
+    for run in range(2):
+        renderer = moire_presets.ThumbnailRenderer(presets, size=32, cache_dir=str(tmp_path))
+        thumbnails = dict(wait_idle(renderer))
+        renderer.close()
+        assert set(thumbnails) == {preset["name"] for preset in presets}
+        for preset in presets:
+            expected = moire_engine.render(preset["pattern_type"], 32, 32,
+                                           moire_presets.preset_params(preset))
+            np.testing.assert_array_equal(thumbnails[preset["name"]], expected)
+    assert renderer.cache.stats["disk_hits"] > 0
+
+
+def test_background_renderer_clear_skips_queued_jobs():
+    """clear で始まっていない描画は取り消され、描画中のものは最後まで届く"""
+    renderer = moire_presets.BackgroundRenderer()
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait()
+        return "first"
+
+    renderer.submit(1, blocked)
+    started.wait()
+    renderer.submit(2, lambda: "second")
+    renderer.clear()
+    release.set()
+    assert wait_idle(renderer) == [(1, "first")]
+    renderer.close()
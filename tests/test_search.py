@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import moire_search
+
+
+@pytest.mark.parametrize("dimensions,budget", [(4, 64), (4, 10), (3, 27), (2, 100), (6, 50)])
+def test_grid_uses_whole_budget(dimensions, budget):
+    """格子は budget 点ちょうどで、各軸は budget の D 乗根以上に分割される"""
+    rng = np.random.default_rng(0)
+    grid = np.concatenate(list(moire_search.grid_candidates(dimensions, budget, 16, rng)))
+    assert grid.shape == (budget, dimensions)
+    assert len(np.unique(grid, axis=0)) == budget
+    assert len(np.unique(grid[:, 0])) >= max(2, int(budget ** (1.0 / dimensions)))
+
+
+def run_cmaes(score, dimensions=3, budget=400, batch=8, seed=0):
+    """score(候補の配列) を最大化して、生成された全候補を返す"""
+    generator = moire_search.cmaes_candidates(dimensions, budget, batch,
+                                              np.random.default_rng(seed))
+    evaluated = []
+    candidates = next(generator)
+    try:
+        while True:
+            evaluated.append(candidates)
+            candidates = generator.send(score(candidates))
+    except StopIteration:
+        pass
+    return np.concatenate(evaluated)
+
+
+def test_cmaes_stays_in_bounds_and_reaches_corner():
+    """最適点が範囲の角にあっても、範囲内の候補だけで角に近づく"""
+    target = np.array([1.0, 0.0, 1.0])
+    evaluated = run_cmaes(lambda candidates: -np.sum((candidates - target) ** 2, axis=1))
+    assert evaluated.min() >= 0.0 and evaluated.max() <= 1.0
+    assert np.abs(evaluated[-8:] - target).max() < 0.05
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+
+import moire_backends
+import moire_server
+
+# 応答を待つ秒数（サーバーが接続を閉じなくてもテスト全体を止めない）
+RESPONSE_TIMEOUT = 30
+
+
+def request(raw):
+    """サーバーを起動して生の HTTP リクエストを1つ送り (status, JSON 本文) を返す"""
+    async def run():
+        service = moire_server.RenderService(workers=1)
+        server = await asyncio.start_server(
+            lambda reader, writer: moire_server.handle_connection(service, reader, writer),
+            "127.0.0.1", 0)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), RESPONSE_TIMEOUT)
+            lines = head.decode("latin-1").split("\r\n")
+            length = next(int(line.split(":", 1)[1]) for line in lines
+                          if line.lower().startswith("content-length:"))
+            body = await asyncio.wait_for(reader.readexactly(length), RESPONSE_TIMEOUT)
+            # Connection: close なら本文の後に EOF が届く（ワーカーがソケットを握っていない）
+            assert await asyncio.wait_for(reader.read(), RESPONSE_TIMEOUT) == b""
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+        return int(lines[0].split(" ")[1]), json.loads(body)
+    return asyncio.run(run())
+
+
+def post(path, body):
+    return request(f"POST {path} HTTP/1.1\r\nConnection: close\r\n"
+                   f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+
+
+def missing_backend():
+    for backend in moire_backends.BACKEND_MODULES:
+        if not moire_backends.is_available(backend):
+            return backend
+    pytest.skip("all backends are installed")
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'"jobs"', b'{"jobs": {"pattern": "Wave"}}'])
+def test_batch_rejects_non_object_body(body):
+    status, result = post("/batch", body)
+    assert status == 400
+    assert "error" in result
+
+
+def test_render_rejects_missing_backend():
+    backend = missing_backend()
+    status, result = request(f"GET /render?backend={backend}&width=8&height=8 HTTP/1.1\r\n"
+                             "Connection: close\r\n\r\n".encode("latin-1"))
+    assert status == 400
+    assert backend in result["error"]
+
+
+def test_batch_reports_each_job():
+    """不正なジョブは個別に 400 になり、他のジョブは描画される"""
+    jobs = [{"pattern": "Wave", "width": 8, "height": 8},
+            {"backend": missing_backend()},
+            [1, 2],
+            {"width": [8]}]
+    status, result = post("/batch", json.dumps({"jobs": jobs}).encode("utf-8"))
+    assert status == 200
+    assert [job["status"] for job in result["results"]] == [200, 400, 400, 400]
+
+
+def test_render_job_reports_unavailable_device(monkeypatch):
+    """ライブラリはあるのに実行時に使えないバックエンドは BackendUnavailableError（503）"""
+    def fail(*args):
+        raise RuntimeError("No OpenCL platforms found")
+    monkeypatch.setattr(moire_backends, "render_gray", fail)
+    job = moire_server.parse_job({"width": 8, "height": 8})
+    with pytest.raises(moire_server.BackendUnavailableError):
+        moire_server.render_job(dict(job, backend="OpenCL"))
+    with pytest.raises(RuntimeError):
+        moire_server.render_job(job)
@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+import moire_engine
+import moire_timeline
+
+
+def keys(*items):
+    return [{"frame": frame, "value": value, "easing": easing} for frame, value, easing in items]
+
+
+@pytest.mark.parametrize("easing", list(moire_timeline.EASINGS))
+def test_evaluate_track_easing(easing):
+    """区間の途中はイージングで補間し、キーフレームの位置ではその値になる"""
+    track = keys((10, 2.0, easing), (20, 6.0, "linear"))
+    frames = np.arange(10, 21)
+    t = (frames - 10) / 10.0
+    expected = 2.0 + 4.0 * moire_timeline.EASINGS[easing](t)
+    expected[-1] = 6.0
+    np.testing.assert_allclose(moire_timeline.evaluate_track(track, frames), expected)
+
+
+def test_evaluate_track_boundaries():
+    """最初のキーより前は最初の値、最後のキー以降は最後の値"""
+    track = keys((5, 1.0, "linear"), (15, 3.0, "step"), (25, 7.0, "linear"))
+    values = moire_timeline.evaluate_track(track, [0, 4, 5, 10, 15, 20, 24, 25, 100])
+    np.testing.assert_allclose(values, [1.0, 1.0, 1.0, 2.0, 3.0, 3.0, 3.0, 7.0, 7.0])
+    single = keys((8, 4.5, "ease_in"))
+    np.testing.assert_array_equal(moire_timeline.evaluate_track(single, [0, 8, 50]), 4.5)
+
+
+def test_evaluate_timeline_uses_static_params():
+    timeline = moire_timeline.new_timeline("Wave", moire_engine.make_params(freq2=11.0), 30)
+    moire_timeline.add_keyframe(timeline, "freq1", 0, 4.0, "linear")
+    moire_timeline.add_keyframe(timeline, "freq1", 29, 33.0)
+    values = moire_timeline.evaluate_timeline(timeline)
+    assert values["freq1"][0] == 4.0 and values["freq1"][-1] == 33.0
+    np.testing.assert_array_equal(values["freq2"], 11.0)
+    assert moire_timeline.frame_params(values, 10)["freq1"] == pytest.approx(14.0)
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "keys.json")
+    timeline = moire_timeline.new_timeline("Standard", {}, 120, 30)
+    moire_timeline.add_keyframe(timeline, "angle1", 0, 0.0)
+    moire_timeline.add_keyframe(timeline, "angle1", 60, 90.0, "sine")
+    moire_timeline.save_timeline(timeline, path)
+    assert moire_timeline.load_timeline(path) == timeline
+
+
+@pytest.mark.parametrize("change", [
+    lambda timeline: [1, 2],
+    lambda timeline: dict(timeline, pattern_type=["Wave"]),
+    lambda timeline: dict(timeline, pattern_type="Unknown"),
+    lambda timeline: dict(timeline, frames="300"),
+    lambda timeline: dict(timeline, fps=0),
+    lambda timeline: dict(timeline, params={"freq1": "8"}),
+    lambda timeline: dict(timeline, params={"nope": 1.0}),
+    lambda timeline: dict(timeline, tracks=[]),
+    lambda timeline: dict(timeline, tracks={"freq1": [3]}),
+    lambda timeline: dict(timeline, tracks={"freq1": keys((0, "1", "linear"))}),
+    lambda timeline: dict(timeline, tracks={"freq1": keys((0, 1.0, ["linear"]))}),
+    lambda timeline: dict(timeline, tracks={"freq1": keys((5, 1.0, "linear"),
+                                                         (5, 2.0, "linear"))}),
+    lambda timeline: {key: value for key, value in timeline.items() if key != "tracks"},
+], ids=["list", "pattern_list", "pattern_unknown", "frames_string", "fps_zero", "param_string",
+        "param_unknown", "tracks_list", "key_number", "value_string", "easing_list",
+        "duplicate_frames", "missing_tracks"])
+def test_load_rejects_malformed_timeline(tmp_path, change):
+    """どんな不正な JSON でも ValueError（GUI はそれだけを受け取って表示する）"""
+    path = tmp_path / "bad.json"
+    path.write_text(json.dumps(change(moire_timeline.new_timeline("Wave", {}))))
+    with pytest.raises(ValueError):
+        moire_timeline.load_timeline(str(path))
+
+
+def test_frame_ranges_cover_all_frames():
+    ranges = moire_timeline.frame_ranges(10, 4)
+    assert ranges == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert moire_timeline.frame_ranges(2, 8) == [(0, 1), (1, 2)]